@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends
+
+from api.v1.auth import get_current_user
+from core import metrics
+from services.content_cache import ContentCache
+from services.gemini_cache import GeminiResponseCache
+
+router = APIRouter()
+
+
+@router.get(
+    "",
+    summary="Get Service Metrics",
+    description="Returns operational counters aggregated across all API and worker processes, such as Gemini response cache hits, misses and evictions, per-model Gemini rate limiter waits and 429 responses, Gemini token and latency usage per model and per research phase, model fallbacks after exceeded latency budgets per task, hedged (duplicate) requests with their wins and estimated latency saved, structured (JSON) responses that needed repair or failed validation, per-job Gemini cached contexts created and evicted, and web page content cache hits, 304 revalidations, misses and evictions, source URLs dropped as duplicate URLs or near-duplicate pages, crawl politeness requests, waits and robots.txt refusals with the hosts waited on longest, and page downloads skipped by reason (content type, size, slowness).",
+)
+async def get_metrics(current_user: dict = Depends(get_current_user)):
+    return {
+        "gemini_cache": GeminiResponseCache().stats(),
+        "gemini_rate_limiter": metrics.get_counters("gemini_rate_limiter."),
+        "gemini_usage": metrics.get_counters("gemini_usage."),
+        "gemini_routing": metrics.get_counters("gemini_routing."),
+        "gemini_hedging": metrics.get_counters("gemini_hedging."),
+        "gemini_context_cache": metrics.get_counters("gemini_context_cache."),
+        "gemini_structured_output": metrics.get_counters("gemini_structured_output."),
+        "content_cache": ContentCache().stats(),
+        "content_dedup": metrics.get_counters("content_dedup."),
+        "crawl_scheduler": metrics.get_counters("crawl_scheduler."),
+        "crawl_wait_seconds_by_host": metrics.get_ranking("crawl_wait_seconds"),
+        "content_fetch": metrics.get_counters("content_fetch."),
+    }
@@ -1,19 +1,58 @@
+import csv
+import io
+import json
+import uuid
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from celery.result import AsyncResult
 from celery_app import celery_app
 
-from services.google_drive_service import find_or_create_folder
-from tasks.orchestrator import research_orchestrator_task
+from db.batch_store import (
+    BATCH_MAX_CONCURRENT_JOBS,
+    MAX_BATCH_SIZE,
+    create_batch,
+    get_batch,
+    requeue_batch_job,
+)
+from db.job_store import (
+    FAILURE,
+    SUCCESS,
+    create_job,
+    RESEARCH_PHASES,
+    describe_progress,
+    get_artifact,
+    get_job,
+    get_job_usage,
+    get_jobs,
+    job_events_channel,
+    reset_job,
+)
+from db.redis_client import get_async_redis
 from api.v1.auth import get_current_user
 
 router = APIRouter()
 
+# Tasks are enqueued by name, so the API process does not import the task
+# modules and their worker-only dependencies (genai, trafilatura, ...).
+RESEARCH_ORCHESTRATOR_TASK = "research_orchestrator_task"
+SCHEDULE_BATCH_JOBS_TASK = "schedule_batch_jobs_task"
+
+# Interval between keepalive comments on an idle progress stream.
+SSE_KEEPALIVE_SECONDS = 15
+
+# Job events forwarded to stream clients as 'progress' events.
+PROGRESS_EVENT_TYPES = ("url_progress", "phase_progress")
+
+# First-column values recognised as a CSV header row in batch uploads.
+CSV_HEADER_NAMES = ("company", "company_name", "company name", "account")
+
 
 class ResearchStartRequest(BaseModel):
     company_name: str
     gdrive_folder_name: str
+    force_refresh: bool = False
 
 
 class ResearchStartResponse(BaseModel):
@@ -26,15 +65,59 @@ class ResearchStatusResponse(BaseModel):
     status: str
     progress_message: Optional[str] = None
     current_phase: Optional[str] = None
+    phases: Optional[dict[str, str]] = None
+    # Gemini usage per phase plus a 'total': calls, cached_calls, prompt_tokens,
+    # response_tokens, latency_seconds and hedged_calls.
+    usage: Optional[dict[str, dict[str, float]]] = None
     result_link: Optional[str] = None
     error: Optional[str] = None
 
 
+class ResearchBatchStartRequest(BaseModel):
+    gdrive_folder_name: str
+    company_names: list[str] = []
+    companies_csv: Optional[str] = None
+    max_concurrency: Optional[int] = None
+    force_refresh: bool = False
+
+
+class ResearchBatchStartResponse(BaseModel):
+    batch_id: str
+    job_ids: dict[str, str]
+    max_concurrency: int
+    message: str
+
+
+class ResearchBatchJobStatus(BaseModel):
+    job_id: str
+    company_name: str
+    status: str
+    current_phase: Optional[str] = None
+    error: Optional[str] = None
+
+
+class ResearchBatchStatusResponse(BaseModel):
+    batch_id: str
+    status: str
+    total: int
+    counts: dict[str, int]
+    result_link: Optional[str] = None
+    jobs: list[ResearchBatchJobStatus]
+
+
+def _find_or_create_folder(user_id: str, folder_name: str) -> str:
+    # Imported on first use: the Drive client library is slow to import and
+    # only needed when research is started
+    from services.google_drive_service import find_or_create_folder
+
+    return find_or_create_folder(user_id, folder_name)
+
+
 @router.post(
     "/start",
     response_model=ResearchStartResponse,
     summary="Start Sales Prospect Research",
-    description="Initiates a new sales prospect research task. The task runs asynchronously and its progress can be tracked using the returned job ID. A Google Drive folder will be created or located for storing research results.",
+    description="Initiates a new sales prospect research task. The task runs asynchronously and its progress can be tracked using the returned job ID. A Google Drive folder will be created or located for storing research results. Gemini responses cached from earlier research with the same prompts are reused unless `force_refresh` is set.",
 )
 async def start_research(
     request: ResearchStartRequest, current_user: dict = Depends(get_current_user)
@@ -49,72 +132,365 @@ async def start_research(
             detail="Company name and Google Drive folder name are required.",
         )
 
-    @router.get(
-        "/status/{job_id}",
-        response_model=ResearchStatusResponse,
-        summary="Get Research Task Status",
-        description="Retrieves the current status and progress of an ongoing or completed sales prospect research task using its job ID. Provides details on the current phase, progress messages, and a link to results if completed.",
-    )
-    async def get_research_status(
-        job_id: str, current_user: dict = Depends(get_current_user)
-    ):
-# TODO: SECURITY - Implement authorization check: Verify that job_id belongs to user_id
-        # TODO: Implement authorization check: Verify that job_id belongs to user_id
-        # This requires storing job_id to user_id mapping when the task is initiated.
-        # For now, we proceed without this check, but it's crucial for security.
-
-        task = AsyncResult(job_id, app=celery_app)
-
-        if not task.ready():
-            # Task is still pending or in progress
-            response_data = {
-                "job_id": job_id,
-                "status": task.state,
-                "progress_message": task.info.get("message", "Task is in progress."),
-                "current_phase": task.info.get("current_phase", "Initializing"),
-            }
-        else:
-            # Task is completed, failed, or unknown
-            if task.state == "SUCCESS":
-                response_data = {
-                    "job_id": job_id,
-                    "status": task.state,
-                    "progress_message": "Task completed successfully.",
-                    "result_link": task.info.get("result_link"),
-                    "current_phase": "Completed",
-                }
-            elif task.state == "FAILURE":
-                response_data = {
-                    "job_id": job_id,
-                    "status": task.state,
-                    "progress_message": "Task failed.",
-                    "error": str(
-                        task.info
-                    ),  # task.info contains the exception/traceback
-                    "current_phase": "Failed",
-                }
-            else:
-                # PENDING for unknown IDs, or other states
-                response_data = {
-                    "job_id": job_id,
-                    "status": task.state,
-                    "progress_message": "Task status unknown or not found.",
-                    "error": "Task with this ID might not exist or has an unexpected state.",
-                }
-        return ResearchStatusResponse(**response_data)
-
     # Synchronously find or create the Google Drive folder
     try:
-        gdrive_folder_id = find_or_create_folder(user_id, gdrive_folder_name)
+        gdrive_folder_id = _find_or_create_folder(user_id, gdrive_folder_name)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to set up Google Drive folder: {str(e)}",
         )
 
+    # Record the job before dispatching it so its status and owner are known immediately
+    job_id = str(uuid.uuid4())
+    create_job(
+        job_id,
+        user_id,
+        company_name,
+        gdrive_folder_id,
+        force_refresh=request.force_refresh,
+    )
+
     # Asynchronously initiate the research orchestrator task
-    task = research_orchestrator_task.delay(user_id, company_name, gdrive_folder_id)
+    celery_app.send_task(
+        RESEARCH_ORCHESTRATOR_TASK,
+        args=(user_id, company_name, gdrive_folder_id),
+        task_id=job_id,
+    )
 
     return ResearchStartResponse(
-        job_id=task.id, message="Research task initiated successfully."
+        job_id=job_id, message="Research task initiated successfully."
+    )
+
+
+@router.post(
+    "/resume/{job_id}",
+    response_model=ResearchStartResponse,
+    summary="Resume a Failed Research Task",
+    description="Restarts a failed research task under the same job ID. Phases that completed before the failure are restored from their checkpoints instead of being run again, so the job continues from its first incomplete phase.",
+)
+async def resume_research(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = get_job(job_id)
+    if job is None or job["user_id"] != current_user["user_id"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Research job not found."
+        )
+    if job["status"] != FAILURE:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Only failed research jobs can be resumed; this job is {job['status']}.",
+        )
+
+    reset_job(job_id)
+    if job.get("batch_id"):
+        # Batch jobs wait for a free slot of their batch like any queued job
+        requeue_batch_job(job["batch_id"], job_id)
+        celery_app.send_task(SCHEDULE_BATCH_JOBS_TASK, args=(job["batch_id"],))
+    else:
+        celery_app.send_task(
+            RESEARCH_ORCHESTRATOR_TASK,
+            args=(job["user_id"], job["company_name"], job["gdrive_folder_id"]),
+            kwargs={"job_id": job_id},
+        )
+
+    return ResearchStartResponse(
+        job_id=job_id, message="Research task resumed successfully."
+    )
+
+
+def _parse_company_names(request: ResearchBatchStartRequest) -> list[str]:
+    """
+    Collects company names from the JSON list and the CSV text, taking the first
+    column of each CSV row and skipping a header row. Duplicates are dropped
+    case-insensitively, keeping the first occurrence.
+    """
+    names = list(request.company_names)
+    if request.companies_csv:
+        rows = [row for row in csv.reader(io.StringIO(request.companies_csv)) if row]
+        if rows and rows[0][0].strip().lower() in CSV_HEADER_NAMES:
+            rows = rows[1:]
+        names.extend(row[0] for row in rows)
+
+    unique_names = {}
+    for name in names:
+        name = name.strip()
+        if name and name.lower() not in unique_names:
+            unique_names[name.lower()] = name
+    return list(unique_names.values())
+
+
+@router.post(
+    "/batch",
+    response_model=ResearchBatchStartResponse,
+    summary="Start Batch Prospect Research",
+    description="Initiates research for a list of companies, given as a JSON list, CSV text (first column, optional header row), or both. All jobs share one Google Drive folder. At most `max_concurrency` jobs of the batch run at the same time; the rest are queued and started as earlier jobs finish.",
+)
+async def start_batch_research(
+    request: ResearchBatchStartRequest, current_user: dict = Depends(get_current_user)
+):
+    user_id = current_user["user_id"]
+    company_names = _parse_company_names(request)
+
+    if not company_names or not request.gdrive_folder_name:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one company name and a Google Drive folder name are required.",
+        )
+    if len(company_names) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may contain at most {MAX_BATCH_SIZE} companies.",
+        )
+
+    max_concurrency = min(
+        request.max_concurrency or BATCH_MAX_CONCURRENT_JOBS, BATCH_MAX_CONCURRENT_JOBS
+    )
+    if max_concurrency < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="max_concurrency must be at least 1.",
+        )
+
+    # One folder lookup for the whole batch
+    try:
+        gdrive_folder_id = _find_or_create_folder(user_id, request.gdrive_folder_name)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to set up Google Drive folder: {str(e)}",
+        )
+
+    batch_id = str(uuid.uuid4())
+    job_ids = {company_name: str(uuid.uuid4()) for company_name in company_names}
+    for company_name, job_id in job_ids.items():
+        create_job(
+            job_id,
+            user_id,
+            company_name,
+            gdrive_folder_id,
+            batch_id=batch_id,
+            force_refresh=request.force_refresh,
+        )
+    create_batch(
+        batch_id, user_id, gdrive_folder_id, list(job_ids.values()), max_concurrency
+    )
+    celery_app.send_task(SCHEDULE_BATCH_JOBS_TASK, args=(batch_id,))
+
+    return ResearchBatchStartResponse(
+        batch_id=batch_id,
+        job_ids=job_ids,
+        max_concurrency=max_concurrency,
+        message=f"Batch research initiated for {len(job_ids)} companies.",
+    )
+
+
+@router.get(
+    "/batch/{batch_id}",
+    response_model=ResearchBatchStatusResponse,
+    summary="Get Batch Research Status",
+    description="Retrieves the aggregate status of a batch along with the status and current phase of each company's research job. The batch is PENDING until a job starts, PROGRESS while any job is queued or running, and SUCCESS once every job has finished (individual jobs may have failed; see `counts`).",
+)
+async def get_batch_research_status(
+    batch_id: str, current_user: dict = Depends(get_current_user)
+):
+    batch = get_batch(batch_id)
+    if batch is None or batch["user_id"] != current_user["user_id"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Research batch not found."
+        )
+
+    jobs = []
+    counts: dict[str, int] = {}
+    for job_id, job in zip(batch["job_ids"], get_jobs(batch["job_ids"])):
+        if job is None:
+            job_status = ResearchBatchJobStatus(
+                job_id=job_id, company_name="", status="EXPIRED"
+            )
+        else:
+            job_status = ResearchBatchJobStatus(
+                job_id=job_id,
+                company_name=job["company_name"],
+                status=job["status"],
+                current_phase=describe_progress(job),
+                error=job.get("error"),
+            )
+        counts[job_status.status] = counts.get(job_status.status, 0) + 1
+        jobs.append(job_status)
+
+    unfinished = counts.get("PENDING", 0) + counts.get("PROGRESS", 0)
+    if unfinished == 0:
+        batch_status = "SUCCESS"
+    elif counts.get("PENDING", 0) == len(jobs):
+        batch_status = "PENDING"
+    else:
+        batch_status = "PROGRESS"
+
+    return ResearchBatchStatusResponse(
+        batch_id=batch_id,
+        status=batch_status,
+        total=len(jobs),
+        counts=counts,
+        result_link=f"https://drive.google.com/drive/folders/{batch['gdrive_folder_id']}",
+        jobs=jobs,
+    )
+
+
+def _celery_task_status(job_id: str) -> dict:
+    """Status for jobs without persisted job state, read from the Celery result backend."""
+    task = AsyncResult(job_id, app=celery_app)
+
+    if not task.ready():
+        # Task is still pending or in progress
+        info = task.info if isinstance(task.info, dict) else {}
+        return {
+            "job_id": job_id,
+            "status": task.state,
+            "progress_message": info.get("message", "Task is in progress."),
+            "current_phase": info.get("current_phase", "Initializing"),
+        }
+    # Task is completed, failed, or unknown
+    if task.state == "SUCCESS":
+        return {
+            "job_id": job_id,
+            "status": task.state,
+            "progress_message": "Task completed successfully.",
+            "result_link": task.info.get("result_link"),
+            "current_phase": "Completed",
+        }
+    if task.state == "FAILURE":
+        return {
+            "job_id": job_id,
+            "status": task.state,
+            "progress_message": "Task failed.",
+            "error": str(task.info),  # task.info contains the exception/traceback
+            "current_phase": "Failed",
+        }
+    # PENDING for unknown IDs, or other states
+    return {
+        "job_id": job_id,
+        "status": task.state,
+        "progress_message": "Task status unknown or not found.",
+        "error": "Task with this ID might not exist or has an unexpected state.",
+    }
+
+
+@router.get(
+    "/status/{job_id}",
+    response_model=ResearchStatusResponse,
+    summary="Get Research Task Status",
+    description="Retrieves the current status and progress of an ongoing or completed sales prospect research task using its job ID. Provides details on the current phase, per-phase states, Gemini token and latency usage per phase, progress messages, and a link to results if completed.",
+)
+async def get_research_status(
+    job_id: str, current_user: dict = Depends(get_current_user)
+):
+    job = get_job(job_id)
+    if job is None:
+        return ResearchStatusResponse(**_celery_task_status(job_id))
+
+    if job["user_id"] != current_user["user_id"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Research job not found."
+        )
+    return _job_status(job)
+
+
+def _job_status(job: dict) -> ResearchStatusResponse:
+    """Builds the status response for a job read from the job state store."""
+    progress_messages = {
+        "SUCCESS": "Task completed successfully.",
+        "FAILURE": "Task failed.",
+    }
+    return ResearchStatusResponse(
+        job_id=job["job_id"],
+        status=job["status"],
+        progress_message=progress_messages.get(job["status"], "Task is in progress."),
+        current_phase=describe_progress(job),
+        phases=job["phases"],
+        usage=get_job_usage(job["job_id"]) or None,
+        result_link=job.get("result_link"),
+        error=job.get("error"),
+    )
+
+
+@router.get(
+    "/artifact/{job_id}/{phase}",
+    response_class=PlainTextResponse,
+    summary="Get Research Phase Report",
+    description="Returns the report text of a research phase. While the report is still being generated this is the partial text received so far, so users can start reading before the phase completes.",
+)
+async def get_research_artifact(
+    job_id: str, phase: str, current_user: dict = Depends(get_current_user)
+):
+    job = get_job(job_id)
+    if job is None or job["user_id"] != current_user["user_id"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Research job not found."
+        )
+    if phase not in RESEARCH_PHASES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown phase '{phase}'."
+        )
+
+    artifact = get_artifact(job_id, phase)
+    if artifact is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No report has been generated for this phase yet.",
+        )
+    return PlainTextResponse(artifact)
+
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@router.get(
+    "/stream/{job_id}",
+    summary="Stream Research Task Progress",
+    description="Streams progress of a research task as server-sent events instead of polling the status endpoint. A `status` event carrying the same payload as `GET /status/{job_id}` is sent on connect and after every phase transition; `progress` events report per-URL content extraction progress and the tokens received so far while a report is generated. The stream ends after the job reaches SUCCESS or FAILURE.",
+)
+async def stream_research_status(
+    job_id: str, request: Request, current_user: dict = Depends(get_current_user)
+):
+    job = get_job(job_id)
+    if job is None or job["user_id"] != current_user["user_id"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Research job not found."
+        )
+
+    async def event_stream():
+        pubsub = get_async_redis().pubsub()
+        # Subscribe before taking the snapshot so no transition falls in between
+        await pubsub.subscribe(job_events_channel(job_id))
+        try:
+            job = get_job(job_id)
+            if job is not None:
+                yield _sse("status", _job_status(job).model_dump_json())
+
+            while job is not None and job["status"] not in (SUCCESS, FAILURE):
+                if await request.is_disconnected():
+                    break
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=SSE_KEEPALIVE_SECONDS
+                )
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+
+                if json.loads(message["data"]).get("type") in PROGRESS_EVENT_TYPES:
+                    yield _sse("progress", message["data"])
+                    continue
+
+                # Phase or status transition: send the refreshed job status
+                job = get_job(job_id)
+                if job is not None:
+                    yield _sse("status", _job_status(job).model_dump_json())
+        finally:
+            await pubsub.unsubscribe(job_events_channel(job_id))
+            await pubsub.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -27,4 +27,23 @@ celery_app.conf.update(
     accept_content=["json"],
     timezone="UTC",
     enable_utc=True,
+    # Each workload class has its own queue so it can run on a worker pool
+    # suited to it (see docker-compose.yml). Orchestration and callback tasks
+    # stay on the default "celery" queue.
+    task_routes={
+        # Gemini LLM calls: network-bound, long-latency
+        "gemini_tasks.test_gemini_api": {"queue": "llm"},
+        "gemini_tasks.evict_job_context_task": {"queue": "llm"},
+        "build_job_context_task": {"queue": "llm"},
+        "prospect_deep_dive_task": {"queue": "llm"},
+        "prospect_competitor_analysis_task": {"queue": "llm"},
+        "own_competitor_marketing_analysis_task": {"queue": "llm"},
+        "synthesize_sources_task": {"queue": "llm"},
+        # Web page fetches: network-bound
+        "tasks.content_extraction.extract_url_content_task": {"queue": "crawl"},
+        # HTML parsing and Markdown conversion: CPU-bound
+        "tasks.content_extraction.convert_extracted_content_task": {"queue": "parse"},
+        # Google Drive uploads: network-bound
+        "tasks.google_drive_tasks.*": {"queue": "upload"},
+    },
 )
@@ -0,0 +1,60 @@
+import logging
+
+from db.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = "metrics:counters"
+RANKING_KEY_PREFIX = "metrics:ranking:"
+# A ranking nobody has added to for this long is dropped.
+RANKING_TTL_SECONDS = 7 * 24 * 3600
+
+
+def increment(name: str, amount: float = 1) -> None:
+    """
+    Adds `amount` to a cluster-wide counter. Counters are shared by every API
+    and worker process, so they aggregate across the deployment.
+
+    Metrics must never break the code path being measured, so Redis errors are
+    logged and swallowed.
+    """
+    try:
+        get_redis().hincrbyfloat(METRICS_KEY, name, amount)
+    except Exception as e:
+        logger.warning(f"Failed to record metric '{name}': {e}")
+
+
+def get_counters(prefix: str = "") -> dict[str, float]:
+    """
+    Returns the current value of every counter whose name starts with `prefix`.
+    """
+    counters = get_redis().hgetall(METRICS_KEY)
+    return {
+        name: float(value)
+        for name, value in sorted(counters.items())
+        if name.startswith(prefix)
+    }
+
+
+def increment_ranked(name: str, member: str, amount: float, keep: int) -> None:
+    """
+    Adds `amount` to `member`'s score in a cluster-wide ranking that keeps only
+    the `keep` highest scores. Unlike a counter per member, this stays bounded
+    however many distinct members (e.g. hosts) are recorded.
+
+    Redis errors are logged and swallowed, as for counters.
+    """
+    key = f"{RANKING_KEY_PREFIX}{name}"
+    try:
+        pipe = get_redis().pipeline()
+        pipe.zincrby(key, amount, member)
+        pipe.zremrangebyrank(key, 0, -keep - 1)
+        pipe.expire(key, RANKING_TTL_SECONDS)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record ranked metric '{name}': {e}")
+
+
+def get_ranking(name: str) -> dict[str, float]:
+    """Returns a ranking's members and scores, highest first."""
+    return dict(get_redis().zrevrange(f"{RANKING_KEY_PREFIX}{name}", 0, -1, withscores=True))
@@ -0,0 +1,123 @@
+import os
+import time
+from typing import Optional
+
+from db.redis_client import get_redis
+from db.job_store import JOB_STATE_TTL_SECONDS
+
+BATCH_KEY_PREFIX = "research:batch:"
+# Default and ceiling for how many research jobs of one batch run at the same time.
+BATCH_MAX_CONCURRENT_JOBS = int(os.getenv("BATCH_MAX_CONCURRENT_JOBS", "10"))
+# Largest prospect list accepted in a single batch.
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
+
+# Atomically claims free concurrency slots: pops queued job IDs while the
+# running counter is below the cap, and returns the claimed IDs.
+_CLAIM_SLOTS_SCRIPT = """
+local cap = tonumber(ARGV[1])
+local running = tonumber(redis.call('GET', KEYS[2]) or '0')
+local claimed = {}
+while running < cap do
+  local job_id = redis.call('LPOP', KEYS[1])
+  if not job_id then break end
+  running = running + 1
+  table.insert(claimed, job_id)
+end
+redis.call('SET', KEYS[2], running, 'KEEPTTL')
+return claimed
+"""
+
+
+def _batch_key(batch_id: str, suffix: str = "") -> str:
+    return f"{BATCH_KEY_PREFIX}{batch_id}{suffix}"
+
+
+def create_batch(
+    batch_id: str,
+    user_id: str,
+    gdrive_folder_id: str,
+    job_ids: list[str],
+    max_concurrency: int,
+) -> None:
+    """
+    Persists a batch and queues its job IDs for dispatch.
+
+    Args:
+        batch_id: The batch ID returned to the client.
+        user_id: The ID of the user who owns the batch.
+        gdrive_folder_id: The Google Drive folder shared by every job in the batch.
+        job_ids: The research job IDs of the batch, in submission order.
+        max_concurrency: How many of the batch's jobs may run at the same time.
+    """
+    pipe = get_redis().pipeline()
+    pipe.hset(
+        _batch_key(batch_id),
+        mapping={
+            "batch_id": batch_id,
+            "user_id": user_id,
+            "gdrive_folder_id": gdrive_folder_id,
+            "max_concurrency": max_concurrency,
+            "created_at": time.time(),
+        },
+    )
+    pipe.rpush(_batch_key(batch_id, ":jobs"), *job_ids)
+    pipe.rpush(_batch_key(batch_id, ":queued"), *job_ids)
+    pipe.set(_batch_key(batch_id, ":running"), 0)
+    for suffix in ("", ":jobs", ":queued", ":running"):
+        pipe.expire(_batch_key(batch_id, suffix), JOB_STATE_TTL_SECONDS)
+    pipe.execute()
+
+
+def get_batch(batch_id: str) -> Optional[dict]:
+    """
+    Retrieves a batch and the IDs of all its jobs.
+
+    Returns:
+        The batch fields plus 'job_ids', or None if the batch is unknown or expired.
+    """
+    redis_client = get_redis()
+    batch = redis_client.hgetall(_batch_key(batch_id))
+    if not batch:
+        return None
+    batch["job_ids"] = redis_client.lrange(_batch_key(batch_id, ":jobs"), 0, -1)
+    return batch
+
+
+def claim_batch_slots(batch_id: str) -> list[str]:
+    """
+    Claims as many free concurrency slots as the batch allows.
+
+    Returns:
+        The IDs of the queued jobs that may now be dispatched.
+    """
+    redis_client = get_redis()
+    max_concurrency = redis_client.hget(_batch_key(batch_id), "max_concurrency")
+    if max_concurrency is None:
+        return []
+    return redis_client.eval(
+        _CLAIM_SLOTS_SCRIPT,
+        2,
+        _batch_key(batch_id, ":queued"),
+        _batch_key(batch_id, ":running"),
+        int(max_concurrency),
+    )
+
+
+def requeue_batch_job(batch_id: str, job_id: str) -> None:
+    """
+    Puts a job of the batch, such as a resumed one, back at the front of its
+    queue. It is dispatched by claim_batch_slots like any queued job, so it
+    waits for a free slot instead of exceeding the batch's concurrency cap.
+    """
+    key = _batch_key(batch_id, ":queued")
+    pipe = get_redis().pipeline()
+    pipe.lpush(key, job_id)
+    pipe.expire(key, JOB_STATE_TTL_SECONDS)
+    pipe.execute()
+
+
+def release_batch_slot(batch_id: str) -> None:
+    """Frees the concurrency slot held by a finished job of the batch."""
+    key = _batch_key(batch_id, ":running")
+    if get_redis().decr(key) < 0:
+        get_redis().set(key, 0, keepttl=True)
@@ -0,0 +1,382 @@
+import json
+import os
+import time
+from typing import Optional
+
+from db.redis_client import get_redis
+
+JOB_KEY_PREFIX = "research:job:"
+# Research job state outlives the Celery results so finished jobs stay visible.
+JOB_STATE_TTL_SECONDS = int(os.getenv("JOB_STATE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Job and phase states reuse the Celery state names the frontend already knows.
+PENDING = "PENDING"
+PROGRESS = "PROGRESS"
+SUCCESS = "SUCCESS"
+FAILURE = "FAILURE"
+
+# Phases of a research job, in the order they are reported to the user.
+RESEARCH_PHASES = {
+    "deep_dive": "Phase 1: Prospect Deep Dive",
+    "competitor_analysis": "Phase 2: Prospect Competitor Analysis",
+    "own_marketing_analysis": "Phase 3: Own Competitor Marketing Analysis",
+    "content_extraction": "Phase 4: Extracting URL Content and Saving to Google Drive",
+    "synthesis": "Phase 5: Synthesizing Extracted Sources into a Company Brief",
+}
+
+# Records a phase transition in one step: sets the phase state, stamps the
+# start time and moves the job to PROGRESS unless it already has finished_at.
+# A job whose state has expired is not recreated. Returns 1 if it was updated.
+_SET_PHASE_STATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2], 'updated_at', ARGV[3])
+redis.call('HSETNX', KEYS[1], 'started_at', ARGV[3])
+if redis.call('HEXISTS', KEYS[1], 'finished_at') == 0 then
+  redis.call('HSET', KEYS[1], 'status', ARGV[4])
+end
+return 1
+"""
+
+# Claims finished_at (ARGV[2]) and, if this call set it, writes the terminal
+# fields given as name/value pairs from ARGV[3] on. The TTL (ARGV[1]) is set
+# again, since the hash may have expired and been recreated by HSETNX.
+# Returns 1 if this call finished the job.
+_FINISH_JOB_SCRIPT = """
+if redis.call('HSETNX', KEYS[1], 'finished_at', ARGV[2]) == 0 then return 0 end
+for i = 3, #ARGV, 2 do
+  redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+def _job_key(job_id: str) -> str:
+    return f"{JOB_KEY_PREFIX}{job_id}"
+
+
+def job_events_channel(job_id: str) -> str:
+    """The Redis pub/sub channel carrying a job's progress events."""
+    return f"{_job_key(job_id)}:events"
+
+
+def publish_job_event(job_id: str, event: dict) -> None:
+    """
+    Publishes a progress event for a job to subscribers of its events channel,
+    such as the API's server-sent events stream.
+
+    Args:
+        job_id: The research job ID.
+        event: A JSON-serialisable event; its 'type' tells subscribers how to
+            interpret it ('phase', 'status', 'url_progress' or 'phase_progress').
+    """
+    get_redis().publish(job_events_channel(job_id), json.dumps(event))
+
+
+def create_job(
+    job_id: str,
+    user_id: str,
+    company_name: str,
+    gdrive_folder_id: str,
+    batch_id: Optional[str] = None,
+    force_refresh: bool = False,
+) -> None:
+    """
+    Persists a new research job with every phase in the PENDING state.
+
+    Args:
+        job_id: The research job ID returned to the client.
+        user_id: The ID of the user who owns the job.
+        company_name: The prospect company being researched.
+        gdrive_folder_id: The Google Drive folder receiving the results.
+        batch_id: (Optional) The batch this job was submitted in.
+        force_refresh: Bypass cached Gemini responses for this job's phases.
+    """
+    now = time.time()
+    fields = {
+        "job_id": job_id,
+        "user_id": user_id,
+        "company_name": company_name,
+        "gdrive_folder_id": gdrive_folder_id,
+        "status": PENDING,
+        "force_refresh": int(force_refresh),
+        "created_at": now,
+        "updated_at": now,
+    }
+    if batch_id:
+        fields["batch_id"] = batch_id
+    fields.update({f"phase:{phase}": PENDING for phase in RESEARCH_PHASES})
+
+    key = _job_key(job_id)
+    pipe = get_redis().pipeline()
+    pipe.hset(key, mapping=fields)
+    pipe.expire(key, JOB_STATE_TTL_SECONDS)
+    pipe.execute()
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """
+    Retrieves a research job's persisted state.
+
+    Returns:
+        A dictionary with the job fields and a 'phases' mapping of phase name to
+        state, or None if the job is unknown or has expired.
+    """
+    return _parse_job(get_redis().hgetall(_job_key(job_id)))
+
+
+def get_jobs(job_ids: list[str]) -> list[Optional[dict]]:
+    """
+    Retrieves several jobs in one Redis round trip, in the order of `job_ids`.
+    """
+    pipe = get_redis().pipeline()
+    for job_id in job_ids:
+        pipe.hgetall(_job_key(job_id))
+    return [_parse_job(raw) for raw in pipe.execute()]
+
+
+def _parse_job(raw: dict) -> Optional[dict]:
+    if not raw:
+        return None
+
+    job = {key: value for key, value in raw.items() if not key.startswith("phase:")}
+    job["phases"] = {
+        phase: raw.get(f"phase:{phase}", PENDING) for phase in RESEARCH_PHASES
+    }
+    return job
+
+
+def set_phase_state(job_id: str, phase: str, state: str) -> None:
+    """
+    Records a phase transition. The job moves to PROGRESS unless it has already
+    finished; the check and the update are one atomic step, so a late phase
+    callback cannot reopen a finished job. Expired jobs are left alone.
+    """
+    updated = get_redis().eval(
+        _SET_PHASE_STATE_SCRIPT,
+        1,
+        _job_key(job_id),
+        f"phase:{phase}",
+        state,
+        time.time(),
+        PROGRESS,
+    )
+    if updated:
+        publish_job_event(job_id, {"type": "phase", "phase": phase, "state": state})
+
+
+def finish_job(
+    job_id: str,
+    state: str,
+    result_link: Optional[str] = None,
+    error: Optional[str] = None,
+) -> bool:
+    """
+    Moves a job to its terminal state. Only the first call wins, so callbacks
+    racing to finish the same job cannot overwrite each other.
+
+    Returns:
+        True if this call finished the job, False if it was already finished.
+    """
+    now = time.time()
+    fields = {"status": state, "updated_at": now}
+    if result_link:
+        fields["result_link"] = result_link
+    if error:
+        fields["error"] = error
+    args = [JOB_STATE_TTL_SECONDS, now]
+    for name, value in fields.items():
+        args.extend((name, value))
+    if not get_redis().eval(_FINISH_JOB_SCRIPT, 1, _job_key(job_id), *args):
+        return False
+
+    publish_job_event(job_id, {"type": "status", "status": state})
+    return True
+
+
+def reset_job(job_id: str) -> None:
+    """
+    Reopens a finished job for resumption. Phases that did not succeed go back
+    to PENDING; checkpointed phases keep their state.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return
+
+    key = _job_key(job_id)
+    fields = {"status": PENDING, "updated_at": time.time()}
+    fields.update(
+        {
+            f"phase:{phase}": PENDING
+            for phase, state in job["phases"].items()
+            if state != SUCCESS
+        }
+    )
+    pipe = get_redis().pipeline()
+    pipe.hdel(key, "finished_at", "error", "result_link")
+    pipe.hset(key, mapping=fields)
+    pipe.execute()
+    publish_job_event(job_id, {"type": "status", "status": PENDING})
+
+
+def save_checkpoint(job_id: str, phase: str, result) -> None:
+    """
+    Persists a finished phase's output so a retried or resumed job can skip it.
+
+    Args:
+        job_id: The research job ID.
+        phase: The phase name, one of RESEARCH_PHASES.
+        result: The phase task's JSON-serialisable return value.
+    """
+    key = f"{_job_key(job_id)}:checkpoints"
+    pipe = get_redis().pipeline()
+    pipe.hset(key, phase, json.dumps(result))
+    pipe.expire(key, JOB_STATE_TTL_SECONDS)
+    pipe.execute()
+
+
+def get_checkpoints(job_id: str) -> dict:
+    """
+    Retrieves the checkpointed outputs of a job's finished phases.
+
+    Returns:
+        A mapping of phase name to that phase's saved result.
+    """
+    raw = get_redis().hgetall(f"{_job_key(job_id)}:checkpoints")
+    return {phase: json.loads(result) for phase, result in raw.items()}
+
+
+def artifact_key(job_id: str, phase: str) -> str:
+    """The Redis key holding a phase's artifact."""
+    return f"{_job_key(job_id)}:artifact:{phase}"
+
+
+def append_artifact(job_id: str, phase: str, text: str) -> int:
+    """
+    Appends streamed output to a phase's partial artifact, so readers can see
+    a report while it is still being generated.
+
+    Returns:
+        The artifact's length in characters after the append.
+    """
+    key = artifact_key(job_id, phase)
+    pipe = get_redis().pipeline()
+    pipe.append(key, text)
+    pipe.expire(key, JOB_STATE_TTL_SECONDS)
+    return pipe.execute()[0]
+
+
+def get_artifact(job_id: str, phase: str) -> Optional[str]:
+    """Returns a phase's (possibly partial) artifact, or None if there is none."""
+    return get_redis().get(artifact_key(job_id, phase))
+
+
+def clear_artifact(job_id: str, phase: str) -> None:
+    """Discards a phase's artifact, e.g. before a retry streams it again."""
+    get_redis().delete(artifact_key(job_id, phase))
+
+
+def set_job_context_cache(job_id: str, cache_name: str) -> bool:
+    """
+    Registers the provider-side cached context created for a job, so every
+    phase can reference it and it can be evicted when the job ends.
+
+    Returns:
+        False if the job already has a cached context registered.
+    """
+    return bool(
+        get_redis().set(
+            f"{_job_key(job_id)}:context-cache",
+            cache_name,
+            nx=True,
+            ex=JOB_STATE_TTL_SECONDS,
+        )
+    )
+
+
+def get_job_context_cache(job_id: str) -> Optional[str]:
+    """Returns the name of the job's cached context, or None if it has none."""
+    return get_redis().get(f"{_job_key(job_id)}:context-cache")
+
+
+def pop_job_context_cache(job_id: str) -> Optional[str]:
+    """Unregisters the job's cached context and returns its name, if any."""
+    return get_redis().getdel(f"{_job_key(job_id)}:context-cache")
+
+
+def claim_job_hedge(job_id: str, max_hedges: int) -> bool:
+    """
+    Counts one hedged (duplicate) LLM request against the job's cap.
+
+    Returns:
+        False if the job has already used its `max_hedges` hedges.
+    """
+    key = f"{_job_key(job_id)}:hedges"
+    pipe = get_redis().pipeline()
+    pipe.incr(key)
+    pipe.expire(key, JOB_STATE_TTL_SECONDS)
+    return pipe.execute()[0] <= max_hedges
+
+
+def release_job_hedge(job_id: str) -> None:
+    """Gives back a hedge claimed with claim_job_hedge that was not sent."""
+    get_redis().decr(f"{_job_key(job_id)}:hedges")
+
+
+def add_job_usage(job_id: str, phase: str, usage: dict[str, float]) -> None:
+    """
+    Adds one LLM call's usage (token counts, latency, call counts) to the
+    job's per-phase totals.
+
+    Args:
+        job_id: The research job the call belonged to.
+        phase: The phase that made the call.
+        usage: Counter name to amount, e.g. {"calls": 1, "prompt_tokens": 812}.
+    """
+    key = f"{_job_key(job_id)}:usage"
+    pipe = get_redis().pipeline()
+    for name, amount in usage.items():
+        pipe.hincrbyfloat(key, f"{phase}:{name}", amount)
+    pipe.expire(key, JOB_STATE_TTL_SECONDS)
+    pipe.execute()
+
+
+def get_job_usage(job_id: str) -> dict[str, dict[str, float]]:
+    """
+    Retrieves a job's LLM usage.
+
+    Returns:
+        A mapping of phase name to its usage counters, plus a 'total' entry
+        summing every phase. Empty if the job has made no recorded calls.
+    """
+    raw = get_redis().hgetall(f"{_job_key(job_id)}:usage")
+    usage: dict[str, dict[str, float]] = {}
+    for field, value in raw.items():
+        phase, name = field.split(":", 1)
+        usage.setdefault(phase, {})[name] = float(value)
+    if usage:
+        total: dict[str, float] = {}
+        for counters in usage.values():
+            for name, value in counters.items():
+                total[name] = total.get(name, 0.0) + value
+        usage["total"] = total
+    return usage
+
+
+def describe_progress(job: dict) -> str:
+    """Builds the human-readable current_phase for a job returned by get_job."""
+    if job["status"] == SUCCESS:
+        return "Research workflow completed successfully!"
+    if job["status"] == FAILURE:
+        return "Research workflow failed"
+
+    phases = job["phases"]
+    running = [
+        RESEARCH_PHASES[phase]
+        for phase, state in phases.items()
+        if state == PROGRESS
+    ]
+    if not running:
+        return "Starting research workflow..."
+    completed = sum(1 for state in phases.values() if state == SUCCESS)
+    return f"{completed}/{len(phases)} phases complete. Running: {', '.join(running)}"
@@ -0,0 +1,36 @@
+import os
+from typing import Optional
+
+import redis
+import redis.asyncio
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+_redis_client: Optional[redis.Redis] = None
+_async_redis_client: Optional[redis.asyncio.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    """
+    Returns the process-wide Redis client used for application state
+    (research job state, caches, counters), creating it on first use.
+
+    The client decodes responses to str; store binary payloads elsewhere.
+    """
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _redis_client
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """
+    Returns the process-wide asyncio Redis client, for use from the API's
+    event loop (e.g. pub/sub subscriptions), creating it on first use.
+    """
+    global _async_redis_client
+    if _async_redis_client is None:
+        _async_redis_client = redis.asyncio.Redis.from_url(
+            REDIS_URL, decode_responses=True
+        )
+    return _async_redis_client
@@ -0,0 +1,262 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+CONTENT_CACHE_ENABLED = os.getenv("CONTENT_CACHE_ENABLED", "true").lower() == "true"
+# SQLite file shared by the worker processes of a host.
+CONTENT_CACHE_PATH = os.getenv("CONTENT_CACHE_PATH", "/tmp/sales-researcher/content-cache.sqlite3")
+# How long a page is served without asking its server, unless the response
+# set a shorter Cache-Control max-age. Older pages are revalidated.
+CONTENT_CACHE_MAX_AGE_SECONDS = int(os.getenv("CONTENT_CACHE_MAX_AGE_SECONDS", str(24 * 3600)))
+# Compressed size the cache is kept under by evicting the least recently used pages.
+CONTENT_CACHE_MAX_BYTES = int(os.getenv("CONTENT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url_key TEXT PRIMARY KEY,
+    html BLOB NOT NULL,
+    text BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fresh_until REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at);
+"""
+
+
+def cache_key(url: str) -> str:
+    """
+    Normalizes a URL for cache keying: scheme and host are case-insensitive,
+    default ports and fragments do not change the page.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rpartition(":")[2]) in (("http", "80"), ("https", "443")):
+        netloc = netloc.rpartition(":")[0]
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def freshness_lifetime(cache_control: Optional[str], default: int) -> Optional[int]:
+    """
+    Seconds a response may be served without revalidation, from its
+    Cache-Control header. None means it must not be stored (no-store).
+    """
+    directives = {}
+    for directive in (cache_control or "").lower().split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name] = value.strip('"')
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    try:
+        return min(default, int(directives["max-age"]))
+    except (KeyError, ValueError):
+        return default
+
+
+@dataclass
+class CachedPage:
+    html: str
+    text: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh_until: float
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() < self.fresh_until
+
+    def conditional_headers(self) -> dict[str, str]:
+        """Headers that turn a GET for this page into a revalidation."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ContentCache:
+    """
+    On-disk cache of fetched pages: the zlib-compressed raw HTML and extracted
+    text, with the validators (ETag / Last-Modified) needed to revalidate them.
+
+    A page within its max-age is served without any request. An older one is
+    revalidated with a conditional GET; a 304 renews it and its stored text is
+    used as is, skipping download and parsing. Once the cache outgrows
+    `max_bytes` the least recently used pages are evicted.
+
+    Lookups and stores never fail a fetch: SQLite errors are logged and the
+    page is fetched as if uncached. Hits, revalidations and misses are counted
+    in the cluster-wide 'content_cache.*' metrics.
+    """
+
+    def __init__(
+        self,
+        path: str = CONTENT_CACHE_PATH,
+        max_age_seconds: int = CONTENT_CACHE_MAX_AGE_SECONDS,
+        max_bytes: int = CONTENT_CACHE_MAX_BYTES,
+    ):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections must not be shared across threads; one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        """Returns the cached page for `url`, fresh or not, or None."""
+        key = cache_key(url)
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                "SELECT html, text, etag, last_modified, fresh_until FROM pages WHERE url_key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE pages SET accessed_at = ? WHERE url_key = ?", (time.time(), key)
+            )
+            html, text, etag, last_modified, fresh_until = row
+            return CachedPage(
+                html=zlib.decompress(html).decode("utf-8"),
+                text=zlib.decompress(text).decode("utf-8"),
+                etag=etag,
+                last_modified=last_modified,
+                fresh_until=fresh_until,
+            )
+        except Exception as e:
+            logger.warning(f"Content cache lookup failed for {url}, fetching it instead: {e}")
+            return None
+
+    def put(
+        self,
+        url: str,
+        html: str,
+        text: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        cache_control: Optional[str] = None,
+    ) -> None:
+        """Stores a fetched page and evicts the least recently used pages over the size bound."""
+        lifetime = freshness_lifetime(cache_control, self.max_age_seconds)
+        if lifetime is None:
+            return
+        html_blob = zlib.compress(html.encode("utf-8"))
+        text_blob = zlib.compress(text.encode("utf-8"))
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    cache_key(url),
+                    html_blob,
+                    text_blob,
+                    etag,
+                    last_modified,
+                    now + lifetime,
+                    now,
+                    len(html_blob) + len(text_blob),
+                ),
+            )
+            metrics.increment("content_cache.stores")
+            self._evict(connection)
+        except Exception as e:
+            logger.warning(f"Failed to store {url} in the content cache: {e}")
+
+    def renew(self, url: str, cache_control: Optional[str] = None) -> None:
+        """Marks a page fresh again after its server answered 304 Not Modified."""
+        lifetime = freshness_lifetime(cache_control, self.max_age_seconds) or 0
+        now = time.time()
+        try:
+            self._connection().execute(
+                "UPDATE pages SET fresh_until = ?, accessed_at = ? WHERE url_key = ?",
+                (now + lifetime, now, cache_key(url)),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to renew {url} in the content cache: {e}")
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        rows = connection.execute("SELECT url_key, size FROM pages ORDER BY accessed_at").fetchall()
+        for url_key, size in rows:
+            if total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM pages WHERE url_key = ?", (url_key,))
+            total -= size
+            evicted += 1
+        metrics.increment("content_cache.evictions", evicted)
+
+    @staticmethod
+    def record(outcome: str) -> None:
+        """
+        Counts a lookup outcome: 'hits' (served fresh), 'revalidated' (304,
+        stored text reused) or 'misses' (downloaded and parsed).
+        """
+        metrics.increment(f"content_cache.{outcome}")
+
+    def stats(self) -> dict:
+        """
+        Returns the cluster-wide counters and hit rate; a revalidated page
+        counts as a hit, since it skipped download and parsing.
+        """
+        counters = metrics.get_counters("content_cache.")
+        hits = counters.get("content_cache.hits", 0)
+        revalidated = counters.get("content_cache.revalidated", 0)
+        misses = counters.get("content_cache.misses", 0)
+        lookups = hits + revalidated + misses
+        return {
+            "hits": hits,
+            "revalidated": revalidated,
+            "misses": misses,
+            "stores": counters.get("content_cache.stores", 0),
+            "evictions": counters.get("content_cache.evictions", 0),
+            "hit_rate": (hits + revalidated) / lookups if lookups else 0.0,
+            "max_age_seconds": self.max_age_seconds,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_content_cache: Optional[ContentCache] = None
+_content_cache_lock = threading.Lock()
+
+
+def get_content_cache() -> Optional[ContentCache]:
+    """Returns the process-wide content cache, or None when it is disabled."""
+    global _content_cache
+    if not CONTENT_CACHE_ENABLED:
+        return None
+    if _content_cache is None:
+        with _content_cache_lock:
+            if _content_cache is None:
+                _content_cache = ContentCache()
+    return _content_cache
@@ -0,0 +1,121 @@
+"""
+Duplicate detection for extracted source pages. Gemini's source lists often
+name the same page several times (http/https and www variants, tracking
+parameters) and syndicated copies of one press release. Exact URL variants are
+caught before fetching by normalizing URLs; near-identical content is caught
+after extraction by comparing SimHash fingerprints of the text.
+"""
+import hashlib
+import os
+import re
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Pages whose 64-bit SimHash fingerprints differ in at most this many bits are
+# treated as near-duplicates.
+DEDUP_SIMHASH_MAX_DISTANCE = int(os.getenv("DEDUP_SIMHASH_MAX_DISTANCE", "3"))
+# Texts shorter than this many words are too short to fingerprint reliably.
+DEDUP_MIN_WORDS = int(os.getenv("DEDUP_MIN_WORDS", "50"))
+
+SHINGLE_WORDS = 3
+
+# Query parameters that track the visit rather than select the content.
+_TRACKING_PARAMS = re.compile(
+    r"^(utm_\w+|gclid|fbclid|msclkid|mc_cid|mc_eid|_hsenc|_hsmi|ref|ref_src)$", re.IGNORECASE
+)
+_WORD = re.compile(r"\w+")
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalizes a URL to identify variants of the same page: the scheme, a
+    leading 'www.', default ports, fragments, tracking parameters, parameter
+    order and trailing slashes are ignored, and the host is lower-cased.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[len("www."):]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path).rstrip("/")
+    query = urlencode(
+        sorted(
+            (name, value)
+            for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not _TRACKING_PARAMS.match(name)
+        )
+    )
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+
+def simhash(text: str) -> Optional[int]:
+    """
+    Computes the 64-bit SimHash of a text over its word 3-shingles. Similar
+    texts get fingerprints that differ in few bits.
+
+    Returns:
+        The fingerprint, or None if the text is shorter than DEDUP_MIN_WORDS.
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) < DEDUP_MIN_WORDS:
+        return None
+
+    weights = [0] * 64
+    for index in range(len(words) - SHINGLE_WORDS + 1):
+        shingle = " ".join(words[index : index + SHINGLE_WORDS])
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def find_url_duplicates(urls: list[str]) -> list[Optional[int]]:
+    """
+    Finds URLs that are variants of an earlier URL in the list.
+
+    Returns:
+        Per URL, the index of the earlier URL it duplicates, or None.
+    """
+    first_seen: dict[str, int] = {}
+    duplicates: list[Optional[int]] = []
+    for index, url in enumerate(urls):
+        key = normalize_url(url)
+        duplicates.append(first_seen.get(key))
+        first_seen.setdefault(key, index)
+    return duplicates
+
+
+def find_near_duplicates(
+    texts: list[Optional[str]], max_distance: int = DEDUP_SIMHASH_MAX_DISTANCE
+) -> list[Optional[int]]:
+    """
+    Finds texts that are near-duplicates of an earlier text in the list.
+    Missing (None) and very short texts are never duplicates.
+
+    Returns:
+        Per text, the index of the earlier text it duplicates, or None.
+    """
+    kept: list[tuple[int, int]] = []
+    duplicates: list[Optional[int]] = []
+    for index, text in enumerate(texts):
+        fingerprint = simhash(text) if text else None
+        canonical = None
+        if fingerprint is not None:
+            canonical = next(
+                (
+                    kept_index
+                    for kept_index, kept_fingerprint in kept
+                    if hamming_distance(fingerprint, kept_fingerprint) <= max_distance
+                ),
+                None,
+            )
+            if canonical is None:
+                kept.append((index, fingerprint))
+        duplicates.append(canonical)
+    return duplicates
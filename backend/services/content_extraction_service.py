@@ -1,37 +1,463 @@
-import trafilatura
+import collections
+import concurrent.futures
 import logging
+import multiprocessing
+import os
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+import httpx
+import trafilatura
+
+from core import metrics
+from services.content_cache import get_content_cache
+from services.crawl_scheduler import domain_of, get_crawl_scheduler
+from services.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
+# URLs fetched at once by one extraction task.
+EXTRACTION_MAX_CONCURRENCY = int(os.getenv("EXTRACTION_MAX_CONCURRENCY", "10"))
+# URLs fetched at once from the same host, on top of its crawl delay.
+EXTRACTION_PER_HOST_CONCURRENCY = int(os.getenv("EXTRACTION_PER_HOST_CONCURRENCY", "2"))
+# A URL still being fetched after this long is given up, so one slow site
+# cannot stall the batch.
+EXTRACTION_URL_TIMEOUT_SECONDS = float(os.getenv("EXTRACTION_URL_TIMEOUT_SECONDS", "30"))
+# Processes extracting text from downloaded pages, shared by the extraction
+# tasks of a worker process. Defaults to the number of cores.
+EXTRACTION_PARSE_PROCESSES = int(os.getenv("EXTRACTION_PARSE_PROCESSES", "0")) or os.cpu_count() or 1
+# Downloaded pages an extraction task may hold waiting for, or in, the parse
+# processes. Fetching pauses while the queue is full, so memory stays flat.
+EXTRACTION_PARSE_QUEUE_SIZE = (
+    int(os.getenv("EXTRACTION_PARSE_QUEUE_SIZE", "0")) or 2 * EXTRACTION_PARSE_PROCESSES
+)
+
+# Bodies larger than this are not downloaded; the download is aborted as soon
+# as the limit is reached, so a huge file cannot balloon a worker's memory.
+EXTRACTION_MAX_BYTES = int(os.getenv("EXTRACTION_MAX_BYTES", str(5 * 1024 * 1024)))
+# Content types worth extracting; other responses are aborted on their headers.
+EXTRACTION_ALLOWED_CONTENT_TYPES = frozenset(
+    content_type.strip().lower()
+    for content_type in os.getenv(
+        "EXTRACTION_ALLOWED_CONTENT_TYPES", "text/html,application/xhtml+xml,text/plain"
+    ).split(",")
+)
+
+# Declared types that say nothing about the body; such bodies are sniffed.
+_GENERIC_CONTENT_TYPES = frozenset({"application/octet-stream", "binary/octet-stream"})
+_MAGIC_NUMBERS = (
+    (b"%PDF-", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),
+    (b"\x89PNG", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"\x1f\x8b", "application/gzip"),
+    (b"\x1aE\xdf\xa3", "video/webm"),
+    (b"ID3", "audio/mpeg"),
+    (b"OggS", "application/ogg"),
+)
+
+# How often the batch checks in-flight fetches against their timeout.
+_TIMEOUT_POLL_SECONDS = 0.5
+
+
+class DownloadedPage(NamedTuple):
+    """
+    A page as fetched: either fresh HTML that still needs extracting, or the
+    text of a cached copy that is still valid.
+    """
+
+    html: Optional[str] = None
+    cached_text: Optional[str] = None
+    response: Optional[httpx.Response] = None
+
+
+class DownloadSkipped(Exception):
+    """A download was aborted because the response is not a page worth extracting."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def sniff_content_type(head: bytes) -> str:
+    """Guesses the content type of a body from its first bytes."""
+    for magic, content_type in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return content_type
+    sample = head[:1024].lstrip().lower()
+    if sample.startswith((b"<!doctype html", b"<html")) or b"<body" in sample or b"<head" in sample:
+        return "text/html"
+    if b"\x00" in head[:1024]:
+        return "application/octet-stream"
+    return "text/plain"
+
+
+def _skip(url: str, reason: str, message: str) -> DownloadSkipped:
+    metrics.increment(f"content_fetch.skipped.{reason}")
+    logger.warning(f"Skipped URL {url}: {message}")
+    return DownloadSkipped(reason, message)
+
+
+def download_capped(
+    url: str, timeout: Optional[float], headers: Optional[dict] = None
+) -> tuple[httpx.Response, str]:
+    """
+    Downloads a page through the shared pooled client, streaming the body so
+    that responses which are not pages are aborted early: on a disallowed
+    content type (declared or sniffed from the first bytes), or once the body
+    exceeds EXTRACTION_MAX_BYTES. The whole download must also finish within
+    `timeout`, so a server trickling bytes cannot hold the fetch slot.
+
+    Returns:
+        The response and its decoded body. The body of a 304 or an HTTP error
+        status is not read and returned empty.
+
+    Raises:
+        DownloadSkipped: If the download was aborted.
+    """
+    request_timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    with get_http_client().stream("GET", url, headers=headers, timeout=request_timeout) as response:
+        if response.status_code >= 400 or response.status_code == 304:
+            return response, ""
+
+        declared_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+        if declared_type and declared_type not in _GENERIC_CONTENT_TYPES | EXTRACTION_ALLOWED_CONTENT_TYPES:
+            raise _skip(url, "content_type", f"Content type {declared_type} is not extracted")
+        declared_length = response.headers.get("content-length", "")
+        if declared_length.isdigit() and int(declared_length) > EXTRACTION_MAX_BYTES:
+            raise _skip(
+                url, "too_large", f"Body of {int(declared_length)} bytes exceeds {EXTRACTION_MAX_BYTES} bytes"
+            )
+
+        body = bytearray()
+        for chunk in response.iter_bytes():
+            if not body and declared_type in ("", *_GENERIC_CONTENT_TYPES):
+                sniffed_type = sniff_content_type(chunk)
+                if sniffed_type not in EXTRACTION_ALLOWED_CONTENT_TYPES:
+                    raise _skip(url, "content_type", f"Content sniffed as {sniffed_type} is not extracted")
+            body.extend(chunk)
+            if len(body) > EXTRACTION_MAX_BYTES:
+                raise _skip(url, "too_large", f"Body exceeds {EXTRACTION_MAX_BYTES} bytes")
+            if deadline is not None and time.monotonic() > deadline:
+                raise _skip(url, "too_slow", f"Download took longer than {timeout:.0f} seconds")
+
+    return response, bytes(body).decode(response.charset_encoding or "utf-8", errors="replace")
+
+
+def download_page(url: str, timeout: Optional[float] = None) -> Optional[DownloadedPage]:
+    """
+    The network half of fetching a page. Pages fresh in the on-disk content
+    cache are served from it; a stale cached page is revalidated with a
+    conditional GET, and if the server answers 304 Not Modified its stored
+    text is reused without parsing.
 
-def fetch_and_extract_text(url: str) -> str | None:
+    Returns:
+        The downloaded page, or None if it could not be downloaded.
+    """
+    cache = get_content_cache()
+    cached = cache.get(url) if cache else None
+    if cached and cached.is_fresh:
+        cache.record("hits")
+        return DownloadedPage(cached_text=cached.text)
+
+    # Download the webpage, or revalidate the cached copy
+    response, html = download_capped(
+        url, timeout, cached.conditional_headers() if cached else None
+    )
+
+    if response.status_code >= 400:
+        logger.warning(f"HTTP {response.status_code} while downloading URL: {url}")
+        return None
+
+    if response.status_code == 304:
+        if not cached:
+            # Not Modified with nothing to reuse (e.g. evicted meanwhile): no page
+            logger.warning(f"HTTP 304 without a cached copy of URL: {url}")
+            return None
+        cache.renew(url, response.headers.get("cache-control"))
+        cache.record("revalidated")
+        return DownloadedPage(cached_text=cached.text)
+
+    if cache:
+        cache.record("misses")
+    return DownloadedPage(html=html, response=response)
+
+
+def extract_text(html: str) -> Optional[str]:
+    """
+    The CPU half of fetching a page: extracts the main text content of its
+    HTML using trafilatura. Runs in the parse processes.
     """
-    Fetches a webpage from the given URL and extracts its main text content using trafilatura.
+    return trafilatura.extract(html, include_comments=False, include_tables=False)
+
+
+def _store_extracted(url: str, page: DownloadedPage, extracted_text: str) -> None:
+    cache = get_content_cache()
+    if cache:
+        cache.put(
+            url,
+            page.html,
+            extracted_text,
+            etag=page.response.headers.get("etag"),
+            last_modified=page.response.headers.get("last-modified"),
+            cache_control=page.response.headers.get("cache-control"),
+        )
+
+
+def fetch_and_extract_text(url: str, timeout: Optional[float] = None) -> str | None:
+    """
+    Fetches a webpage from the given URL through the shared pooled HTTP client
+    and extracts its main text content using trafilatura, going through the
+    content cache (see download_page).
 
     Args:
         url (str): The URL of the webpage to fetch.
+        timeout (float | None): Timeout for each network operation of the
+            download; the client's configured timeouts if not given.
 
     Returns:
         str | None: The extracted main text content, or None if extraction fails.
     """
     try:
-        # Download the webpage
-        downloaded = trafilatura.fetch_url(url)
-
-        if downloaded is None:
-            logger.warning(f"Failed to download content from URL: {url}")
+        page = download_page(url, timeout)
+        if page is None:
             return None
+        if page.cached_text is not None:
+            return page.cached_text
 
         # Extract the main text content
-        extracted_text = trafilatura.extract(
-            downloaded, include_comments=False, include_tables=False
-        )
+        extracted_text = extract_text(page.html)
 
         if extracted_text is None:
             logger.warning(f"Failed to extract significant text from URL: {url}")
             return None
 
+        _store_extracted(url, page, extracted_text)
         return extracted_text
+    except DownloadSkipped:
+        return None  # Not a page; the reason was logged and counted
     except Exception as e:
         logger.error(f"An error occurred during content extraction for URL {url}: {e}")
         raise # Re-raise the exception to be handled by the caller
+
+
+_parse_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Returns the worker process's pool of parse processes, creating it on first
+    use, or again after a parse process died. The processes are spawned rather
+    than forked, since the worker process runs many threads.
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None or getattr(_parse_pool, "_broken", False):
+            _parse_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=EXTRACTION_PARSE_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _parse_pool
+
+
+def _fresh_cached_text(url: str) -> Optional[str]:
+    """The cached text of a page that can be served without any request."""
+    cache = get_content_cache()
+    cached = cache.get(url) if cache else None
+    if cached and cached.is_fresh:
+        cache.record("hits")
+        return cached.text
+    return None
+
+
+def fetch_and_extract_many(
+    urls: list[str],
+    on_result: Optional[Callable[[int, str, Optional[str], Optional[str]], None]] = None,
+    max_concurrency: int = EXTRACTION_MAX_CONCURRENCY,
+    per_host_concurrency: int = EXTRACTION_PER_HOST_CONCURRENCY,
+    timeout: float = EXTRACTION_URL_TIMEOUT_SECONDS,
+    parse_queue_size: int = EXTRACTION_PARSE_QUEUE_SIZE,
+) -> list[tuple[Optional[str], Optional[str]]]:
+    """
+    Fetches and extracts several URLs as a two-stage pipeline. A thread pool
+    downloads pages, with at most `max_concurrency` fetches in flight overall
+    and `per_host_concurrency` per host, and hands the HTML to the parse
+    processes (see get_parse_pool) for text extraction. A slow parse never
+    holds up fetching, a slow fetch never idles the parse processes, and the
+    batch takes about as long as its slowest fetch rather than the sum of all
+    of them.
+
+    Pages downloading, waiting for a parse process or being parsed are capped
+    at `parse_queue_size`; while the cap is reached no new fetches start, so
+    memory stays flat however many URLs there are.
+
+    URLs are queued per domain and dispatched politely (see CrawlScheduler):
+    URLs disallowed by robots.txt are not fetched, and requests to a domain
+    start no closer together than its crawl delay. The queues are served
+    round-robin, and a domain waiting out its delay does not hold a pool
+    thread, so the pool keeps busy with other domains meanwhile. Pages fresh
+    in the content cache need no request and are returned right away.
+
+    A fetch still running `timeout` seconds after it started is reported as
+    timed out. Its thread cannot be interrupted, but the download's network
+    timeouts are set to the same value, so it ends on its own shortly after.
+    Downloads that are not pages or are too large are aborted early (see
+    download_capped); their error starts with "Skipped:" and gives the reason.
+
+    Args:
+        urls: The URLs to fetch.
+        on_result: Called in the calling thread as each URL finishes, with its
+            index, URL, extracted content and error; for progress reporting.
+        max_concurrency: Fetches in flight at once.
+        per_host_concurrency: Fetches in flight at once per host.
+        timeout: Per-URL time limit in seconds for the download, from its start.
+        parse_queue_size: Pages held between the start of their download and
+            the end of their parse.
+
+    Returns:
+        A (content, error) pair per URL, in the order of `urls`. content is
+        None when the fetch failed, with error describing why.
+    """
+    results: list[Optional[tuple[Optional[str], Optional[str]]]] = [None] * len(urls)
+    if not urls:
+        return []
+
+    def finish(index: int, result: tuple[Optional[str], Optional[str]]) -> None:
+        results[index] = result
+        if on_result:
+            on_result(index, urls[index], *result)
+
+    started_at: dict[int, float] = {}
+
+    def fetch(index: int, url: str) -> Optional[DownloadedPage]:
+        started_at[index] = time.monotonic()
+        return download_page(url, timeout=timeout)
+
+    scheduler = get_crawl_scheduler()
+    queues: dict[str, collections.deque] = {}
+    for index, url in enumerate(urls):
+        cached_text = _fresh_cached_text(url)
+        if cached_text:
+            finish(index, (cached_text, None))
+        else:
+            queues.setdefault(domain_of(url), collections.deque()).append(index)
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, min(max_concurrency, len(urls))),
+        thread_name_prefix="extract",
+    )
+    parse_pool = get_parse_pool()
+    parsing: dict[concurrent.futures.Future, tuple[int, DownloadedPage]] = {}
+    try:
+        # robots.txt of every domain, read in parallel
+        policies = dict(zip(queues, executor.map(scheduler.policy, queues)))
+        for domain, queue in queues.items():
+            for index in [index for index in queue if not policies[domain].allows(urls[index])]:
+                queue.remove(index)
+                scheduler.record_disallowed(urls[index])
+                finish(index, (None, "Disallowed by robots.txt"))
+
+        in_flight: collections.Counter = collections.Counter()
+        # Domains whose next request slot is booked for a later time
+        booked_at: dict[str, float] = {}
+        pending: dict[concurrent.futures.Future, tuple[int, str]] = {}
+
+        def dispatch(domain: str) -> bool:
+            """Starts the domain's next URL if its slot and the limits allow."""
+            queue = queues[domain]
+            if (
+                not queue
+                or len(pending) >= max_concurrency
+                or in_flight[domain] >= per_host_concurrency
+                or len(pending) + len(parsing) >= max(1, parse_queue_size)
+            ):
+                return False
+            if domain in booked_at:
+                if booked_at[domain] > time.monotonic():
+                    return False
+                del booked_at[domain]
+            else:
+                wait = scheduler.reserve(domain, policies[domain].delay)
+                if wait > 0:
+                    booked_at[domain] = time.monotonic() + wait
+                    return False
+            index = queue.popleft()
+            pending[executor.submit(fetch, index, urls[index])] = (index, domain)
+            in_flight[domain] += 1
+            return True
+
+        def downloaded(index: int, future: concurrent.futures.Future) -> None:
+            try:
+                page = future.result()
+            except DownloadSkipped as e:
+                finish(index, (None, f"Skipped: {e}"))
+                return
+            except Exception as e:
+                logger.error(f"An error occurred during content extraction for URL {urls[index]}: {e}")
+                finish(index, (None, f"An error occurred: {str(e)}"))
+                return
+            if page is None:
+                finish(index, (None, "Failed to fetch or extract content"))
+            elif page.cached_text is not None:
+                finish(index, (page.cached_text, None))
+            else:
+                parsing[parse_pool.submit(extract_text, page.html)] = (index, page)
+
+        def parsed(index: int, page: DownloadedPage, future: concurrent.futures.Future) -> None:
+            try:
+                extracted_text = future.result()
+            except Exception as e:
+                logger.error(f"An error occurred while parsing URL {urls[index]}: {e}")
+                finish(index, (None, f"An error occurred: {str(e)}"))
+                return
+            if not extracted_text:
+                logger.warning(f"Failed to extract significant text from URL: {urls[index]}")
+                finish(index, (None, "Failed to fetch or extract content"))
+                return
+            _store_extracted(urls[index], page, extracted_text)
+            finish(index, (extracted_text, None))
+
+        while pending or parsing or any(queues.values()):
+            # One URL per domain per pass spreads the pool across domains
+            while any([dispatch(domain) for domain in queues]):
+                pass
+
+            # Sleep until the next booked slot at the latest; slots already due
+            # are waiting on a free thread, and a finishing fetch wakes us anyway
+            now = time.monotonic()
+            poll = min(
+                [_TIMEOUT_POLL_SECONDS] + [at - now for at in booked_at.values() if at > now]
+            )
+            if pending or parsing:
+                done, _ = concurrent.futures.wait(
+                    [*pending, *parsing], timeout=poll, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+            else:
+                done = set()
+                time.sleep(poll)
+            for future in done:
+                if future in pending:
+                    index, domain = pending.pop(future)
+                    in_flight[domain] -= 1
+                    downloaded(index, future)
+                else:
+                    parsed(*parsing.pop(future), future)
+
+            now = time.monotonic()
+            for future, (index, domain) in list(pending.items()):
+                if index in started_at and now - started_at[index] > timeout:
+                    del pending[future]
+                    in_flight[domain] -= 1
+                    logger.warning(f"Timed out after {timeout:.0f}s fetching URL: {urls[index]}")
+                    finish(index, (None, f"Timed out after {timeout:.0f} seconds"))
+    finally:
+        # Timed-out fetches are abandoned rather than waited for
+        executor.shutdown(wait=False, cancel_futures=True)
+        for future in parsing:
+            future.cancel()
+
+    return results
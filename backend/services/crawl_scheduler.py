@@ -0,0 +1,192 @@
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+from core import metrics
+from db.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CRAWL_RESPECT_ROBOTS = os.getenv("CRAWL_RESPECT_ROBOTS", "true").lower() == "true"
+# Product token matched against robots.txt User-agent lines.
+CRAWL_ROBOTS_USER_AGENT = os.getenv("CRAWL_ROBOTS_USER_AGENT", "SalesResearcher")
+CRAWL_ROBOTS_TTL_SECONDS = int(os.getenv("CRAWL_ROBOTS_TTL_SECONDS", str(24 * 3600)))
+# Unreachable or failing robots.txt files are retried sooner.
+CRAWL_ROBOTS_ERROR_TTL_SECONDS = int(os.getenv("CRAWL_ROBOTS_ERROR_TTL_SECONDS", "300"))
+CRAWL_ROBOTS_TIMEOUT_SECONDS = float(os.getenv("CRAWL_ROBOTS_TIMEOUT_SECONDS", "10"))
+# Spacing between requests to a domain that sets no Crawl-delay.
+CRAWL_DEFAULT_DELAY_SECONDS = float(os.getenv("CRAWL_DEFAULT_DELAY_SECONDS", "0.5"))
+# Longer Crawl-delays are capped, so one domain cannot hold a job for minutes.
+CRAWL_MAX_DELAY_SECONDS = float(os.getenv("CRAWL_MAX_DELAY_SECONDS", "10"))
+# Hosts kept in the ranking of time spent waiting on politeness delays.
+CRAWL_METRICS_TOP_HOSTS = int(os.getenv("CRAWL_METRICS_TOP_HOSTS", "50"))
+
+ROBOTS_KEY_PREFIX = "crawl:robots:"
+NEXT_SLOT_KEY_PREFIX = "crawl:next-slot:"
+
+# Parsed robots.txt files are also kept in process for a short while, so a
+# batch does not re-read Redis for every URL of a domain.
+_LOCAL_ROBOTS_TTL_SECONDS = 60
+
+# robots.txt answered with a server error: assume everything is disallowed
+# until it is retried (RFC 9309, section 2.3.1.4).
+_DISALLOW_ALL = "User-agent: *\nDisallow: /\n"
+
+# Books the domain's next request slot: the later of now and the slot after
+# the previous booking, then moves the next free slot ARGV[1] seconds on.
+# Returns the seconds until the booked slot. Uses the Redis clock so every
+# host agrees on the time.
+_RESERVE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local delay = tonumber(ARGV[1])
+local slot = math.max(now, tonumber(redis.call('GET', KEYS[1]) or '0'))
+redis.call('SET', KEYS[1], slot + delay, 'PX', math.ceil((slot + delay - now) * 1000) + 1000)
+return tostring(slot - now)
+"""
+
+
+class DomainPolicy(NamedTuple):
+    """What a domain's robots.txt allows, and how far apart requests must be."""
+
+    robots: Optional[RobotFileParser]
+    delay: float
+
+    def allows(self, url: str) -> bool:
+        return self.robots is None or self.robots.can_fetch(CRAWL_ROBOTS_USER_AGENT, url)
+
+
+def domain_of(url: str) -> str:
+    """The politeness domain of a URL: its scheme and host, as robots.txt applies."""
+    parts = urlsplit(url)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+
+class CrawlScheduler:
+    """
+    Politeness for page fetches, shared by every crawl worker through Redis.
+
+    Each domain's robots.txt is fetched once per TTL and cached in Redis; its
+    rules decide which URLs may be fetched and its Crawl-delay how far apart
+    requests to the domain are started. Request slots are booked cluster-wide,
+    so parallel tasks and workers together keep to a domain's delay.
+
+    Requests, the time spent waiting for slots and robots.txt refusals are
+    counted in the 'crawl_scheduler.*' metrics. The CRAWL_METRICS_TOP_HOSTS
+    hosts with the most waiting are ranked in the 'crawl_wait_seconds'
+    ranking; a counter per host would grow with every host ever crawled.
+    """
+
+    def __init__(
+        self,
+        respect_robots: bool = CRAWL_RESPECT_ROBOTS,
+        default_delay: float = CRAWL_DEFAULT_DELAY_SECONDS,
+        max_delay: float = CRAWL_MAX_DELAY_SECONDS,
+    ):
+        self.respect_robots = respect_robots
+        self.default_delay = default_delay
+        self.max_delay = max_delay
+        self._local: dict[str, tuple[float, DomainPolicy]] = {}
+        self._lock = threading.Lock()
+
+    def policy(self, domain: str) -> DomainPolicy:
+        """
+        Returns the domain's policy, reading its robots.txt from the cache or,
+        on a miss, from the domain. Blocking; may make a request.
+        """
+        if not self.respect_robots:
+            return DomainPolicy(None, self.default_delay)
+
+        with self._lock:
+            cached = self._local.get(domain)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        robots = RobotFileParser()
+        robots.parse(self._robots_txt(domain).splitlines())
+        crawl_delay = robots.crawl_delay(CRAWL_ROBOTS_USER_AGENT)
+        delay = self.default_delay if crawl_delay is None else float(crawl_delay)
+        if delay > self.max_delay:
+            logger.info(f"{domain} asks for a {delay:.0f}s crawl delay; using {self.max_delay:.0f}s.")
+            delay = self.max_delay
+        policy = DomainPolicy(robots, delay)
+
+        with self._lock:
+            self._local[domain] = (time.monotonic() + _LOCAL_ROBOTS_TTL_SECONDS, policy)
+        return policy
+
+    def _robots_txt(self, domain: str) -> str:
+        key = f"{ROBOTS_KEY_PREFIX}{domain}"
+        try:
+            cached = get_redis().get(key)
+            if cached is not None:
+                return cached
+        except Exception as e:
+            logger.warning(f"robots.txt cache lookup failed for {domain}: {e}")
+
+        # Imported here: the content extraction service imports this module
+        from services.content_extraction_service import download_capped
+
+        ttl = CRAWL_ROBOTS_TTL_SECONDS
+        try:
+            # Size and content type are capped as for pages (text/plain is allowed)
+            response, robots_txt = download_capped(
+                f"{domain}/robots.txt", CRAWL_ROBOTS_TIMEOUT_SECONDS
+            )
+            if response.status_code >= 500:
+                robots_txt, ttl = _DISALLOW_ALL, CRAWL_ROBOTS_ERROR_TTL_SECONDS
+            # 4xx: no robots.txt, and the empty body allows everything
+        except Exception as e:
+            # The pages themselves will most likely fail too; do not block them here
+            logger.warning(f"Failed to fetch robots.txt for {domain}: {e}")
+            robots_txt, ttl = "", CRAWL_ROBOTS_ERROR_TTL_SECONDS
+
+        try:
+            get_redis().set(key, robots_txt, ex=ttl)
+        except Exception as e:
+            logger.warning(f"Failed to cache robots.txt for {domain}: {e}")
+        return robots_txt
+
+    def reserve(self, domain: str, delay: float) -> float:
+        """
+        Books the domain's next request slot.
+
+        Returns:
+            The seconds until the booked slot; the request must not start
+            before then. 0 if it may start right away.
+        """
+        try:
+            wait = float(get_redis().eval(_RESERVE_SCRIPT, 1, f"{NEXT_SLOT_KEY_PREFIX}{domain}", delay))
+        except Exception as e:
+            logger.warning(f"Failed to book a crawl slot for {domain}, not waiting: {e}")
+            wait = 0.0
+        metrics.increment("crawl_scheduler.requests")
+        if wait:
+            metrics.increment("crawl_scheduler.waited_requests")
+            metrics.increment("crawl_scheduler.wait_seconds", wait)
+            metrics.increment_ranked(
+                "crawl_wait_seconds", urlsplit(domain).netloc, wait, CRAWL_METRICS_TOP_HOSTS
+            )
+        return wait
+
+    @staticmethod
+    def record_disallowed(url: str) -> None:
+        metrics.increment("crawl_scheduler.robots_disallowed")
+
+
+_crawl_scheduler: Optional[CrawlScheduler] = None
+_crawl_scheduler_lock = threading.Lock()
+
+
+def get_crawl_scheduler() -> CrawlScheduler:
+    """Returns the process-wide crawl scheduler, creating it on first use."""
+    global _crawl_scheduler
+    if _crawl_scheduler is None:
+        with _crawl_scheduler_lock:
+            if _crawl_scheduler is None:
+                _crawl_scheduler = CrawlScheduler()
+    return _crawl_scheduler
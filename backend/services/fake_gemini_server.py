@@ -0,0 +1,96 @@
+"""
+Local stand-in for the Gemini REST API, for load and latency testing without
+spending quota. Answers with StubGenerativeModel, so latency distribution,
+error and 429 injection and the canned deep dive are configured with the same
+GEMINI_STUB_* variables as the in-process stub backend.
+
+Run it, then point workers at it:
+
+    python -m services.fake_gemini_server --port 8090
+    GEMINI_BACKEND=http GEMINI_HTTP_BASE_URL=http://localhost:8090 celery -A celery_app worker ...
+"""
+import argparse
+import json
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from google.api_core import exceptions as api_exceptions
+
+from services.gemini_backends import StubGenerativeModel
+
+app = FastAPI(title="Fake Gemini API")
+
+_models: dict[str, StubGenerativeModel] = {}
+
+# REST generationConfig keys as spelled by the SDK.
+_CONFIG_KEYS = {
+    "responseMimeType": "response_mime_type",
+    "responseSchema": "response_schema",
+    "maxOutputTokens": "max_output_tokens",
+}
+
+
+def _error(status_code: int, status: str, message: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"code": status_code, "message": message, "status": status}},
+    )
+
+
+def _payload(text: str, usage) -> dict:
+    payload = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+    if usage is not None:
+        payload["usageMetadata"] = {
+            "promptTokenCount": usage.prompt_token_count,
+            "candidatesTokenCount": usage.candidates_token_count,
+            "totalTokenCount": usage.total_token_count,
+        }
+    return payload
+
+
+@app.post("/v1beta/models/{model_action}")
+async def generate(model_action: str, request: Request):
+    model_name, _, action = model_action.partition(":")
+    if action not in ("generateContent", "streamGenerateContent"):
+        raise HTTPException(status_code=404, detail=f"Unknown method '{action}'.")
+
+    body = await request.json()
+    prompt = "".join(
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    )
+    generation_config = {
+        _CONFIG_KEYS.get(key, key): value
+        for key, value in body.get("generationConfig", {}).items()
+    }
+    model = _models.setdefault(model_name, StubGenerativeModel(model_name))
+
+    try:
+        response = await model.generate_content_async(
+            prompt,
+            generation_config=generation_config,
+            stream=action == "streamGenerateContent",
+        )
+    except api_exceptions.ResourceExhausted as e:
+        return _error(429, "RESOURCE_EXHAUSTED", str(e))
+    except api_exceptions.InternalServerError as e:
+        return _error(500, "INTERNAL", str(e))
+
+    if action == "generateContent":
+        return _payload(response.text, response.usage_metadata)
+
+    async def events():
+        async for chunk in response:
+            yield f"data: {json.dumps(_payload(chunk.text, chunk.usage_metadata))}\r\n\r\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini REST API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,272 @@
+"""
+Backends GeminiService can call. "genai" is the real Gemini API through the
+google-generativeai SDK. "http" speaks the Gemini REST API to any base URL,
+such as the local stand-in server in services/fake_gemini_server.py. "stub"
+answers in process. The http and stub backends need no API key, so the
+pipeline can be load-tested offline without spending quota.
+
+Every backend's model exposes the subset of genai.GenerativeModel that
+GeminiService uses: `await generate_content_async(prompt, generation_config=None,
+stream=False)`, returning a response with `text` and `usage_metadata`, or,
+when streaming, an async iterable of such chunks.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+from types import SimpleNamespace
+from typing import Optional
+
+import google.generativeai as genai
+import httpx
+from google.api_core import exceptions as api_exceptions
+
+logger = logging.getLogger(__name__)
+
+# "genai" (default), "http" or "stub".
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "genai").lower()
+# Base URL of the Gemini REST API for the http backend.
+GEMINI_HTTP_BASE_URL = os.getenv("GEMINI_HTTP_BASE_URL", "http://localhost:8090")
+GEMINI_HTTP_TIMEOUT_SECONDS = float(os.getenv("GEMINI_HTTP_TIMEOUT_SECONDS", "600"))
+
+# Stub behaviour. Latency is "fixed:SECONDS", "uniform:MIN:MAX" or
+# "lognormal:MEDIAN:SIGMA"; rates are probabilities per call.
+GEMINI_STUB_LATENCY = os.getenv("GEMINI_STUB_LATENCY", "lognormal:2:0.6")
+GEMINI_STUB_ERROR_RATE = float(os.getenv("GEMINI_STUB_ERROR_RATE", "0"))
+GEMINI_STUB_THROTTLE_RATE = float(os.getenv("GEMINI_STUB_THROTTLE_RATE", "0"))
+GEMINI_STUB_RESPONSE_TOKENS = int(os.getenv("GEMINI_STUB_RESPONSE_TOKENS", "800"))
+GEMINI_STUB_STREAM_CHUNKS = int(os.getenv("GEMINI_STUB_STREAM_CHUNKS", "8"))
+# Seed for reproducible runs; unset draws a fresh seed per process.
+GEMINI_STUB_SEED = os.getenv("GEMINI_STUB_SEED")
+# Source URLs returned by the canned deep dive.
+GEMINI_STUB_SOURCE_URLS = os.getenv(
+    "GEMINI_STUB_SOURCE_URLS",
+    "https://example.com/,https://example.org/,https://www.iana.org/help/example-domains",
+).split(",")
+
+BACKENDS = ("genai", "http", "stub")
+
+# generation_config keys as spelled by the REST API.
+_REST_CONFIG_KEYS = {
+    "response_mime_type": "responseMimeType",
+    "response_schema": "responseSchema",
+    "max_output_tokens": "maxOutputTokens",
+}
+
+
+def _usage(prompt_tokens: int, response_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=response_tokens,
+        total_token_count=prompt_tokens + response_tokens,
+    )
+
+
+class _StreamResponse:
+    """Async iterable of response chunks; usage is known once it is exhausted."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.usage_metadata = None
+
+    async def __aiter__(self):
+        async for text, usage in self._chunks:
+            if usage is not None:
+                self.usage_metadata = usage
+            yield SimpleNamespace(text=text, usage_metadata=usage)
+
+
+class StubGenerativeModel:
+    """
+    In-process stand-in for a Gemini model. Latency follows the configured
+    distribution; calls fail with injected errors and 429s at the configured
+    rates. JSON-mode calls get an object matching their response schema, with
+    a canned prospect deep dive; other calls get filler text of the configured
+    length.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        latency: str = GEMINI_STUB_LATENCY,
+        error_rate: float = GEMINI_STUB_ERROR_RATE,
+        throttle_rate: float = GEMINI_STUB_THROTTLE_RATE,
+        seed: Optional[str] = GEMINI_STUB_SEED,
+    ):
+        self.model_name = model_name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(f"{seed}:{model_name}" if seed is not None else None)
+
+    def sample_latency(self) -> float:
+        kind, *params = self.latency.split(":")
+        values = [float(param) for param in params]
+        if kind == "fixed":
+            return values[0]
+        if kind == "uniform":
+            return self._random.uniform(values[0], values[1])
+        if kind == "lognormal":
+            return self._random.lognormvariate(math.log(values[0]), values[1])
+        raise ValueError(f"Unknown GEMINI_STUB_LATENCY distribution '{kind}'.")
+
+    def inject_failure(self) -> None:
+        """Raises an injected 429 or server error at the configured rates."""
+        roll = self._random.random()
+        if roll < self.throttle_rate:
+            raise api_exceptions.ResourceExhausted("Stub: injected quota exhaustion.")
+        if roll < self.throttle_rate + self.error_rate:
+            raise api_exceptions.InternalServerError("Stub: injected server error.")
+
+    def respond(self, prompt: str, generation_config: Optional[dict] = None) -> str:
+        """Builds the response text for a prompt."""
+        generation_config = generation_config or {}
+        if generation_config.get("response_mime_type") == "application/json":
+            schema = generation_config.get("response_schema") or {"type": "object"}
+            return json.dumps(_fake_json(schema, prompt))
+
+        words = ["Stub", "report", "for", "load", "testing."] * (GEMINI_STUB_RESPONSE_TOKENS // 5 + 1)
+        return " ".join(words[:GEMINI_STUB_RESPONSE_TOKENS])
+
+    async def generate_content_async(
+        self, prompt: str, generation_config: Optional[dict] = None, stream: bool = False
+    ):
+        latency = self.sample_latency()
+        text = self.respond(prompt, generation_config)
+        usage = _usage(len(prompt) // 4 + 1, len(text) // 4 + 1)
+
+        if not stream:
+            await asyncio.sleep(latency)
+            self.inject_failure()
+            return SimpleNamespace(text=text, usage_metadata=usage)
+
+        # Time to first chunk takes a fifth of the latency, the rest is spread
+        # over the remaining chunks
+        await asyncio.sleep(latency / 5)
+        self.inject_failure()
+        chunk_count = max(1, GEMINI_STUB_STREAM_CHUNKS)
+        chunk_size = math.ceil(len(text) / chunk_count)
+
+        async def chunks():
+            for index in range(0, len(text), chunk_size):
+                if index:
+                    await asyncio.sleep(latency * 4 / 5 / chunk_count)
+                last = index + chunk_size >= len(text)
+                yield text[index : index + chunk_size], usage if last else None
+
+        return _StreamResponse(chunks())
+
+
+def _fake_json(schema: dict, prompt: str, name: str = ""):
+    """Builds a value matching an OpenAPI-style response schema."""
+    schema_type = str(schema.get("type", "object")).lower()
+    if schema_type == "object":
+        return {
+            prop: _fake_json(prop_schema, prompt, prop)
+            for prop, prop_schema in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        if "url" in name:
+            return list(GEMINI_STUB_SOURCE_URLS)
+        return [_fake_json(schema.get("items", {"type": "string"}), prompt, name)]
+    if schema_type in ("integer", "number"):
+        return 0
+    if schema_type == "boolean":
+        return False
+    if name == "overview":
+        company = re.search(r"on the company: (.+?)\.\s", prompt)
+        company_name = company.group(1) if company else "the company"
+        return f"Stub overview of {company_name}: core business, technologies, news, people and challenges."
+    return f"Stub {name or 'value'}"
+
+
+class HttpGenerativeModel:
+    """
+    Calls a model through the Gemini REST API at GEMINI_HTTP_BASE_URL, e.g.
+    the local stand-in server. HTTP errors are raised as the matching
+    google.api_core exceptions, so a 429 is a ResourceExhausted as with genai.
+    """
+
+    def __init__(self, model_name: str, base_url: str = GEMINI_HTTP_BASE_URL):
+        self.model_name = model_name
+        model_path = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self._url = f"{base_url.rstrip('/')}/v1beta/{model_path}"
+        self._headers = {}
+        if os.getenv("GEMINI_API_KEY"):
+            self._headers["x-goog-api-key"] = os.environ["GEMINI_API_KEY"]
+        # Bound to the event loop it is first used on (the service loop)
+        self._client = httpx.AsyncClient(timeout=GEMINI_HTTP_TIMEOUT_SECONDS)
+
+    @staticmethod
+    def _body(prompt: str, generation_config: Optional[dict]) -> dict:
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if generation_config:
+            body["generationConfig"] = {
+                _REST_CONFIG_KEYS.get(key, key): value
+                for key, value in generation_config.items()
+            }
+        return body
+
+    @staticmethod
+    def _parse(payload: dict) -> tuple[str, Optional[SimpleNamespace]]:
+        text = "".join(
+            part.get("text", "")
+            for candidate in payload.get("candidates", [])[:1]
+            for part in candidate.get("content", {}).get("parts", [])
+        )
+        usage = payload.get("usageMetadata")
+        if usage:
+            usage = _usage(usage.get("promptTokenCount", 0), usage.get("candidatesTokenCount", 0))
+        return text, usage
+
+    @staticmethod
+    async def _raise_for_status(response) -> None:
+        if response.status_code >= 400:
+            await response.aread()
+            raise api_exceptions.from_http_status(
+                response.status_code, f"Gemini HTTP backend: {response.text[:500]}"
+            )
+
+    async def generate_content_async(
+        self, prompt: str, generation_config: Optional[dict] = None, stream: bool = False
+    ):
+        body = self._body(prompt, generation_config)
+        if not stream:
+            response = await self._client.post(
+                f"{self._url}:generateContent", json=body, headers=self._headers
+            )
+            await self._raise_for_status(response)
+            text, usage = self._parse(response.json())
+            return SimpleNamespace(text=text, usage_metadata=usage)
+
+        request = self._client.build_request(
+            "POST", f"{self._url}:streamGenerateContent?alt=sse", json=body, headers=self._headers
+        )
+        response = await self._client.send(request, stream=True)
+        try:
+            await self._raise_for_status(response)
+        except Exception:
+            await response.aclose()
+            raise
+
+        async def chunks():
+            try:
+                async for line in response.aiter_lines():
+                    if line.startswith("data:"):
+                        yield self._parse(json.loads(line[len("data:"):]))
+            finally:
+                await response.aclose()
+
+        return _StreamResponse(chunks())
+
+
+def create_model(backend: str, model_name: str):
+    """Creates the client for `model_name` on the given backend."""
+    if backend == "stub":
+        return StubGenerativeModel(model_name)
+    if backend == "http":
+        return HttpGenerativeModel(model_name)
+    return genai.GenerativeModel(model_name)
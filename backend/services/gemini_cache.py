@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+
+from core import metrics
+from db.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+GEMINI_CACHE_ENABLED = os.getenv("GEMINI_CACHE_ENABLED", "true").lower() == "true"
+GEMINI_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CACHE_TTL_SECONDS", str(24 * 3600)))
+GEMINI_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "10000"))
+
+CACHE_KEY_PREFIX = "gemini:cache:"
+# Sorted set of cache keys scored by last access time, used for LRU eviction.
+CACHE_INDEX_KEY = "gemini:cache-index"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalizes a prompt for cache keying. Prompts are built from indented
+    f-strings, so whitespace differences must not cause cache misses.
+    """
+    return " ".join(prompt.split())
+
+
+class GeminiResponseCache:
+    """
+    Redis-backed cache of Gemini responses, keyed by model name and a hash of
+    the normalized prompt. Entries expire after a TTL, and the least recently
+    used entries are evicted once the cache holds more than `max_entries`.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = GEMINI_CACHE_TTL_SECONDS,
+        max_entries: int = GEMINI_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    @staticmethod
+    def cache_key(model_name: str, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+        return f"{CACHE_KEY_PREFIX}{model_name}:{prompt_hash}"
+
+    def get(self, model_name: str, prompt: str) -> Optional[str]:
+        """
+        Returns the cached response text, or None on a miss. Hits and misses
+        are counted in the 'gemini_cache.hits' and 'gemini_cache.misses' metrics.
+        """
+        key = self.cache_key(model_name, prompt)
+        try:
+            redis_client = get_redis()
+            cached = redis_client.get(key)
+            if cached is not None:
+                redis_client.zadd(CACHE_INDEX_KEY, {key: time.time()})
+        except Exception as e:
+            logger.warning(f"Gemini cache lookup failed, calling the API instead: {e}")
+            return None
+
+        metrics.increment("gemini_cache.hits" if cached is not None else "gemini_cache.misses")
+        return cached
+
+    def set(self, model_name: str, prompt: str, response_text: str) -> None:
+        """Stores a response and evicts the least recently used entries over the size bound."""
+        self._store(
+            model_name, prompt, lambda pipe, key: pipe.set(key, response_text, ex=self.ttl_seconds)
+        )
+
+    def set_from_key(self, model_name: str, prompt: str, source_key: str) -> None:
+        """
+        Stores the response held in another Redis key, such as the artifact a
+        streamed report was written to. The value is copied inside Redis, so
+        the response never has to be read back into the process.
+        """
+
+        def copy(pipe, key: str) -> None:
+            pipe.copy(source_key, key, replace=True)
+            pipe.expire(key, self.ttl_seconds)
+
+        self._store(model_name, prompt, copy)
+
+    def _store(self, model_name: str, prompt: str, write) -> None:
+        """Writes an entry with `write(pipeline, key)` and indexes it for eviction."""
+        key = self.cache_key(model_name, prompt)
+        now = time.time()
+        try:
+            redis_client = get_redis()
+            pipe = redis_client.pipeline()
+            write(pipe, key)
+            pipe.zadd(CACHE_INDEX_KEY, {key: now})
+            # Entries older than the TTL have already expired; drop them from the index
+            pipe.zremrangebyscore(CACHE_INDEX_KEY, "-inf", now - self.ttl_seconds)
+            pipe.zcard(CACHE_INDEX_KEY)
+            size = pipe.execute()[-1]
+
+            if size > self.max_entries:
+                evicted = redis_client.zpopmin(CACHE_INDEX_KEY, size - self.max_entries)
+                if evicted:
+                    redis_client.delete(*(evicted_key for evicted_key, _ in evicted))
+                    metrics.increment("gemini_cache.evictions", len(evicted))
+        except Exception as e:
+            logger.warning(f"Failed to store Gemini response in cache: {e}")
+
+    def stats(self) -> dict:
+        """Returns hit/miss/eviction counters, the hit rate and the current size."""
+        counters = metrics.get_counters("gemini_cache.")
+        hits = counters.get("gemini_cache.hits", 0)
+        misses = counters.get("gemini_cache.misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("gemini_cache.evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "entries": get_redis().zcard(CACHE_INDEX_KEY),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
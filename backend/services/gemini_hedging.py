@@ -0,0 +1,171 @@
+import asyncio
+import collections
+import logging
+import math
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from core import metrics
+from db.job_store import add_job_usage, claim_job_hedge, release_job_hedge
+from services.gemini_rate_limiter import GeminiRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: a hedge is a duplicate request, so it costs extra quota.
+GEMINI_HEDGING_ENABLED = os.getenv("GEMINI_HEDGING_ENABLED", "false").lower() == "true"
+# A call still running at this percentile of recent latencies gets a hedge.
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95"))
+# Never hedge sooner than this, however fast recent calls were.
+GEMINI_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("GEMINI_HEDGE_MIN_DELAY_SECONDS", "5"))
+# Extra requests a single research job may spend on hedges.
+GEMINI_HEDGE_MAX_PER_JOB = int(os.getenv("GEMINI_HEDGE_MAX_PER_JOB", "3"))
+
+# Recent latencies kept per model, and how many are needed before hedging.
+LATENCY_WINDOW_SIZE = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+class GeminiHedger:
+    """
+    Hedges slow Gemini calls: if a call has not returned by the configured
+    percentile of the model's recent latencies, an identical request is sent
+    and whichever answers first wins; the other is cancelled. This trims the
+    tail latency that would otherwise hold up a whole research job.
+
+    Only calls made for a research job are hedged, each job being capped at
+    GEMINI_HEDGE_MAX_PER_JOB hedges, and a hedge is only sent if the rate
+    limiter has room for it right away.
+
+    Latencies are tracked per process; a worker process makes enough calls
+    for its own percentile estimate.
+    """
+
+    def __init__(
+        self,
+        rate_limiter: GeminiRateLimiter,
+        enabled: bool = GEMINI_HEDGING_ENABLED,
+        percentile: float = GEMINI_HEDGE_PERCENTILE,
+        max_per_job: int = GEMINI_HEDGE_MAX_PER_JOB,
+    ):
+        self.rate_limiter = rate_limiter
+        self.enabled = enabled
+        self.percentile = percentile
+        self.max_per_job = max_per_job
+        self._latencies: dict[str, collections.deque] = collections.defaultdict(
+            lambda: collections.deque(maxlen=LATENCY_WINDOW_SIZE)
+        )
+
+    def deadline(self, latency_key: str) -> Optional[float]:
+        """
+        Returns the seconds after which a call is hedged, or None while too few
+        latencies have been observed for `latency_key`.
+        """
+        samples = sorted(self._latencies[latency_key])
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        index = min(len(samples) - 1, math.ceil(len(samples) * self.percentile / 100) - 1)
+        return max(GEMINI_HEDGE_MIN_DELAY_SECONDS, samples[index])
+
+    def _estimated_tail_latency(self, latency_key: str, deadline: float) -> float:
+        """Mean latency of the recent calls slower than the deadline."""
+        tail = [latency for latency in self._latencies[latency_key] if latency > deadline]
+        return sum(tail) / len(tail) if tail else deadline
+
+    def _claim_hedge(
+        self, model_name: str, tokens: int, job_id: str, phase: Optional[str]
+    ) -> bool:
+        """Blocking; charges a hedge to the job's cap and the rate limiter."""
+        if not claim_job_hedge(job_id, self.max_per_job):
+            metrics.increment(f"gemini_hedging.capped.{model_name}")
+            return False
+        if self.rate_limiter.enabled and self.rate_limiter.try_acquire(model_name, tokens) > 0:
+            # The hedge is not sent, so it must not count against the job's cap
+            release_job_hedge(job_id)
+            metrics.increment(f"gemini_hedging.rate_limited.{model_name}")
+            return False
+        metrics.increment(f"gemini_hedging.hedged.{model_name}")
+        add_job_usage(job_id, phase or "other", {"hedged_calls": 1})
+        return True
+
+    async def run(
+        self,
+        request: Callable[[], Awaitable],
+        model_name: str,
+        tokens: int,
+        job_id: Optional[str] = None,
+        phase: Optional[str] = None,
+        latency_key: Optional[str] = None,
+    ):
+        """
+        Awaits `request()`, hedging it when enabled and the call runs past the
+        deadline. `request` must create a fresh request on every call.
+
+        Args:
+            request: Factory for the call's coroutine.
+            model_name: The model called, for the rate limiter and metrics.
+            tokens: Tokens to reserve for a hedge.
+            job_id: The research job the call belongs to; calls without one
+                are never hedged.
+            phase: The research phase making the call, for usage accounting.
+            latency_key: Which latency window the call belongs to; defaults to
+                the model name. Calls measured differently (e.g. time to first
+                chunk of a stream) need their own window.
+
+        Returns:
+            The first successful response.
+        """
+        latency_key = latency_key or model_name
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(request())]
+        primary = tasks[0]
+        try:
+            deadline = self.deadline(latency_key) if self.enabled and job_id else None
+            if deadline is not None:
+                done, _ = await asyncio.wait({primary}, timeout=deadline)
+                if not done and await asyncio.to_thread(
+                    self._claim_hedge, model_name, tokens, job_id, phase
+                ):
+                    tasks.append(asyncio.ensure_future(request()))
+                    winner = await self._first_success(tasks)
+                    elapsed = time.monotonic() - started
+                    # A cancelled primary still ran for `elapsed`, a lower bound of its latency
+                    self._latencies[latency_key].append(elapsed)
+                    if winner is not primary:
+                        saved = max(
+                            0.0, self._estimated_tail_latency(latency_key, deadline) - elapsed
+                        )
+                        await asyncio.to_thread(self._record_win, model_name, saved)
+                        logger.info(
+                            f"Hedged {model_name} request won after {elapsed:.1f}s "
+                            f"(deadline {deadline:.1f}s, est. {saved:.1f}s saved)."
+                        )
+                    return winner.result()
+
+            response = await primary
+            self._latencies[latency_key].append(time.monotonic() - started)
+            return response
+        finally:
+            # The loser, or every request if the caller gave up (e.g. a latency budget)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    @staticmethod
+    async def _first_success(tasks: list[asyncio.Future]) -> asyncio.Future:
+        """
+        Waits for the first of `tasks` to succeed. If all fail, returns the
+        first one so its error is raised.
+        """
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task
+        return tasks[0]
+
+    @staticmethod
+    def _record_win(model_name: str, saved: float) -> None:
+        metrics.increment(f"gemini_hedging.hedge_wins.{model_name}")
+        metrics.increment(f"gemini_hedging.latency_saved_seconds.{model_name}", saved)
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+from core import metrics
+from db.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Quota per model shared by every worker process and host. 0 disables a limit.
+GEMINI_RPM_LIMIT = int(os.getenv("GEMINI_RPM_LIMIT", "60"))
+GEMINI_TPM_LIMIT = int(os.getenv("GEMINI_TPM_LIMIT", "1000000"))
+# Output tokens reserved per call, since the response size is unknown up front.
+GEMINI_EXPECTED_OUTPUT_TOKENS = int(os.getenv("GEMINI_EXPECTED_OUTPUT_TOKENS", "2048"))
+# Adaptive backoff: a 429 halves the refill rate (down to the floor) and pauses
+# every caller; each success then restores the rate by a small step.
+GEMINI_RATE_FLOOR = float(os.getenv("GEMINI_RATE_FLOOR", "0.1"))
+GEMINI_RATE_RECOVERY_STEP = float(os.getenv("GEMINI_RATE_RECOVERY_STEP", "0.05"))
+GEMINI_BACKOFF_BASE_SECONDS = float(os.getenv("GEMINI_BACKOFF_BASE_SECONDS", "2"))
+GEMINI_BACKOFF_MAX_SECONDS = float(os.getenv("GEMINI_BACKOFF_MAX_SECONDS", "60"))
+
+BUCKET_KEY_PREFIX = "gemini:ratelimit:"
+# Longest single sleep between acquisition attempts, so callers re-check soon
+# after other processes' reservations are reconciled.
+MAX_SLEEP_SECONDS = 5.0
+
+# Refills both buckets from the elapsed time (rate scaled by the adaptive
+# multiplier), then either reserves one request and ARGV[3] tokens and returns
+# 0, or reserves nothing and returns the seconds to wait. Uses the Redis clock
+# so every host agrees on the time.
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local tokens = math.min(tonumber(ARGV[3]), tpm)
+local b = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'ts', 'mult', 'cooldown_until')
+local req = tonumber(b[1]) or rpm
+local tok = tonumber(b[2]) or tpm
+local ts = tonumber(b[3]) or now
+local mult = tonumber(b[4]) or 1
+local cooldown_until = tonumber(b[5]) or 0
+local elapsed = math.max(0, now - ts)
+req = math.min(rpm, req + elapsed * rpm * mult / 60)
+tok = math.min(tpm, tok + elapsed * tpm * mult / 60)
+local wait = math.max(0, cooldown_until - now)
+if req < 1 then wait = math.max(wait, (1 - req) * 60 / (rpm * mult)) end
+if tok < tokens then wait = math.max(wait, (tokens - tok) * 60 / (tpm * mult)) end
+if wait == 0 then
+  req = req - 1
+  tok = tok - tokens
+end
+redis.call('HSET', KEYS[1], 'requests', req, 'tokens', tok, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+# Multiplicative decrease on a 429: halves the rate multiplier and pauses all
+# callers for an exponentially growing cooldown. Returns the cooldown seconds.
+_THROTTLED_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'mult', 'strikes')
+local mult = math.max(tonumber(ARGV[1]), (tonumber(b[1]) or 1) * 0.5)
+local strikes = (tonumber(b[2]) or 0) + 1
+local cooldown = math.min(tonumber(ARGV[3]), tonumber(ARGV[2]) * 2 ^ (strikes - 1))
+redis.call('HSET', KEYS[1], 'mult', mult, 'strikes', strikes, 'cooldown_until', now + cooldown)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(cooldown)
+"""
+
+# Additive increase on success: restores the rate multiplier step by step.
+_SUCCEEDED_SCRIPT = """
+local mult = math.min(1, (tonumber(redis.call('HGET', KEYS[1], 'mult')) or 1) + tonumber(ARGV[1]))
+redis.call('HSET', KEYS[1], 'mult', mult, 'strikes', 0)
+return tostring(mult)
+"""
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Rough token count for a prompt (about four characters per token)."""
+    return len(prompt) // 4 + 1
+
+
+class GeminiRateLimiter:
+    """
+    Cluster-wide token-bucket limiter for Gemini calls, stored in Redis so that
+    every worker process and host draws from the same requests-per-minute and
+    tokens-per-minute budget of a model.
+
+    On a 429 the refill rate is halved and all callers pause; successes restore
+    it gradually (AIMD). Throughput therefore settles just under the quota
+    instead of oscillating between bursts and retry storms.
+    """
+
+    def __init__(
+        self,
+        rpm_limit: int = GEMINI_RPM_LIMIT,
+        tpm_limit: int = GEMINI_TPM_LIMIT,
+    ):
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm_limit > 0 and self.tpm_limit > 0
+
+    @staticmethod
+    def _bucket_key(model_name: str) -> str:
+        return f"{BUCKET_KEY_PREFIX}{model_name}"
+
+    def try_acquire(self, model_name: str, tokens: int) -> float:
+        """
+        Makes a single attempt to reserve one request and `tokens` tokens.
+
+        Returns:
+            0 if the reservation was made, otherwise the seconds to wait before
+            trying again.
+        """
+        return float(
+            get_redis().eval(
+                _ACQUIRE_SCRIPT,
+                1,
+                self._bucket_key(model_name),
+                self.rpm_limit,
+                self.tpm_limit,
+                tokens,
+            )
+        )
+
+    def acquire(self, model_name: str, tokens: int) -> float:
+        """
+        Blocks until one request and `tokens` tokens can be reserved.
+
+        Returns:
+            The number of seconds the caller waited.
+        """
+        if not self.enabled:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(model_name, tokens)
+            if wait == 0:
+                break
+            sleep_for = self._sleep_time(wait)
+            time.sleep(sleep_for)
+            waited += sleep_for
+
+        self._record_wait(model_name, waited)
+        return waited
+
+    async def acquire_async(self, model_name: str, tokens: int) -> float:
+        """
+        Async counterpart of acquire: waits without blocking the event loop.
+
+        Returns:
+            The number of seconds the caller waited.
+        """
+        if not self.enabled:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, model_name, tokens)
+            if wait == 0:
+                break
+            sleep_for = self._sleep_time(wait)
+            await asyncio.sleep(sleep_for)
+            waited += sleep_for
+
+        await asyncio.to_thread(self._record_wait, model_name, waited)
+        return waited
+
+    @staticmethod
+    def _sleep_time(wait: float) -> float:
+        # Jitter spreads out callers that were all told to wait the same time
+        return min(wait, MAX_SLEEP_SECONDS) * random.uniform(1.0, 1.2)
+
+    def reconcile(self, model_name: str, reserved_tokens: int, actual_tokens: int) -> None:
+        """
+        Corrects the token bucket once a call's real token usage is known. The
+        bucket may go negative, which delays the next callers accordingly.
+        """
+        if not self.enabled or actual_tokens == reserved_tokens:
+            return
+        get_redis().hincrbyfloat(
+            self._bucket_key(model_name), "tokens", reserved_tokens - actual_tokens
+        )
+
+    def on_throttled(self, model_name: str) -> float:
+        """
+        Records a 429/quota error for a model.
+
+        Returns:
+            The cooldown in seconds that every caller now waits before the next call.
+        """
+        metrics.increment(f"gemini_rate_limiter.throttled.{model_name}")
+        if not self.enabled:
+            return GEMINI_BACKOFF_BASE_SECONDS
+        cooldown = float(
+            get_redis().eval(
+                _THROTTLED_SCRIPT,
+                1,
+                self._bucket_key(model_name),
+                GEMINI_RATE_FLOOR,
+                GEMINI_BACKOFF_BASE_SECONDS,
+                GEMINI_BACKOFF_MAX_SECONDS,
+            )
+        )
+        logger.warning(
+            f"Gemini quota exceeded for {model_name}; backing off all callers for {cooldown:.1f}s."
+        )
+        return cooldown
+
+    def on_success(self, model_name: str) -> None:
+        """Records a successful call, restoring the rate after earlier throttling."""
+        if self.enabled:
+            get_redis().eval(
+                _SUCCEEDED_SCRIPT,
+                1,
+                self._bucket_key(model_name),
+                GEMINI_RATE_RECOVERY_STEP,
+            )
+
+    def _record_wait(self, model_name: str, waited: float) -> None:
+        metrics.increment(f"gemini_rate_limiter.acquired.{model_name}")
+        if waited > 0:
+            metrics.increment(f"gemini_rate_limiter.waits.{model_name}")
+            metrics.increment(f"gemini_rate_limiter.wait_seconds.{model_name}", waited)
+            logger.info(f"Waited {waited:.2f}s for Gemini rate limit on {model_name}.")
@@ -0,0 +1,77 @@
+import json
+import os
+from typing import Optional
+
+# Model used by tasks without a route.
+GEMINI_DEFAULT_MODEL = os.getenv("GEMINI_DEFAULT_MODEL", "gemini-1.5-pro-latest")
+# Flash-class model for lightweight work and latency fallbacks.
+GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-1.5-flash-latest")
+
+# Task name (as registered with Celery) -> route. A route names the model to
+# call and, optionally, a faster fallback_model that takes over when the call
+# has not answered within latency_budget_seconds.
+DEFAULT_MODEL_ROUTES = {
+    "gemini_tasks.test_gemini_api": {"model": GEMINI_FAST_MODEL},
+    "prospect_deep_dive_task": {"model": GEMINI_DEFAULT_MODEL},
+    "prospect_competitor_analysis_task": {"model": GEMINI_DEFAULT_MODEL},
+    "own_competitor_marketing_analysis_task": {"model": GEMINI_DEFAULT_MODEL},
+    "synthesize_sources_task": {"model": GEMINI_DEFAULT_MODEL},
+    # Map step of the source synthesis: many short summaries of page chunks
+    "synthesize_sources_task.map": {"model": GEMINI_FAST_MODEL},
+}
+
+
+def _load_routes() -> dict[str, dict]:
+    """
+    Builds the routing table: the defaults, overridden per task by the JSON
+    object in GEMINI_MODEL_ROUTES. A task's value is either a model name or a
+    route object, e.g.
+    {"prospect_deep_dive_task": {"model": "gemini-1.5-pro-latest",
+     "fallback_model": "gemini-1.5-flash-latest", "latency_budget_seconds": 90}}
+    """
+    routes = dict(DEFAULT_MODEL_ROUTES)
+    raw = os.getenv("GEMINI_MODEL_ROUTES")
+    if not raw:
+        return routes
+
+    try:
+        overrides = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"GEMINI_MODEL_ROUTES is not valid JSON: {e}") from e
+    for task_name, route in overrides.items():
+        if isinstance(route, str):
+            route = {"model": route}
+        if "model" not in route:
+            raise ValueError(f"GEMINI_MODEL_ROUTES entry for '{task_name}' has no 'model'.")
+        if route.get("fallback_model") and not route.get("latency_budget_seconds"):
+            raise ValueError(
+                f"GEMINI_MODEL_ROUTES entry for '{task_name}' sets a fallback_model "
+                "without a latency_budget_seconds."
+            )
+        routes[task_name] = route
+    return routes
+
+
+MODEL_ROUTES = _load_routes()
+
+
+def get_model_route(task_name: Optional[str]) -> dict:
+    """
+    Returns the route for a task: its 'model' and, when configured, the
+    'fallback_model' and 'latency_budget_seconds'. Unknown tasks use the
+    default model without a fallback.
+    """
+    return MODEL_ROUTES.get(task_name) or {"model": GEMINI_DEFAULT_MODEL}
+
+
+def model_candidates(route: dict) -> list[tuple[str, Optional[float]]]:
+    """
+    Returns the (model, latency budget) pairs to try in order. Only a model
+    that has a fallback gets a budget; the last candidate runs unbounded.
+    """
+    if route.get("fallback_model"):
+        return [
+            (route["model"], float(route["latency_budget_seconds"])),
+            (route["fallback_model"], None),
+        ]
+    return [(route["model"], None)]
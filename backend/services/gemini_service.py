@@ -1,31 +1,851 @@
+import asyncio
+import concurrent.futures
+import datetime
+import json
 import os
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional, TypeVar
+
 import google.generativeai as genai
 import logging
+from google.api_core.exceptions import ResourceExhausted
+from google.generativeai import caching
+from pydantic import BaseModel, ValidationError
+
+from core import metrics
+from db.job_store import (
+    get_job_context_cache,
+    pop_job_context_cache,
+    set_job_context_cache,
+)
+
+from services.gemini_backends import BACKENDS, GEMINI_BACKEND, create_model
+from services.gemini_cache import GEMINI_CACHE_ENABLED, GeminiResponseCache
+from services.gemini_hedging import GeminiHedger
+from services.gemini_rate_limiter import (
+    GEMINI_EXPECTED_OUTPUT_TOKENS,
+    GeminiRateLimiter,
+    estimate_tokens,
+)
+from services.gemini_routing import (
+    GEMINI_DEFAULT_MODEL,
+    get_model_route,
+    model_candidates,
+)
+from services.gemini_usage import record_call, response_token_counts
 
 logger = logging.getLogger(__name__)
 
+# Process-wide cap on Gemini calls in flight, across all callers.
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "32"))
+# Default concurrency of a single generate_many call.
+GEMINI_GENERATE_MANY_CONCURRENCY = int(os.getenv("GEMINI_GENERATE_MANY_CONCURRENCY", "8"))
+
+# Context caching: shared per-job context (company background, extracted
+# sources) is uploaded once and referenced by every phase. It needs a pinned
+# model version ("-latest" aliases cannot be cached), and Gemini rejects
+# contexts below a minimum size, which are inlined into prompts instead.
+GEMINI_CONTEXT_CACHE_MODEL = os.getenv(
+    "GEMINI_CONTEXT_CACHE_MODEL", "models/gemini-1.5-pro-001"
+)
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "32768"))
+# Upper bound on a cached context's life, in case its job never finishes.
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+
+# Streamed chunks waiting for a slow consumer; the stream pauses while the
+# buffer is full.
+GEMINI_STREAM_BUFFER_CHUNKS = int(os.getenv("GEMINI_STREAM_BUFFER_CHUNKS", "16"))
+
+# Marks the end of a response stream handed from the service loop to a caller.
+_STREAM_END = object()
+
+# OpenAPI schema keywords understood by Gemini's response_schema.
+_RESPONSE_SCHEMA_KEYS = {
+    "type",
+    "format",
+    "description",
+    "nullable",
+    "enum",
+    "properties",
+    "items",
+    "required",
+}
+
+SchemaModel = TypeVar("SchemaModel", bound=BaseModel)
+
+
+class GeminiQuotaExceededError(Exception):
+    """
+    Raised when Gemini rejects a call with a 429/quota error. `retry_after` is
+    the cluster-wide cooldown the rate limiter imposed in response.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GeminiSchemaError(ValueError):
+    """Raised when a structured response does not validate against its schema."""
+
+
+def response_schema(model: type[BaseModel]) -> dict:
+    """
+    Converts a flat pydantic model into the OpenAPI subset Gemini accepts as a
+    response_schema, dropping keywords it rejects (titles, defaults).
+    """
+
+    def strip(node: dict) -> dict:
+        schema = {}
+        for key, value in node.items():
+            if key not in _RESPONSE_SCHEMA_KEYS:
+                continue
+            if key == "type":
+                value = value.upper()  # Gemini's Type enum: STRING, ARRAY, ...
+            elif key == "properties":
+                value = {name: strip(prop) for name, prop in value.items()}
+            elif key == "items":
+                value = strip(value)
+            schema[key] = value
+        return schema
+
+    return strip(model.model_json_schema())
+
+
+def parse_json_response(text: str, model: type[SchemaModel]) -> SchemaModel:
+    """
+    Validates a JSON response into `model`. If it does not validate as is, one
+    tolerant repair pass strips Markdown code fences and any text around the
+    outermost JSON object before validating again.
+
+    Raises:
+        GeminiSchemaError: If the response does not validate even after repair.
+    """
+    try:
+        return model.model_validate_json(text)
+    except ValidationError:
+        pass
+
+    repaired = text.strip()
+    if repaired.startswith("```"):
+        repaired = repaired.split("\n", 1)[-1].rsplit("```", 1)[0]
+    start, end = repaired.find("{"), repaired.rfind("}")
+    if start != -1 and end > start:
+        repaired = repaired[start : end + 1]
+
+    try:
+        result = model.model_validate_json(repaired)
+    except ValidationError as e:
+        metrics.increment("gemini_structured_output.invalid")
+        raise GeminiSchemaError(
+            f"Gemini response does not match the {model.__name__} schema: {e}"
+        ) from e
+    metrics.increment("gemini_structured_output.repaired")
+    return result
+
 
 class GeminiService:
-    def __init__(self):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY environment variable not set.")
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(
-            "gemini-1.5-pro-latest"
-        )  # Using a general model, can be made configurable
-
-    def generate_content(self, prompt: str):
+    """
+    Gemini client with an asyncio-native core. Every call runs on one event loop
+    per process (started on first use, in a background thread), so a single
+    worker process can keep many LLM calls in flight. The blocking
+    generate_content is a thin wrapper that waits on that loop.
+    """
+
+    def __init__(self, backend: str = GEMINI_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown GEMINI_BACKEND '{backend}'; expected one of {', '.join(BACKENDS)}."
+            )
+        self.backend = backend
+        if backend == "genai":
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY environment variable not set.")
+            genai.configure(api_key=api_key)
+        else:
+            logger.info(f"GeminiService using the '{backend}' backend.")
+        # Calls pick their model from the routing table (see gemini_routing)
+        self.model_name = GEMINI_DEFAULT_MODEL
+        self.cache = GeminiResponseCache() if GEMINI_CACHE_ENABLED else None
+        self.rate_limiter = GeminiRateLimiter()
+        self.hedger = GeminiHedger(self.rate_limiter)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_pid: Optional[int] = None
+        self._loop_lock = threading.Lock()
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        # Model clients by model name, or by cached context name
+        self._models: dict = {}
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Returns the service's event loop, starting it on first use. The async
+        gRPC channel is bound to the loop it was created on, so all calls must
+        share one. Prefork workers fork after import, so the loop is restarted
+        in a child process.
+        """
+        with self._loop_lock:
+            if self._loop is None or self._loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="gemini-service-loop", daemon=True
+                ).start()
+                self._loop = loop
+                self._loop_pid = os.getpid()
+                self._in_flight = None
+        return self._loop
+
+    def _submit(self, coro) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+
+    def generate_content(
+        self,
+        prompt: str,
+        force_refresh: bool = False,
+        job_id: Optional[str] = None,
+        phase: Optional[str] = None,
+        cached_context: Optional[str] = None,
+        task_name: Optional[str] = None,
+    ):
+        """
+        Blocking wrapper around generate_content_async, for callers without an
+        event loop such as Celery tasks.
+        """
+        return self._submit(
+            self._generate(
+                prompt,
+                force_refresh,
+                job_id=job_id,
+                phase=phase,
+                cached_context=cached_context,
+                task_name=task_name,
+            )
+        ).result()
+
+    async def generate_content_async(
+        self,
+        prompt: str,
+        force_refresh: bool = False,
+        job_id: Optional[str] = None,
+        phase: Optional[str] = None,
+        cached_context: Optional[str] = None,
+        task_name: Optional[str] = None,
+    ):
+        """
+        Generates a response for `prompt`, serving it from the response cache
+        when the same model has answered the same (normalized) prompt within the
+        cache TTL. Calls to the API wait for the cluster-wide rate limiter.
+        Can be awaited from any event loop.
+
+        Args:
+            prompt: The prompt to send.
+            force_refresh: Skip the cache lookup and call the API; the fresh
+                response still replaces the cached one.
+            job_id: The research job making the call; its token and latency
+                usage is added to the job's totals.
+            phase: The research phase making the call, for usage accounting.
+            cached_context: Name of a cached context (see get_job_context) the
+                prompt refers to; the call then runs on the context's model.
+            task_name: The Celery task making the call, which selects the model
+                and latency budget from the routing table (see gemini_routing).
+
+        Raises:
+            GeminiQuotaExceededError: If Gemini answered with a 429/quota error.
+        """
+        return await asyncio.wrap_future(
+            self._submit(
+                self._generate(
+                    prompt,
+                    force_refresh,
+                    job_id=job_id,
+                    phase=phase,
+                    cached_context=cached_context,
+                    task_name=task_name,
+                )
+            )
+        )
+
+    async def generate_many(
+        self,
+        prompts: list[str],
+        concurrency: int = GEMINI_GENERATE_MANY_CONCURRENCY,
+        force_refresh: bool = False,
+        return_exceptions: bool = False,
+        job_id: Optional[str] = None,
+        phase: Optional[str] = None,
+        cached_context: Optional[str] = None,
+        task_name: Optional[str] = None,
+    ) -> list:
+        """
+        Generates responses for several prompts concurrently, with at most
+        `concurrency` of them in flight at once.
+
+        Returns:
+            The response texts in the order of `prompts`. With return_exceptions,
+            a failed prompt's slot holds its exception instead of raising.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def generate_one(prompt: str):
+            async with semaphore:
+                return await self.generate_content_async(
+                    prompt,
+                    force_refresh,
+                    job_id=job_id,
+                    phase=phase,
+                    cached_context=cached_context,
+                    task_name=task_name,
+                )
+
+        return await asyncio.gather(
+            *(generate_one(prompt) for prompt in prompts),
+            return_exceptions=return_exceptions,
+        )
+
+    def generate_many_sync(self, prompts: list[str], **kwargs) -> list:
+        """Blocking wrapper around generate_many."""
+        return self._submit(self.generate_many(prompts, **kwargs)).result()
+
+    def generate_json(
+        self,
+        prompt: str,
+        model: type[SchemaModel],
+        force_refresh: bool = False,
+        job_id: Optional[str] = None,
+        phase: Optional[str] = None,
+        task_name: Optional[str] = None,
+    ) -> SchemaModel:
+        """Blocking wrapper around generate_json_async."""
+        return self._submit(
+            self._generate_json(prompt, model, force_refresh, job_id, phase, task_name)
+        ).result()
+
+    async def generate_json_async(
+        self,
+        prompt: str,
+        model: type[SchemaModel],
+        force_refresh: bool = False,
+        job_id: Optional[str] = None,
+        phase: Optional[str] = None,
+        task_name: Optional[str] = None,
+    ) -> SchemaModel:
+        """
+        Generates a structured response: Gemini is constrained to JSON matching
+        the schema of `model`, and the response is validated into an instance
+        of it. Only responses that validate are cached.
+
+        Raises:
+            GeminiSchemaError: If the response does not match the schema.
+            GeminiQuotaExceededError: If Gemini answered with a 429/quota error.
+        """
+        return await asyncio.wrap_future(
+            self._submit(
+                self._generate_json(prompt, model, force_refresh, job_id, phase, task_name)
+            )
+        )
+
+    async def _generate_json(
+        self,
+        prompt: str,
+        model: type[SchemaModel],
+        force_refresh: bool,
+        job_id: Optional[str],
+        phase: Optional[str],
+        task_name: Optional[str],
+    ) -> SchemaModel:
+        generation_config = {
+            "response_mime_type": "application/json",
+            "response_schema": response_schema(model),
+        }
+        return await self._generate(
+            prompt,
+            force_refresh,
+            generation_config=generation_config,
+            parse=lambda text: parse_json_response(text, model),
+            job_id=job_id,
+            phase=phase,
+            task_name=task_name,
+        )
+
+    def get_job_context(self, job_id: str, context_parts: list[str]) -> Optional[str]:
+        """
+        Returns the job's cached context, creating it from `context_parts` on
+        first use. Every later phase references the same context instead of
+        re-sending it, which cuts input tokens and latency.
+
+        Returns:
+            The cached context's name, or None when the context is too small to
+            cache or caching failed; callers then inline the context instead.
+        """
+        if self.backend != "genai":
+            return None  # Context caching is a feature of the real API only
+        cache_name = get_job_context_cache(job_id)
+        if cache_name:
+            return cache_name
+        if sum(estimate_tokens(part) for part in context_parts) < GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+            return None
+
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            cached_context = caching.CachedContent.create(
+                model=GEMINI_CONTEXT_CACHE_MODEL,
+                display_name=f"research-job-{job_id}",
+                contents=context_parts,
+                ttl=datetime.timedelta(seconds=GEMINI_CONTEXT_CACHE_TTL_SECONDS),
+            )
         except Exception as e:
-            # TODO: Implement more specific error handling based on genai exceptions
-            logger.error(f"Error generating content from Gemini API: {e}")
-            raise # Re-raise the exception to be handled by the caller
+            logger.warning(f"Failed to create Gemini cached context for job {job_id}: {e}")
+            return None
+
+        if not set_job_context_cache(job_id, cached_context.name):
+            # Another phase registered one first; use theirs and drop ours
+            cached_context.delete()
+            return get_job_context_cache(job_id)
+
+        metrics.increment("gemini_context_cache.created")
+        logger.info(f"Created Gemini cached context {cached_context.name} for job {job_id}.")
+        return cached_context.name
+
+    def evict_job_context(self, job_id: str) -> None:
+        """Deletes the job's cached context, if it has one. Called when the job ends."""
+        cache_name = pop_job_context_cache(job_id)
+        if not cache_name:
+            return
+        self._models.pop(cache_name, None)
+        try:
+            caching.CachedContent.get(cache_name).delete()
+        except Exception as e:
+            # The context expires on its own after GEMINI_CONTEXT_CACHE_TTL_SECONDS
+            logger.warning(f"Failed to delete Gemini cached context {cache_name}: {e}")
+            return
+        metrics.increment("gemini_context_cache.evicted")
+
+    def _get_model(self, model_name: str, cached_context: Optional[str] = None):
+        """
+        Returns the client for a model, or for the cache's model bound to
+        `cached_context`. Clients are created once per process; creating one
+        for a cached context calls the API, so run this in a thread.
+        """
+        key = cached_context or model_name
+        model = self._models.get(key)
+        if model is None:
+            if cached_context:
+                model = genai.GenerativeModel.from_cached_content(
+                    cached_content=caching.CachedContent.get(cached_context)
+                )
+            else:
+                model = create_model(self.backend, model_name)
+            self._models[key] = model
+        return model
+
+    @staticmethod
+    def _candidates(
+        task_name: Optional[str], cached_context: Optional[str]
+    ) -> list[tuple[str, Optional[float]]]:
+        if cached_context:
+            # A cached context is bound to the model it was created for
+            return [(GEMINI_CONTEXT_CACHE_MODEL, None)]
+        return model_candidates(get_model_route(task_name))
+
+    @staticmethod
+    def _cache_prompt(
+        prompt: str, generation_config: Optional[dict], cached_context: Optional[str]
+    ) -> str:
+        """
+        The prompt a response is cached under: responses generated under a
+        config (e.g. a JSON schema) or on a cached context are cached apart.
+        """
+        if generation_config:
+            prompt = f"{prompt}\n{json.dumps(generation_config, sort_keys=True)}"
+        if cached_context:
+            prompt = f"{prompt}\n{cached_context}"
+        return prompt
+
+    def _record_fallback(
+        self, task_name: Optional[str], model_name: str, budget: float, reserved_tokens: int
+    ) -> None:
+        logger.warning(
+            f"{model_name} did not answer {task_name} within its {budget:.0f}s "
+            "latency budget; falling back to the faster model."
+        )
+        # The abandoned call's usage is never reported; give its reservation back
+        self.rate_limiter.reconcile(model_name, reserved_tokens, 0)
+        metrics.increment(f"gemini_routing.fallbacks.{task_name}")
+
+    def stream_content(
+        self,
+        prompt: str,
+        force_refresh: bool = False,
+        job_id: Optional[str] = None,
+        phase: Optional[str] = None,
+        task_name: Optional[str] = None,
+        cache_source_key: Optional[str] = None,
+        cached_context: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        Blocking generator yielding response text chunks as Gemini produces
+        them, for callers without an event loop such as Celery tasks.
+
+        Neither the service nor the generator keeps the chunks: at most
+        GEMINI_STREAM_BUFFER_CHUNKS of them wait for the caller, and the
+        stream pauses while the buffer is full. A caller that stops iterating
+        cancels the stream.
+
+        Args:
+            cache_source_key: Redis key the caller writes the full response
+                to, such as a job artifact. Once the stream has been consumed
+                the response cache is filled from it inside Redis; without it
+                streamed responses are not cached.
+            cached_context: Name of a cached context (see get_job_context) the
+                prompt refers to; the call then runs on the context's model.
+        """
+        chunks: asyncio.Queue = asyncio.Queue(GEMINI_STREAM_BUFFER_CHUNKS)
+        done = self._submit(
+            self._stream_into(
+                chunks, prompt, force_refresh, job_id, phase, task_name, cached_context
+            )
+        )
+        try:
+            while (chunk := self._submit(chunks.get()).result()) is not _STREAM_END:
+                yield chunk
+            cache_model = done.result()  # Re-raises a failure of the stream
+        finally:
+            done.cancel()  # No-op once the stream has finished
+
+        if cache_model and cache_source_key and self.cache:
+            self.cache.set_from_key(
+                cache_model, self._cache_prompt(prompt, None, cached_context), cache_source_key
+            )
+
+    async def stream_content_async(
+        self,
+        prompt: str,
+        force_refresh: bool = False,
+        job_id: Optional[str] = None,
+        phase: Optional[str] = None,
+        task_name: Optional[str] = None,
+        cache_source_key: Optional[str] = None,
+        cached_context: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Async generator yielding response text chunks as Gemini produces them.
+        Can be iterated from any event loop. Buffering, cancellation and
+        caching work as in stream_content.
+        """
+        chunks: asyncio.Queue = asyncio.Queue(GEMINI_STREAM_BUFFER_CHUNKS)
+        done = self._submit(
+            self._stream_into(
+                chunks, prompt, force_refresh, job_id, phase, task_name, cached_context
+            )
+        )
+        try:
+            while (
+                chunk := await asyncio.wrap_future(self._submit(chunks.get()))
+            ) is not _STREAM_END:
+                yield chunk
+            cache_model = await asyncio.wrap_future(done)
+        finally:
+            done.cancel()
+
+        if cache_model and cache_source_key and self.cache:
+            await asyncio.to_thread(
+                self.cache.set_from_key,
+                cache_model,
+                self._cache_prompt(prompt, None, cached_context),
+                cache_source_key,
+            )
+
+    async def _stream_into(self, chunks: asyncio.Queue, *args) -> Optional[str]:
+        """
+        Runs on the service loop: streams into the bounded `chunks` queue and
+        ends it with _STREAM_END, also after a failure, so the consumer wakes
+        up to see it. A cancelled stream has no consumer left to tell.
+        """
+        try:
+            cache_model = await self._stream(chunks.put, *args)
+        except asyncio.CancelledError:
+            raise
+        except BaseException:
+            await chunks.put(_STREAM_END)
+            raise
+        await chunks.put(_STREAM_END)
+        return cache_model
+
+    async def _stream(
+        self,
+        sink: Callable[[str], Awaitable],
+        prompt: str,
+        force_refresh: bool,
+        job_id: Optional[str] = None,
+        phase: Optional[str] = None,
+        task_name: Optional[str] = None,
+        cached_context: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Runs on the service loop, awaiting `sink` with each chunk, so a slow
+        consumer slows the stream down instead of piling chunks up. A cached
+        response is delivered as a single chunk. The response is not kept;
+        caching it is left to the caller (see stream_content).
+
+        The latency budget of the task's route applies to the first chunk: a
+        stream that has not started by then is abandoned for the fallback model.
+
+        Returns:
+            The model the response is to be cached under (the route's primary
+            model, even when its fallback answered), or None if it was served
+            from the cache.
+        """
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(GEMINI_MAX_IN_FLIGHT)
+
+        candidates = self._candidates(task_name, cached_context)
+        primary_model = candidates[0][0]
+        cache_prompt = self._cache_prompt(prompt, None, cached_context)
+
+        if self.cache and not force_refresh:
+            cached = await asyncio.to_thread(self.cache.get, primary_model, cache_prompt)
+            if cached is not None:
+                logger.info(f"Serving Gemini response for {primary_model} from cache.")
+                await asyncio.to_thread(
+                    record_call, primary_model, 0, 0, 0.0, job_id, phase, True
+                )
+                await sink(cached)
+                return None
+
+        for model_name, budget in candidates:
+            model = await asyncio.to_thread(self._get_model, model_name, cached_context)
+            reserved_tokens = estimate_tokens(prompt) + GEMINI_EXPECTED_OUTPUT_TOKENS
+            await self.rate_limiter.acquire_async(model_name, reserved_tokens)
+
+            try:
+                async with self._in_flight:
+                    started = time.monotonic()
+                    # Hedging races the streams' first chunks
+                    response, chunks = await asyncio.wait_for(
+                        self.hedger.run(
+                            lambda model=model: self._open_stream(model, prompt),
+                            model_name,
+                            reserved_tokens,
+                            job_id,
+                            phase,
+                            latency_key=f"{model_name}:first-chunk",
+                        ),
+                        budget,
+                    )
+                    async for chunk in chunks:
+                        if chunk.text:
+                            await sink(chunk.text)
+                    latency = time.monotonic() - started
+            except asyncio.TimeoutError:
+                if budget is None:
+                    raise
+                await asyncio.to_thread(
+                    self._record_fallback, task_name, model_name, budget, reserved_tokens
+                )
+                continue
+            except ResourceExhausted as e:
+                retry_after = await asyncio.to_thread(
+                    self.rate_limiter.on_throttled, model_name
+                )
+                raise GeminiQuotaExceededError(
+                    f"Gemini quota exceeded for {model_name}: {e}", retry_after
+                ) from e
+            except Exception as e:
+                logger.error(f"Error streaming content from Gemini API: {e}")
+                raise
+
+            await asyncio.to_thread(
+                self._record_success,
+                model_name,
+                primary_model,
+                cache_prompt,
+                response,
+                "",
+                reserved_tokens,
+                latency,
+                job_id,
+                phase,
+            )
+            return primary_model
+
+    @staticmethod
+    async def _open_stream(model, prompt: str):
+        """
+        Starts a streamed call and waits for its first chunk.
+
+        Returns:
+            The response and an async iterator over all of its chunks.
+        """
+        response = await model.generate_content_async(prompt, stream=True)
+        chunks = aiter(response)
+        first = await anext(chunks, None)
+
+        async def all_chunks():
+            try:
+                if first is not None:
+                    yield first
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                # Releases the connection at once if the stream is abandoned
+                await chunks.aclose()
+
+        return response, all_chunks()
+
+    async def _generate(
+        self,
+        prompt: str,
+        force_refresh: bool,
+        generation_config: Optional[dict] = None,
+        parse: Optional[Callable[[str], object]] = None,
+        job_id: Optional[str] = None,
+        phase: Optional[str] = None,
+        cached_context: Optional[str] = None,
+        task_name: Optional[str] = None,
+    ):
+        """
+        Runs on the service loop. Redis calls go to a thread to keep the loop free.
+
+        The model comes from the task's route; a call that exceeds the route's
+        latency budget is cancelled and re-issued on its fallback model. With
+        `parse`, the parsed response is returned instead of its text, and a
+        response that fails to parse is neither returned nor cached.
+        """
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(GEMINI_MAX_IN_FLIGHT)
+
+        candidates = self._candidates(task_name, cached_context)
+        primary_model = candidates[0][0]
+        cache_prompt = self._cache_prompt(prompt, generation_config, cached_context)
+
+        if self.cache and not force_refresh:
+            cached = await asyncio.to_thread(self.cache.get, primary_model, cache_prompt)
+            if cached is not None:
+                logger.info(f"Serving Gemini response for {primary_model} from cache.")
+                await asyncio.to_thread(
+                    record_call, primary_model, 0, 0, 0.0, job_id, phase, True
+                )
+                return parse(cached) if parse else cached
+
+        for model_name, budget in candidates:
+            model = await asyncio.to_thread(self._get_model, model_name, cached_context)
+            reserved_tokens = estimate_tokens(prompt) + GEMINI_EXPECTED_OUTPUT_TOKENS
+            await self.rate_limiter.acquire_async(model_name, reserved_tokens)
+
+            try:
+                async with self._in_flight:
+                    started = time.monotonic()
+                    response = await asyncio.wait_for(
+                        self.hedger.run(
+                            lambda model=model: model.generate_content_async(
+                                prompt, generation_config=generation_config
+                            ),
+                            model_name,
+                            reserved_tokens,
+                            job_id,
+                            phase,
+                        ),
+                        budget,
+                    )
+                    latency = time.monotonic() - started
+                response_text = response.text
+            except asyncio.TimeoutError:
+                if budget is None:
+                    raise
+                await asyncio.to_thread(
+                    self._record_fallback, task_name, model_name, budget, reserved_tokens
+                )
+                continue
+            except ResourceExhausted as e:
+                retry_after = await asyncio.to_thread(
+                    self.rate_limiter.on_throttled, model_name
+                )
+                raise GeminiQuotaExceededError(
+                    f"Gemini quota exceeded for {model_name}: {e}", retry_after
+                ) from e
+            except Exception as e:
+                # TODO: Implement more specific error handling based on genai exceptions
+                logger.error(f"Error generating content from Gemini API: {e}")
+                raise # Re-raise the exception to be handled by the caller
+            break
+
+        try:
+            result = parse(response_text) if parse else response_text
+        except Exception:
+            # The call itself succeeded; settle the rate limiter but cache nothing
+            await asyncio.to_thread(
+                self._record_success,
+                model_name,
+                primary_model,
+                cache_prompt,
+                response,
+                "",
+                reserved_tokens,
+                latency,
+                job_id,
+                phase,
+            )
+            raise
+
+        await asyncio.to_thread(
+            self._record_success,
+            model_name,
+            primary_model,
+            cache_prompt,
+            response,
+            response_text,
+            reserved_tokens,
+            latency,
+            job_id,
+            phase,
+        )
+        return result
+
+    def _record_success(
+        self,
+        model_name: str,
+        cache_model: str,
+        prompt: str,
+        response,
+        response_text: str,
+        reserved_tokens: int,
+        latency: float,
+        job_id: Optional[str],
+        phase: Optional[str],
+    ) -> None:
+        """
+        Settles a successful call made on `model_name`. The response is cached
+        under `cache_model`, the model cache lookups for the call use, which
+        differs from `model_name` when the call fell back.
+        """
+        self.rate_limiter.on_success(model_name)
+        prompt_tokens, response_tokens = response_token_counts(response)
+        if prompt_tokens + response_tokens:
+            self.rate_limiter.reconcile(
+                model_name, reserved_tokens, prompt_tokens + response_tokens
+            )
+        record_call(model_name, prompt_tokens, response_tokens, latency, job_id, phase)
+
+        if self.cache and response_text:
+            self.cache.set(cache_model, prompt, response_text)
+
+
+_gemini_service: Optional[GeminiService] = None
+_gemini_service_lock = threading.Lock()
+
 
+def get_gemini_service() -> GeminiService:
+    """
+    Returns the process-wide GeminiService, creating it on first use so that
+    importing this module neither configures genai nor requires an API key.
+    """
+    global _gemini_service
+    if _gemini_service is None:
+        with _gemini_service_lock:
+            if _gemini_service is None:
+                _gemini_service = GeminiService()
+    return _gemini_service
 
-gemini_service = GeminiService()
 
 if __name__ == "__main__":
     # This block is for testing purposes only and should not be run in production
@@ -34,7 +854,7 @@ if __name__ == "__main__":
     try:
         # Example usage:
         test_prompt = "What is the capital of France?"
-        response_text = gemini_service.generate_content(test_prompt)
+        response_text = get_gemini_service().generate_content(test_prompt)
         if response_text:
             print(f"Gemini API Response: {response_text}")
         else:
@@ -0,0 +1,80 @@
+import logging
+from typing import Optional
+
+from core import metrics
+from db.job_store import add_job_usage
+
+logger = logging.getLogger(__name__)
+
+# Phase recorded for calls made outside a research phase (e.g. health checks).
+UNTAGGED_PHASE = "other"
+
+
+def response_token_counts(response) -> tuple[int, int]:
+    """
+    Reads the prompt and response token counts from a Gemini response's
+    usage_metadata.
+
+    Returns:
+        (prompt_tokens, response_tokens); zeros if the response carries no usage.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    return (
+        getattr(usage, "prompt_token_count", 0) or 0,
+        getattr(usage, "candidates_token_count", 0) or 0,
+    )
+
+
+def record_call(
+    model_name: str,
+    prompt_tokens: int,
+    response_tokens: int,
+    latency_seconds: float,
+    job_id: Optional[str] = None,
+    phase: Optional[str] = None,
+    cached: bool = False,
+) -> None:
+    """
+    Records one Gemini call: exported as 'gemini_usage.*' counters per model
+    and per phase, and added to the job's usage totals when it ran for a job.
+
+    Usage must never fail the call being measured, so errors are logged and
+    swallowed.
+
+    Args:
+        model_name: The model that answered (or whose cache entry was served).
+        prompt_tokens: Input tokens billed for the call.
+        response_tokens: Output tokens billed for the call.
+        latency_seconds: Time from sending the request to the full response,
+            excluding rate limiter waits.
+        job_id: The research job the call belonged to, if any.
+        phase: The research phase that made the call, if any.
+        cached: Whether the response was served from the response cache.
+    """
+    phase = phase or UNTAGGED_PHASE
+    usage = {
+        "calls": 1,
+        "cached_calls": 1 if cached else 0,
+        "prompt_tokens": prompt_tokens,
+        "response_tokens": response_tokens,
+        "latency_seconds": latency_seconds,
+    }
+
+    for scope in (f"model.{model_name}", f"phase.{phase}"):
+        for name, amount in usage.items():
+            if amount:
+                metrics.increment(f"gemini_usage.{name}.{scope}", amount)
+
+    if job_id:
+        try:
+            add_job_usage(job_id, phase, usage)
+        except Exception as e:
+            logger.warning(f"Failed to record Gemini usage for job {job_id}: {e}")
+
+    logger.info(
+        f"Gemini call model={model_name} job={job_id} phase={phase} cached={cached} "
+        f"prompt_tokens={prompt_tokens} response_tokens={response_tokens} "
+        f"latency={latency_seconds:.2f}s"
+    )
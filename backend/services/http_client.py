@@ -0,0 +1,81 @@
+"""
+Shared HTTP client for fetching web pages. One pooled httpx.Client per worker
+process keeps connections alive between fetches, so URLs on the same host (deep
+dive sources often cluster on the prospect's own site) reuse a connection
+instead of paying DNS, TCP and TLS setup each time. HTTP/2 multiplexes
+concurrent requests to the same host over a single connection.
+"""
+import logging
+import os
+import threading
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+# Idle connections are closed after this long.
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+# Longest wait for any single read or write.
+HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "20"))
+# Longest wait for a free connection from the pool.
+HTTP_POOL_TIMEOUT_SECONDS = float(os.getenv("HTTP_POOL_TIMEOUT_SECONDS", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+HTTP_USER_AGENT = os.getenv("HTTP_USER_AGENT", "Mozilla/5.0 (compatible; SalesResearcher/1.0)")
+
+
+def create_http_client() -> httpx.Client:
+    """Creates a pooled client configured from the HTTP_* settings."""
+    http2 = HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401  (httpx needs it for HTTP/2)
+        except ImportError:
+            logger.warning("HTTP/2 needs the 'h2' package (httpx[http2]); using HTTP/1.1.")
+            http2 = False
+
+    return httpx.Client(
+        http2=http2,
+        follow_redirects=True,
+        headers={"User-Agent": HTTP_USER_AGENT},
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            HTTP_READ_TIMEOUT_SECONDS,
+            connect=HTTP_CONNECT_TIMEOUT_SECONDS,
+            pool=HTTP_POOL_TIMEOUT_SECONDS,
+        ),
+    )
+
+
+_http_client: Optional[httpx.Client] = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Returns the process-wide HTTP client, creating it on first use. The client
+    is thread-safe, so the fetch threads of a worker all share its pool.
+    """
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = create_http_client()
+    return _http_client
+
+
+def _reset_after_fork() -> None:
+    # A forked child must not share the parent's sockets; it opens its own pool
+    global _http_client, _http_client_lock
+    _http_client = None
+    _http_client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,277 @@
+"""
+Map-reduce synthesis of extracted source pages into a company brief.
+
+Extracted pages are too long to send to Gemini together, so each page is split
+into token-bounded chunks that are summarized in parallel (map). The chunk
+summaries are then merged into one brief (reduce); when they do not fit in a
+single reduce call they are first merged in groups, level by level, so the
+input of every call stays within budget however many sources a job has.
+
+Sources are numbered [S1], [S2], ... and every summary and the brief cite
+them, so each claim in the brief can be traced back to a page.
+"""
+import logging
+import os
+from typing import Optional
+
+from services.gemini_rate_limiter import estimate_tokens
+from services.gemini_service import get_gemini_service
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the source text in one map call.
+SYNTHESIS_CHUNK_TOKENS = int(os.getenv("SYNTHESIS_CHUNK_TOKENS", "6000"))
+# Chunk summaries requested from Gemini at once.
+SYNTHESIS_MAP_CONCURRENCY = int(os.getenv("SYNTHESIS_MAP_CONCURRENCY", "8"))
+# Chunks summarized per job; the rest of very long source sets is dropped,
+# so a job's map step takes at most this many calls.
+SYNTHESIS_MAX_CHUNKS = int(os.getenv("SYNTHESIS_MAX_CHUNKS", "48"))
+# Upper bound for the summaries merged in one reduce call.
+SYNTHESIS_REDUCE_INPUT_TOKENS = int(os.getenv("SYNTHESIS_REDUCE_INPUT_TOKENS", "24000"))
+
+MAP_TASK_SUFFIX = ".map"
+
+
+def chunk_markdown(text: str, max_tokens: int = SYNTHESIS_CHUNK_TOKENS) -> list[str]:
+    """
+    Splits Markdown into chunks of at most `max_tokens`, packing whole
+    paragraphs where possible. A paragraph longer than a chunk is cut at line
+    breaks, and a line longer than a chunk at the size limit.
+    """
+    max_chars = max(1, max_tokens * 4)
+    chunks: list[str] = []
+    current = ""
+
+    def pieces(paragraph: str):
+        if len(paragraph) <= max_chars:
+            yield paragraph
+            return
+        for line in paragraph.splitlines():
+            for start in range(0, len(line), max_chars):
+                yield line[start : start + max_chars]
+
+    for paragraph in text.split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        for piece in pieces(paragraph):
+            if current and estimate_tokens(f"{current}\n\n{piece}") > max_tokens:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _map_prompt(company_name: str, source: dict, chunk: str, part: int, parts: int) -> str:
+    return f"""
+    You are helping a sales team research the company: {company_name}.
+
+    Below is part {part} of {parts} of source [{source['id']}]: "{source['title']}" ({source['url']}).
+
+    Summarize what this text says that is relevant to {company_name}: its business, products,
+    technologies and cloud applications, industry, recent news, key people, and challenges or
+    pain points. Keep concrete facts, names, figures and dates. Cite the source as [{source['id']}]
+    after every fact. Do not add information that is not in the text. If nothing in the text is
+    relevant, answer only "No relevant information."
+
+    --- SOURCE TEXT ---
+    {chunk}
+    --- END SOURCE TEXT ---
+    """
+
+
+def _merge_prompt(company_name: str, summaries: list[str]) -> str:
+    joined = "\n\n---\n\n".join(summaries)
+    return f"""
+    The notes below were taken from web sources about the company: {company_name}.
+
+    Merge them into one set of notes. Combine duplicate facts, keep every distinct fact, name,
+    figure and date, and keep the [S#] source citations of every fact. Do not add information
+    that is not in the notes.
+
+    --- NOTES ---
+    {joined}
+    --- END NOTES ---
+    """
+
+
+def _brief_prompt(company_name: str, summaries: list[str]) -> str:
+    joined = "\n\n---\n\n".join(summaries)
+    return f"""
+    You are preparing a sales team for a meeting with the company: {company_name}.
+
+    Using only the source notes below, write a company brief in Markdown with these sections:
+    - Company Overview
+    - Products and Technologies (including cloud providers and applications in use)
+    - Recent News
+    - Key People
+    - Challenges and Pain Points
+    - Conversation Starters
+
+    Cite the sources of every statement with their [S#] markers. If the notes do not cover a
+    section, say so instead of guessing. Do not add a list of sources; one is appended for you.
+
+    --- NOTES ---
+    {joined}
+    --- END NOTES ---
+    """
+
+
+def _usable_sources(extracted_contents: list) -> list[dict]:
+    """Numbers the successfully extracted pages as sources S1, S2, ..."""
+    sources = []
+    for item in extracted_contents or []:
+        if item.get("status") == "success" and item.get("content"):
+            sources.append(
+                {
+                    "id": f"S{len(sources) + 1}",
+                    "url": item["url"],
+                    "title": item.get("title") or item["url"],
+                    "content": item["content"],
+                }
+            )
+    return sources
+
+
+def research_context_parts(company_name: str, overview: str, extracted_contents: list) -> list[str]:
+    """
+    Builds a job's shared research context: the deep dive's company
+    background followed by every extracted source, numbered [S1], [S2], ...
+    as in the brief.
+    """
+    parts = [
+        f"Research context for the company: {company_name}.\n\n"
+        f"## Company Background\n\n{overview or 'No background available.'}"
+    ]
+    for source in _usable_sources(extracted_contents):
+        parts.append(
+            f"## Source [{source['id']}]: {source['title']} ({source['url']})\n\n{source['content']}"
+        )
+    return parts
+
+
+def _group_for_reduce(summaries: list[str], max_tokens: int) -> list[list[str]]:
+    """Packs consecutive summaries into groups of at most `max_tokens` each."""
+    groups: list[list[str]] = []
+    group_tokens = 0
+    for summary in summaries:
+        tokens = estimate_tokens(summary)
+        if groups and group_tokens + tokens <= max_tokens:
+            groups[-1].append(summary)
+            group_tokens += tokens
+        else:
+            groups.append([summary])
+            group_tokens = tokens
+    return groups
+
+
+def _generate_all(prompts: list[str], description: str, **kwargs) -> list[str]:
+    """
+    Runs `prompts` concurrently. Failed calls are logged and left out; if
+    every call fails, the first error is raised.
+    """
+    responses = get_gemini_service().generate_many_sync(
+        prompts, concurrency=SYNTHESIS_MAP_CONCURRENCY, return_exceptions=True, **kwargs
+    )
+    errors = [response for response in responses if isinstance(response, BaseException)]
+    if errors and len(errors) == len(responses):
+        raise errors[0]
+    if errors:
+        logger.warning(f"{len(errors)} of {len(prompts)} {description} calls failed: {errors[0]}")
+    return [response for response in responses if isinstance(response, str) and response.strip()]
+
+
+def synthesize_sources(
+    company_name: str,
+    extracted_contents: list,
+    force_refresh: bool = False,
+    job_id: Optional[str] = None,
+    task_name: Optional[str] = None,
+) -> tuple[str, list[dict]]:
+    """
+    Builds a source-grounded company brief from extracted pages.
+
+    Args:
+        company_name: The prospect company the sources are about.
+        extracted_contents: Pages as returned by content extraction; failed
+            pages are skipped.
+        force_refresh: Bypass cached Gemini responses.
+        job_id: The research job, for usage accounting.
+        task_name: The calling task, for model routing. The map step is
+            routed as `<task_name>.map`, so it can use a cheaper model.
+
+    Returns:
+        (brief, sources). The brief is empty when there are no usable sources.
+        sources lists the id, url and title of every source numbered for the
+        brief.
+
+    Raises:
+        ValueError: If the summaries could not be merged because every merge
+            call returned an empty response.
+    """
+    sources = _usable_sources(extracted_contents)
+    if not sources:
+        return "", []
+
+    prompts = []
+    for source in sources:
+        chunks = chunk_markdown(source.pop("content"))
+        for part, chunk in enumerate(chunks, start=1):
+            prompts.append(_map_prompt(company_name, source, chunk, part, len(chunks)))
+    if len(prompts) > SYNTHESIS_MAX_CHUNKS:
+        logger.warning(
+            f"Synthesis for {company_name}: {len(prompts)} chunks, "
+            f"summarizing the first {SYNTHESIS_MAX_CHUNKS}."
+        )
+        prompts = prompts[:SYNTHESIS_MAX_CHUNKS]
+
+    common = {"force_refresh": force_refresh, "job_id": job_id, "phase": "synthesis"}
+    summaries = _generate_all(
+        prompts,
+        "chunk summary",
+        task_name=f"{task_name}{MAP_TASK_SUFFIX}" if task_name else None,
+        **common,
+    )
+    summaries = [summary for summary in summaries if "No relevant information." not in summary[:40]]
+    if not summaries:
+        return "", []
+
+    # A summary may take at most half a reduce call, so every merge combines
+    # at least two of them and each level shrinks the list.
+    max_summary_chars = (SYNTHESIS_REDUCE_INPUT_TOKENS // 2 - 1) * 4
+    summaries = [summary[:max_summary_chars] for summary in summaries]
+    level = 0
+    while True:
+        groups = _group_for_reduce(summaries, SYNTHESIS_REDUCE_INPUT_TOKENS)
+        if len(groups) <= 1:
+            break
+        level += 1
+        logger.info(
+            f"Synthesis for {company_name}: merging {len(summaries)} summaries "
+            f"in {len(groups)} groups (level {level})."
+        )
+        merged = _generate_all(
+            [_merge_prompt(company_name, group) for group in groups],
+            "summary merge",
+            task_name=task_name,
+            **common,
+        )
+        if not merged:
+            # Nothing left to merge; looping on would call Gemini with no prompts forever
+            raise ValueError(
+                f"Synthesis for {company_name}: every merge at level {level} came back empty."
+            )
+        summaries = [summary[:max_summary_chars] for summary in merged]
+
+    brief = get_gemini_service().generate_content(
+        _brief_prompt(company_name, summaries), task_name=task_name, **common
+    )
+    if not brief:
+        return "", []
+
+    source_list = "\n".join(
+        f"- [{source['id']}] {source['title']}: {source['url']}" for source in sources
+    )
+    return f"{brief.strip()}\n\n## Sources\n\n{source_list}\n", sources
@@ -5,7 +5,10 @@ from typing import Optional
 
 from celery.utils.log import get_task_logger
 from celery_app import celery_app
-from services.content_extraction_service import fetch_and_extract_text
+from core import metrics
+from db.job_store import publish_job_event
+from services.content_dedup import find_near_duplicates, find_url_duplicates
+from services.content_extraction_service import fetch_and_extract_many
 from markdownify import markdownify as md
 
 logger = get_task_logger(__name__)
@@ -23,55 +26,126 @@ def extract_url_content_task(
     source_urls: list[str],
     drive_folder_id: Optional[str] = None,
     user_id: Optional[str] = None,
+    job_id: Optional[str] = None,
 ):
-    from tasks.google_drive_tasks import save_extracted_content_to_gdrive_task
+    """
+    Fetches the URLs concurrently and extracts their main content; see
+    fetch_and_extract_many for the concurrency limits and per-URL timeout.
+    Variants of the same URL are fetched once, and pages whose text is a
+    near-duplicate of an earlier page are dropped; both are returned with
+    status 'duplicate' and the canonical page's URL in 'duplicate_of'.
+    Results keep the order of source_urls. This is the network-bound half of
+    content extraction; Markdown conversion runs separately in
+    convert_extracted_content_task on the CPU-bound parse queue.
+
+    If drive_folder_id and user_id are given, the conversion is dispatched with
+    them so the converted content is saved to Google Drive. If job_id is given,
+    per-URL progress is also published to the research job's events channel
+    as each URL finishes.
+    """
+    # URL variants of the same page are fetched once
+    url_duplicates = find_url_duplicates(source_urls)
+    unique_urls = [url for url, duplicate in zip(source_urls, url_duplicates) if duplicate is None]
+    total_urls = len(unique_urls)
+    completed = 0
+
+    def report(index: int, url: str, content: Optional[str], error: Optional[str]):
+        nonlocal completed
+        completed += 1
+        if error:
+            logger.warning(f"Error processing URL {url} in extract_url_content_task: {error}")
+        progress = {"current": completed, "total": total_urls, "url": url}
+        self.update_state(state="PROGRESS", meta=progress)
+        if job_id:
+            publish_job_event(job_id, {"type": "url_progress", **progress})
+
+    fetched = dict(zip(unique_urls, fetch_and_extract_many(unique_urls, on_result=report)))
+
+    # Syndicated and mirrored copies of a page are dropped after extraction
+    near_duplicates = find_near_duplicates([fetched[url][0] for url in unique_urls])
+    canonical = {
+        url: unique_urls[duplicate] if duplicate is not None else None
+        for url, duplicate in zip(unique_urls, near_duplicates)
+    }
 
     results = []
-    total_urls = len(source_urls)
+    for url, url_duplicate in zip(source_urls, url_duplicates):
+        if url_duplicate is not None:
+            first = source_urls[url_duplicate]
+            duplicate_of = canonical[first] or first
+        else:
+            duplicate_of = canonical[url]
+        content, error = (None, None) if duplicate_of else fetched[url]
+        results.append(
+            {
+                "url": url,
+                "title": None,
+                "content": content,
+                "status": "duplicate" if duplicate_of else "success" if content else "failed",
+                "error": error,
+                "duplicate_of": duplicate_of,
+            }
+        )
 
-    for index, url in enumerate(source_urls):
-        self.update_state(
-            state="PROGRESS",
-            meta={"current": index + 1, "total": total_urls, "url": url},
+    url_duplicate_count = len(source_urls) - len(unique_urls)
+    near_duplicate_count = sum(1 for duplicate in near_duplicates if duplicate is not None)
+    if url_duplicate_count or near_duplicate_count:
+        metrics.increment("content_dedup.url_duplicates", url_duplicate_count)
+        metrics.increment("content_dedup.near_duplicates", near_duplicate_count)
+        logger.info(
+            f"Dropped {url_duplicate_count} duplicate URLs and {near_duplicate_count} "
+            f"near-duplicate pages of {len(source_urls)} source URLs."
         )
-        extracted_content = None
-        extracted_title = None
-        status = "failed"
-        error = None
-
-        try:
-            content = fetch_and_extract_text(url)
-            if content:
+
+    if drive_folder_id and user_id:
+        # Chain the conversion, which saves the converted content to Google Drive
+        convert_extracted_content_task.delay(results, drive_folder_id, user_id)
+
+    return results
+
+
+@celery_app.task(bind=True)
+def convert_extracted_content_task(
+    self,
+    extracted_contents: list,
+    drive_folder_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+):
+    """
+    Converts extracted page content to Markdown and derives a title for each
+    page. CPU-bound, so it is routed to the parse queue's process pool.
+
+    If drive_folder_id and user_id are given, the converted content is then
+    saved to Google Drive.
+    """
+    from tasks.google_drive_tasks import save_extracted_content_to_gdrive_task
+
+    results = []
+    for item in extracted_contents:
+        url = item["url"]
+        content = item.get("content")
+        converted = dict(item)
+
+        if item.get("status") == "success" and content:
+            try:
                 # Attempt to parse HTML to get title and then convert to Markdown
                 if "<html" in content.lower() or "<body" in content.lower():
                     soup = BeautifulSoup(content, "html.parser")
                     title_tag = soup.find("title")
                     if title_tag:
-                        extracted_title = title_tag.get_text(strip=True)
+                        converted["title"] = title_tag.get_text(strip=True)
 
-                    markdown_content = md(content)
+                    converted["content"] = md(content)
                 else:
-                    markdown_content = content
                     # For non-HTML content, use a truncated URL as a fallback title
-                    extracted_title = urlparse(url).netloc + urlparse(url).path[:20]
-
-                extracted_content = markdown_content
-                status = "success"
-            else:
-                error = "Failed to fetch or extract content"
-        except Exception as e:
-            logger.error(f"Error processing URL {url} in extract_url_content_task: {e}", exc_info=True)
-            error = f"An error occurred: {str(e)}"
+                    converted["title"] = urlparse(url).netloc + urlparse(url).path[:20]
+            except Exception as e:
+                logger.error(f"Error converting content from URL {url}: {e}", exc_info=True)
+                converted.update(
+                    {"content": None, "status": "failed", "error": f"An error occurred: {str(e)}"}
+                )
 
-        results.append(
-            {
-                "url": url,
-                "title": extracted_title,
-                "content": extracted_content,
-                "status": status,
-                "error": error,
-            }
-        )
+        results.append(converted)
 
     if drive_folder_id and user_id:
         # Chain the task to save extracted content to Google Drive
@@ -1,19 +1,136 @@
 import logging # Changed to standard logging
+import random
+from typing import Optional
+
+from pydantic import BaseModel
+
 from celery_app import celery_app
-from services.gemini_service import gemini_service
+from db.job_store import (
+    append_artifact,
+    artifact_key,
+    clear_artifact,
+    get_artifact,
+    get_job_context_cache,
+    publish_job_event,
+)
+from services.gemini_service import GeminiQuotaExceededError, get_gemini_service
+from services.source_synthesis import research_context_parts, synthesize_sources
 from tasks.google_drive_tasks import save_text_to_gdrive_task
-import json
-import re
 
 logger = logging.getLogger(__name__) # Changed to standard logging
 
+# Base delay before retrying a failed Gemini call; doubled on every retry.
+RETRY_BASE_COUNTDOWN_SECONDS = 5
+
+# Artifact holding a job's shared research context when it is too small for,
+# or cannot use, a Gemini cached context; phases then inline it.
+JOB_CONTEXT_ARTIFACT = "context"
+
+
+def _retry_countdown(task, exc: Exception) -> float:
+    """
+    Exponential backoff with jitter for retrying a Gemini task. Quota errors
+    start from the cooldown the rate limiter imposed, so retries land after it
+    instead of piling onto an exhausted quota at the same moment.
+    """
+    base = RETRY_BASE_COUNTDOWN_SECONDS
+    if isinstance(exc, GeminiQuotaExceededError):
+        base = max(base, exc.retry_after)
+    return base * 2 ** task.request.retries * random.uniform(1.0, 1.5)
+
+
+class DeepDiveResult(BaseModel):
+    """Response schema of the prospect deep dive."""
+
+    overview: str
+    source_urls: list[str] = []
+
+
+def _with_job_context(prompt: str, job_id: Optional[str]) -> tuple[str, Optional[str]]:
+    """
+    Grounds a phase prompt in the job's shared research context (see
+    build_job_context_task), if the job has one.
+
+    Returns:
+        (prompt, cached_context). With a Gemini cached context the prompt
+        refers to it and the call must run on it; otherwise the context, if
+        any, is inlined into the prompt.
+    """
+    if not job_id:
+        return prompt, None
+
+    instruction = (
+        "Ground your answer in the research context on the company (its background and "
+        "extracted web sources), citing sources as [S#], and add your own knowledge where "
+        "it falls short."
+    )
+    cached_context = get_job_context_cache(job_id)
+    if cached_context:
+        return f"{instruction}\n{prompt}", cached_context
+
+    context = get_artifact(job_id, JOB_CONTEXT_ARTIFACT)
+    if context:
+        context = f"--- RESEARCH CONTEXT ---\n{context}\n--- END RESEARCH CONTEXT ---"
+        return f"{instruction}\n\n{context}\n{prompt}", None
+    return prompt, None
+
+
+def _generate_report(
+    prompt: str,
+    force_refresh: bool,
+    job_id: Optional[str],
+    phase: str,
+    task_name: str,
+    cached_context: Optional[str] = None,
+) -> tuple[Optional[str], int]:
+    """
+    Generates a long-form report. Within a research job the response is
+    streamed: each chunk is appended to the phase's artifact and a
+    'phase_progress' event reports the tokens received so far, so users see
+    the report while it is generated. The task never holds the whole report;
+    the response cache is filled from the artifact inside Redis and the
+    upload task reads it from there.
+
+    Returns:
+        (report, length). Within a research job the report is None, as it is
+        only in the phase's artifact.
+    """
+    if not job_id:
+        report = get_gemini_service().generate_content(
+            prompt, force_refresh=force_refresh, phase=phase, task_name=task_name
+        )
+        return report, len(report or "")
+
+    clear_artifact(job_id, phase)
+    received_chars = 0
+    for chunk in get_gemini_service().stream_content(
+        prompt,
+        force_refresh=force_refresh,
+        job_id=job_id,
+        phase=phase,
+        task_name=task_name,
+        cache_source_key=artifact_key(job_id, phase),
+        cached_context=cached_context,
+    ):
+        received_chars = append_artifact(job_id, phase, chunk)
+        publish_job_event(
+            job_id,
+            {
+                "type": "phase_progress",
+                "phase": phase,
+                "tokens_received": received_chars // 4,
+            },
+        )
+    return None, received_chars
+
+
 @celery_app.task(bind=True, name="gemini_tasks.test_gemini_api")
 def test_gemini_api(self, prompt: str):
     """
     Celery task to test the Gemini API integration.
     """
     try:
-        response_text = gemini_service.generate_content(prompt)
+        response_text = get_gemini_service().generate_content(prompt, task_name=self.name)
         if response_text:
             print(f"Gemini API Test Response: {response_text}")
             return {"status": "success", "response": response_text}
@@ -25,9 +142,45 @@ def test_gemini_api(self, prompt: str):
         return {"status": "error", "message": str(e)}
 
 
+@celery_app.task(name="gemini_tasks.evict_job_context_task", ignore_result=True)
+def evict_job_context_task(job_id: str):
+    """Deletes a finished job's Gemini cached context, if it created one."""
+    get_gemini_service().evict_job_context(job_id)
+
+
+@celery_app.task(bind=True, name="build_job_context_task")
+def build_job_context_task(self, extracted_contents: list, company_name: str, job_id: str):
+    """
+    Builds the job's shared research context from the deep dive's company
+    background and the extracted source pages, once per job. Large contexts
+    are uploaded as a Gemini cached context that later phases reference
+    instead of re-sending it; smaller ones are stored for the phases to
+    inline (see _with_job_context). The context is evicted when the job ends.
+
+    Returns:
+        `extracted_contents`, unchanged, for the synthesis that follows.
+    """
+    try:
+        parts = research_context_parts(
+            company_name, get_artifact(job_id, "deep_dive") or "", extracted_contents
+        )
+        if get_gemini_service().get_job_context(job_id, parts) is None:
+            clear_artifact(job_id, JOB_CONTEXT_ARTIFACT)
+            append_artifact(job_id, JOB_CONTEXT_ARTIFACT, "\n\n".join(parts))
+        return extracted_contents
+    except Exception as e:
+        logger.error(f"Error in build_job_context_task for {company_name}: {e}", exc_info=True)
+        raise self.retry(exc=e, countdown=_retry_countdown(self, e), max_retries=3)
+
+
 @celery_app.task(bind=True, name="prospect_deep_dive_task")
 def prospect_deep_dive_task(
-    self, company_name: str, drive_folder_id: str, user_id: str
+    self,
+    company_name: str,
+    drive_folder_id: str,
+    user_id: str,
+    force_refresh: bool = False,
+    job_id: Optional[str] = None,
 ):
     """
     Celery task to perform a "Prospect Deep Dive" using the Gemini API.
@@ -56,68 +209,28 @@ def prospect_deep_dive_task(
         Ensure the output is a valid JSON object.
         """
 
-        # 2. Call Gemini API
-        gemini_response_text = gemini_service.generate_content(prompt)
-
-        if not gemini_response_text:
-            return {
-                "company_name": company_name,
-                "drive_folder_id": drive_folder_id,
-                "user_id": user_id,
-                "overview_text": "",
-                "source_urls": [],
-                "status_message": "failed: No response from Gemini API.",
-            }
-
-        # 3. Parse Response
-        overview_text = ""
-        source_urls = []
+        # 2. Call Gemini API, constrained to the DeepDiveResult schema
+        result = get_gemini_service().generate_json(
+            prompt,
+            DeepDiveResult,
+            force_refresh=force_refresh,
+            job_id=job_id,
+            phase="deep_dive",
+            task_name=self.name,
+        )
+
+        # 3. Keep only usable URLs
+        overview_text = result.overview
+        source_urls = [
+            url.strip()
+            for url in result.source_urls
+            if url.strip().startswith(("http://", "https://"))
+        ]
         status_message = "success"
-
-        try:
-            # Attempt to parse as JSON first
-            response_json = json.loads(gemini_response_text)
-            overview_text = response_json.get("overview", "")
-            source_urls = response_json.get("source_urls", [])
-            if not isinstance(source_urls, list):
-                source_urls = []  # Ensure it's a list
-        except json.JSONDecodeError:
-            # If not a perfect JSON, try to extract using regex or string manipulation
-            status_message = "success_with_parsing_issues: Gemini response was not perfect JSON, extracted best effort."
-
-            # Attempt to extract overview text (everything before "source_urls": [)
-            overview_match = re.match(
-                r'^(.*?)(?="source_urls": \[|$)', gemini_response_text, re.DOTALL
-            )
-            if overview_match:
-                overview_text = overview_match.group(1).strip()
-                # Clean up potential JSON remnants at the end of overview
-                if overview_text.endswith('",'):
-                    overview_text = overview_text[:-2]
-                if overview_text.startswith('{"overview": "'):
-                    overview_text = overview_text[len('{"overview": "') :]
-
-            # Attempt to extract URLs using regex
-            urls_match = re.search(
-                r'"source_urls": \[\s*([^\]]+?)\s*\]', gemini_response_text, re.DOTALL
-            )
-            if urls_match:
-                urls_str = urls_match.group(1)
-                # Extract individual URLs, handling various quote types and commas
-                found_urls = re.findall(r'"(https?://[^"]+)"', urls_str)
-                source_urls = found_urls
-
-            # Fallback if no URLs found in JSON format, try to find any URLs
-            if not source_urls:
-                source_urls = re.findall(r'https?://[^\s"\']+', gemini_response_text)
-                # Filter out common non-URL strings that might match the regex broadly
-                source_urls = [
-                    url
-                    for url in source_urls
-                    if not any(
-                        ext in url for ext in [".png", ".jpg", ".gif", ".css", ".js"]
-                    )
-                ]
+        if job_id:
+            # The company background of the job's shared research context
+            clear_artifact(job_id, "deep_dive")
+            append_artifact(job_id, "deep_dive", overview_text)
 
         # 4. Call save_text_to_gdrive_task
         if overview_text:
@@ -140,7 +253,7 @@ def prospect_deep_dive_task(
 
     except Exception as e:
         logger.error(f"Error in prospect_deep_dive_task for {company_name}: {e}", exc_info=True)
-        self.retry(exc=e, countdown=5, max_retries=3)  # Example retry logic
+        self.retry(exc=e, countdown=_retry_countdown(self, e), max_retries=3)
         return {
             "company_name": company_name,
             "drive_folder_id": drive_folder_id,
@@ -153,10 +266,17 @@ def prospect_deep_dive_task(
 
 @celery_app.task(bind=True, name="prospect_competitor_analysis_task")
 def prospect_competitor_analysis_task(
-    self, company_name: str, drive_folder_id: str, user_id: str
+    self,
+    company_name: str,
+    drive_folder_id: str,
+    user_id: str,
+    force_refresh: bool = False,
+    job_id: Optional[str] = None,
 ):
     """
     Celery task to perform competitor analysis for the target prospect company using Gemini.
+    Within a research job (job_id given) the report is streamed to the job's artifact store
+    and uploaded from there.
     """
     try:
         # 1. Construct Prompt
@@ -177,10 +297,13 @@ def prospect_competitor_analysis_task(
         Present the information clearly, perhaps using bullet points or subheadings for each competitor.
         """
 
-        # 2. Call Gemini API
-        gemini_response_text = gemini_service.generate_content(prompt)
+        # 2. Call Gemini API, grounded in the job's research context
+        prompt, cached_context = _with_job_context(prompt, job_id)
+        analysis_report, report_chars = _generate_report(
+            prompt, force_refresh, job_id, "competitor_analysis", self.name, cached_context
+        )
 
-        if not gemini_response_text:
+        if not report_chars:
             return {
                 "company_name": company_name,
                 "drive_folder_id": drive_folder_id,
@@ -189,31 +312,31 @@ def prospect_competitor_analysis_task(
                 "status_message": "failed: No response from Gemini API.",
             }
 
-        # 3. Parse Response (Gemini's response is expected to be free-form text for this task)
-        analysis_report = gemini_response_text
-
-        # 4. Call save_text_to_gdrive_task
-        if analysis_report:
-            file_name = f"{company_name}_Competitor_Analysis.md"
-            save_text_to_gdrive_task.delay(
-                file_content=analysis_report,
-                file_name=file_name,
-                drive_folder_id=drive_folder_id,
-                user_id=user_id,
-            )
-
-        # 5. Return Value
+        # 3. Call save_text_to_gdrive_task; a streamed report is read from the artifact store
+        file_name = f"{company_name}_Competitor_Analysis.md"
+        save_text_to_gdrive_task.delay(
+            file_content=analysis_report,
+            company_name=company_name,
+            file_name=file_name,
+            drive_folder_id=drive_folder_id,
+            user_id=user_id,
+            job_id=job_id,
+            artifact_phase="competitor_analysis" if job_id else None,
+        )
+
+        # 4. Return Value; within a research job the report is the phase's artifact
         return {
             "company_name": company_name,
             "drive_folder_id": drive_folder_id,
             "user_id": user_id,
-            "analysis_report": analysis_report,
+            "analysis_report": analysis_report or "",
+            "report_chars": report_chars,
             "status_message": "success",
         }
 
     except Exception as e:
         logger.error(f"Error in prospect_competitor_analysis_task for {company_name}: {e}", exc_info=True)
-        self.retry(exc=e, countdown=5, max_retries=3)  # Example retry logic
+        self.retry(exc=e, countdown=_retry_countdown(self, e), max_retries=3)
         return {
             "company_name": company_name,
             "drive_folder_id": drive_folder_id,
@@ -230,9 +353,13 @@ def own_competitor_marketing_analysis_task(
     prospect_company_industry: str,
     drive_folder_id: str,
     user_id: str,
+    force_refresh: bool = False,
+    job_id: Optional[str] = None,
 ):
     """
     Celery task to analyze how Palo Alto Networks' competitors are targeting the prospect company's market segment.
+    Within a research job (job_id given) the report is streamed to the job's artifact store
+    and uploaded from there.
     """
     try:
         # Define Palo Alto Networks' key competitors for focused analysis
@@ -269,10 +396,13 @@ def own_competitor_marketing_analysis_task(
         The report should be well-structured, easy to read, and provide actionable insights.
         """
 
-        # 2. Call Gemini API
-        gemini_response_text = gemini_service.generate_content(prompt)
+        # 2. Call Gemini API, grounded in the job's research context
+        prompt, cached_context = _with_job_context(prompt, job_id)
+        analysis_report, report_chars = _generate_report(
+            prompt, force_refresh, job_id, "own_marketing_analysis", self.name, cached_context
+        )
 
-        if not gemini_response_text:
+        if not report_chars:
             return {
                 "prospect_company_name": prospect_company_name,
                 "drive_folder_id": drive_folder_id,
@@ -281,31 +411,31 @@ def own_competitor_marketing_analysis_task(
                 "status_message": "failed: No response from Gemini API.",
             }
 
-        # 3. Parse Response (Gemini's response is expected to be free-form text for this task)
-        analysis_report = gemini_response_text
-
-        # 4. Call save_text_to_gdrive_task
-        if analysis_report:
-            file_name = f"{prospect_company_name}_Own_Competitive_Marketing_Analysis.md"
-            save_text_to_gdrive_task.delay(
-                file_content=analysis_report,
-                file_name=file_name,
-                drive_folder_id=drive_folder_id,
-                user_id=user_id,
-            )
-
-        # 5. Return Value
+        # 3. Call save_text_to_gdrive_task; a streamed report is read from the artifact store
+        file_name = f"{prospect_company_name}_Own_Competitive_Marketing_Analysis.md"
+        save_text_to_gdrive_task.delay(
+            file_content=analysis_report,
+            company_name=prospect_company_name,
+            file_name=file_name,
+            drive_folder_id=drive_folder_id,
+            user_id=user_id,
+            job_id=job_id,
+            artifact_phase="own_marketing_analysis" if job_id else None,
+        )
+
+        # 4. Return Value; within a research job the report is the phase's artifact
         return {
             "prospect_company_name": prospect_company_name,
             "drive_folder_id": drive_folder_id,
             "user_id": user_id,
-            "analysis_report": analysis_report,
+            "analysis_report": analysis_report or "",
+            "report_chars": report_chars,
             "status_message": "success",
         }
 
     except Exception as e:
         logger.error(f"Error in own_competitor_marketing_analysis_task for {prospect_company_name}: {e}", exc_info=True)
-        self.retry(exc=e, countdown=5, max_retries=3)  # Example retry logic
+        self.retry(exc=e, countdown=_retry_countdown(self, e), max_retries=3)
         return {
             "prospect_company_name": prospect_company_name,
             "drive_folder_id": drive_folder_id,
@@ -313,3 +443,73 @@ def own_competitor_marketing_analysis_task(
             "analysis_report": "",
             "status_message": f"error: {str(e)}",
         }
+
+
+@celery_app.task(bind=True, name="synthesize_sources_task")
+def synthesize_sources_task(
+    self,
+    extracted_contents: list,
+    company_name: str,
+    drive_folder_id: str,
+    user_id: str,
+    force_refresh: bool = False,
+    job_id: Optional[str] = None,
+):
+    """
+    Celery task that condenses the pages extracted from the deep dive's source
+    URLs into a source-grounded company brief (map-reduce over page chunks,
+    see services/source_synthesis.py). Within a research job the brief is also
+    stored as the phase's artifact.
+    """
+    try:
+        brief, sources = synthesize_sources(
+            company_name,
+            extracted_contents,
+            force_refresh=force_refresh,
+            job_id=job_id,
+            task_name=self.name,
+        )
+
+        if not brief:
+            logger.warning(f"No extracted content to synthesize for {company_name}.")
+            return {
+                "company_name": company_name,
+                "drive_folder_id": drive_folder_id,
+                "user_id": user_id,
+                "brief": "",
+                "source_count": 0,
+                "status_message": "skipped: No extracted content to synthesize.",
+            }
+
+        if job_id:
+            clear_artifact(job_id, "synthesis")
+            append_artifact(job_id, "synthesis", brief)
+
+        save_text_to_gdrive_task.delay(
+            file_content=brief,
+            company_name=company_name,
+            drive_folder_id=drive_folder_id,
+            user_id=user_id,
+            file_name=f"{company_name}_Source_Brief.md",
+        )
+
+        return {
+            "company_name": company_name,
+            "drive_folder_id": drive_folder_id,
+            "user_id": user_id,
+            "brief": brief,
+            "source_count": len(sources),
+            "status_message": "success",
+        }
+
+    except Exception as e:
+        logger.error(f"Error in synthesize_sources_task for {company_name}: {e}", exc_info=True)
+        self.retry(exc=e, countdown=_retry_countdown(self, e), max_retries=3)
+        return {
+            "company_name": company_name,
+            "drive_folder_id": drive_folder_id,
+            "user_id": user_id,
+            "brief": "",
+            "source_count": 0,
+            "status_message": f"error: {str(e)}",
+        }
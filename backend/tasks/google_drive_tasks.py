@@ -1,6 +1,8 @@
 from celery_app import celery_app  # Import celery_app
+from db.job_store import get_artifact
 from services.google_drive_service import upload_text_file
 import logging
+from typing import Optional
 from googleapiclient.errors import HttpError
 
 logger = logging.getLogger(__name__)
@@ -10,7 +12,14 @@ logger = logging.getLogger(__name__)
     bind=True, max_retries=3, default_retry_delay=300
 )  # Use celery_app.task
 def save_text_to_gdrive_task(
-    self, file_content: str, company_name: str, drive_folder_id: str, user_id: str
+    self,
+    file_content: Optional[str],
+    company_name: str,
+    drive_folder_id: str,
+    user_id: str,
+    file_name: Optional[str] = None,
+    job_id: Optional[str] = None,
+    artifact_phase: Optional[str] = None,
 ):
     """
     Celery task to save text content (e.g., prospect overview) to Google Drive.
@@ -20,8 +29,20 @@ def save_text_to_gdrive_task(
         company_name: The name of the company, used for file naming.
         drive_folder_id: The Google Drive folder ID where the file should be saved.
         user_id: The ID of the user whose Google Drive to access for credentials.
+        file_name: The file name; defaults to the company's prospect overview.
+        job_id: (Optional) The research job whose artifact holds the content.
+        artifact_phase: (Optional) Read the content from this phase's artifact
+            of `job_id` instead of `file_content`, so long streamed reports are
+            not passed through the broker.
     """
-    file_name = f"{company_name}_Prospect_Overview.md"
+    file_name = file_name or f"{company_name}_Prospect_Overview.md"
+    if artifact_phase:
+        file_content = get_artifact(job_id, artifact_phase)
+        if file_content is None:
+            logger.warning(
+                f"Artifact '{artifact_phase}' of job {job_id} has expired; not uploading '{file_name}'."
+            )
+            return {"status": "skipped", "file_name": file_name}
     try:
         logger.info(
             f"Attempting to upload '{file_name}' for user {user_id} to folder {drive_folder_id}"
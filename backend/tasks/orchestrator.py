@@ -1,120 +1,431 @@
+import os
+import time
+from typing import Optional
+
+from celery import chain, chord, group
 from celery.utils.log import get_task_logger
 
 from celery_app import celery_app
+from db.batch_store import claim_batch_slots, release_batch_slot
+from db.job_store import (
+    FAILURE,
+    PROGRESS,
+    RESEARCH_PHASES,
+    SUCCESS,
+    create_job,
+    describe_progress,
+    finish_job,
+    get_checkpoints,
+    get_job,
+    get_job_context_cache,
+    save_checkpoint,
+    set_phase_state,
+)
 from tasks.gemini_tasks import (
+    build_job_context_task,
+    evict_job_context_task,
     prospect_deep_dive_task,
     prospect_competitor_analysis_task,
     own_competitor_marketing_analysis_task,
+    synthesize_sources_task,
+)
+from tasks.content_extraction import (
+    convert_extracted_content_task,
+    extract_url_content_task,
 )
-from tasks.content_extraction import extract_url_content_task
-from tasks.google_drive_tasks import save_extracted_content_to_gdrive_task
 
 logger = get_task_logger(__name__)
 
+# "event" dispatches the research DAG and returns immediately; phase callbacks
+# drive the job's state machine in Redis. "blocking" additionally keeps the
+# orchestrator running until the job finishes, mirroring progress into its own
+# task state. Blocking mode holds a worker slot for the whole job.
+ORCHESTRATION_MODE = os.getenv("RESEARCH_ORCHESTRATION_MODE", "event")
+# How often a blocking orchestrator checks the job state for finished phases.
+WORKFLOW_POLL_INTERVAL_SECONDS = float(os.getenv("WORKFLOW_POLL_INTERVAL_SECONDS", "2"))
+# Upper bound for a blocking orchestrator's wait on the research DAG.
+WORKFLOW_TIMEOUT_SECONDS = int(os.getenv("WORKFLOW_TIMEOUT_SECONDS", "1800"))
 
-@celery_app.task(bind=True, name="research_orchestrator_task")
-def research_orchestrator_task(
-    self, user_id: str, company_name: str, gdrive_folder_id: str
-):
+# Whether the competitor phases wait for content extraction to be grounded in
+# the job's shared research context (company background and extracted
+# sources). Off by default: they then run in parallel with the deep dive, and
+# a job takes as long as its slowest branch rather than the sum of its phases.
+RESEARCH_SHARED_CONTEXT = os.getenv("RESEARCH_SHARED_CONTEXT", "false").lower() == "true"
+
+# Phases that reference the shared research context.
+CONTEXT_PHASES = ["competitor_analysis", "own_marketing_analysis"]
+
+# Phases that start as soon as the keyed phase completes.
+PHASE_DEPENDENTS = {
+    "deep_dive": ["content_extraction"],
+    "content_extraction": ["synthesis"] + (CONTEXT_PHASES if RESEARCH_SHARED_CONTEXT else []),
+}
+
+
+def _result_link(gdrive_folder_id: str) -> str:
+    return f"https://drive.google.com/drive/folders/{gdrive_folder_id}"
+
+
+def _finish_job(job_id: str, state: str, **fields) -> bool:
     """
-    Orchestrates the entire research workflow, chaining Celery tasks.
+    Finishes a job, evicts its Gemini cached context and, for batch jobs,
+    hands its concurrency slot to the next queued job of the batch.
     """
-    self.update_state(
-        state="PROGRESS", meta={"current_phase": "Starting research workflow..."}
-    )
-    logger.info(
-        f"Starting research orchestration for company: {company_name}, user: {user_id}"
-    )
+    if not finish_job(job_id, state, **fields):
+        return False
 
-    try:
-        # Phase 1: Prospect Deep Dive
-        self.update_state(
-            state="PROGRESS", meta={"current_phase": "Phase 1: Prospect Deep Dive"}
-        )
-        logger.info("Initiating Prospect Deep Dive task...")
-        deep_dive_result = prospect_deep_dive_task.delay(company_name, gdrive_folder_id, user_id).get(
-            timeout=600
+    if get_job_context_cache(job_id):
+        evict_job_context_task.delay(job_id)
+
+    job = get_job(job_id)
+    if job and job.get("batch_id"):
+        release_batch_slot(job["batch_id"])
+        schedule_batch_jobs_task.delay(job["batch_id"])
+    return True
+
+
+@celery_app.task(name="schedule_batch_jobs_task")
+def schedule_batch_jobs_task(batch_id: str):
+    """
+    Dispatches queued research jobs of a batch while it has free concurrency
+    slots. Runs when the batch is created and whenever one of its jobs finishes.
+    """
+    job_ids = claim_batch_slots(batch_id)
+    for job_id in job_ids:
+        job = get_job(job_id)
+        if job is None:
+            logger.warning(f"Batch {batch_id}: job {job_id} state expired, skipping.")
+            release_batch_slot(batch_id)
+            continue
+        research_orchestrator_task.apply_async(
+            args=(job["user_id"], job["company_name"], job["gdrive_folder_id"]),
+            task_id=job_id,
         )
-        logger.info(f"Prospect Deep Dive completed. Result: {deep_dive_result}")
+    if job_ids:
+        logger.info(f"Batch {batch_id}: dispatched {len(job_ids)} research jobs.")
+    return job_ids
 
-        # Phase 2: Prospect Competitor Analysis
-        self.update_state(
-            state="PROGRESS",
-            meta={"current_phase": "Phase 2: Prospect Competitor Analysis"},
+
+@celery_app.task(bind=True, name="extract_deep_dive_sources_task")
+def extract_deep_dive_sources_task(
+    self,
+    deep_dive_result: dict,
+    gdrive_folder_id: str,
+    user_id: str,
+    job_id: Optional[str] = None,
+):
+    """
+    Bridges the deep dive into content extraction: replaces itself with the
+    fetch (crawl queue) and conversion (parse queue) of the deep dive's source
+    URLs. The conversion saves the content to Google Drive.
+    """
+    source_urls = []
+    if deep_dive_result and isinstance(deep_dive_result, dict):
+        source_urls = deep_dive_result.get("source_urls", [])
+
+    if not source_urls:
+        logger.warning("No source URLs found from deep dive to extract content.")
+        return []
+
+    logger.info(f"Extracting content from {len(source_urls)} URLs: {source_urls}")
+    raise self.replace(
+        chain(
+            extract_url_content_task.s(source_urls=source_urls, job_id=job_id),
+            convert_extracted_content_task.s(
+                drive_folder_id=gdrive_folder_id, user_id=user_id
+            ),
         )
-        logger.info("Initiating Prospect Competitor Analysis task...")
-        competitor_analysis_result = prospect_competitor_analysis_task.delay(
-            company_name, gdrive_folder_id, user_id
-        ).get(timeout=600)
+    )
+
+
+@celery_app.task(name="research_phase_completed_task")
+def research_phase_completed_task(phase_result, job_id: str, phase: str):
+    """
+    Link callback for a finished research phase. Records the transition and
+    marks the phases that were waiting on it as running.
+    """
+    logger.info(f"Research job {job_id}: phase '{phase}' completed.")
+    save_checkpoint(job_id, phase, phase_result)
+    set_phase_state(job_id, phase, SUCCESS)
+    for dependent in PHASE_DEPENDENTS.get(phase, []):
+        set_phase_state(job_id, dependent, PROGRESS)
+
+
+@celery_app.task(name="research_phase_failed_task")
+def research_phase_failed_task(request, exc, traceback, job_id: str, phase: str):
+    """
+    Errback for a research phase that failed after exhausting its retries.
+    """
+    logger.error(f"Research job {job_id}: phase '{phase}' failed: {exc}")
+    set_phase_state(job_id, phase, FAILURE)
+    _finish_job(job_id, FAILURE, error=f"{phase} failed: {exc}")
+
+
+@celery_app.task(name="research_workflow_completed_task")
+def research_workflow_completed_task(phase_results: list, job_id: str):
+    """
+    Chord callback that runs once every phase of the research DAG has finished.
+    """
+    job = get_job(job_id)
+    if job is None:
+        logger.warning(f"Research job {job_id} state expired before completion.")
+        return None
+
+    result_link = _result_link(job["gdrive_folder_id"])
+    if _finish_job(job_id, SUCCESS, result_link=result_link):
         logger.info(
-            f"Prospect Competitor Analysis completed. Result: {competitor_analysis_result}"
+            f"Research orchestration completed successfully for company: {job['company_name']}. Google Drive link: {result_link}"
         )
+    return {"status": SUCCESS, "result_link": result_link}
 
-        # Phase 3: Own Competitor Marketing Analysis
-        self.update_state(
-            state="PROGRESS",
-            meta={"current_phase": "Phase 3: Own Competitor Marketing Analysis"},
+
+@celery_app.task(name="research_workflow_failed_task")
+def research_workflow_failed_task(request, exc, traceback, job_id: str):
+    """
+    Errback for the chord callback, fired when any phase of the DAG fails.
+    """
+    if _finish_job(job_id, FAILURE, error=str(exc)):
+        logger.error(f"Research job {job_id} failed: {exc}")
+
+
+def _phase(signature, job_id: str, phase: str):
+    """Attaches the state machine callbacks for `phase` to a phase signature."""
+    return signature.set(
+        link=research_phase_completed_task.s(job_id, phase),
+        link_error=research_phase_failed_task.s(job_id, phase),
+    )
+
+
+def build_research_workflow(
+    job_id: str,
+    user_id: str,
+    company_name: str,
+    gdrive_folder_id: str,
+    checkpoints: Optional[dict] = None,
+    force_refresh: bool = False,
+):
+    """
+    Builds the research dependency graph as a Celery canvas.
+
+    Content extraction waits on the deep dive that produces its source URLs,
+    and the synthesis of the extracted pages waits on content extraction.
+    With RESEARCH_SHARED_CONTEXT, the job's research context is then built
+    once from the deep dive's background and the extracted pages, and the
+    synthesis and both competitor phases run in parallel on top of it.
+    Otherwise the competitor phases need nothing and run in parallel with the
+    deep dive from the start. The chord callback finishes the job once every
+    branch is done; no task ever blocks waiting on another.
+
+    Phases with a checkpoint are left out of the graph. A checkpointed phase
+    feeds its saved result straight into the phase that depends on it.
+    force_refresh makes the Gemini phases bypass cached responses.
+    """
+    checkpoints = checkpoints or {}
+    # TODO: The own_competitor_marketing_analysis_task expects prospect_company_industry.
+    # This is not currently available in the orchestrator.
+    # For now, passing a placeholder. This needs to be addressed.
+    placeholder_industry = "Unknown Industry"
+    header = []
+
+    context_phases = []
+    if "competitor_analysis" not in checkpoints:
+        context_phases.append(
+            _phase(
+                prospect_competitor_analysis_task.si(
+                    company_name,
+                    gdrive_folder_id,
+                    user_id,
+                    force_refresh=force_refresh,
+                    job_id=job_id,
+                ),
+                job_id,
+                "competitor_analysis",
+            )
         )
-        logger.info("Initiating Own Competitor Marketing Analysis task...")
-        # TODO: The own_competitor_marketing_analysis_task expects prospect_company_industry.
-        # This is not currently available in the orchestrator.
-        # For now, passing a placeholder. This needs to be addressed.
-        placeholder_industry = "Unknown Industry"
-        own_marketing_analysis_result = own_competitor_marketing_analysis_task.delay(
-            company_name, placeholder_industry, gdrive_folder_id, user_id
-        ).get(timeout=600)
-        logger.info(
-            f"Own Competitor Marketing Analysis completed. Result: {own_marketing_analysis_result}"
+    if "own_marketing_analysis" not in checkpoints:
+        context_phases.append(
+            _phase(
+                own_competitor_marketing_analysis_task.si(
+                    company_name,
+                    placeholder_industry,
+                    gdrive_folder_id,
+                    user_id,
+                    force_refresh=force_refresh,
+                    job_id=job_id,
+                ),
+                job_id,
+                "own_marketing_analysis",
+            )
         )
+    if not RESEARCH_SHARED_CONTEXT:
+        header.extend(context_phases)
+        context_phases = []
 
-        # Phase 4: Extract URL Content (Example - assuming deep_dive_result contains URLs)
-        # In a real scenario, you'd parse URLs from previous results or a dedicated source
-        self.update_state(
-            state="PROGRESS", meta={"current_phase": "Phase 4: Extracting URL Content"}
-        )
-        logger.info("Initiating URL Content Extraction task...")
-        source_urls_from_deep_dive = []
-        if deep_dive_result and isinstance(deep_dive_result, dict):
-            source_urls_from_deep_dive = deep_dive_result.get("source_urls", [])
-
-        if not source_urls_from_deep_dive:
-            logger.warning("No source URLs found from deep dive to extract content.")
-            extracted_content_results = []
+    # Deep dive -> content extraction -> [context ->] synthesis (and the
+    # context phases), resumed after the last checkpointed step, which feeds
+    # its saved result into the next one.
+    source_branch = []
+    if "content_extraction" not in checkpoints:
+        if "deep_dive" in checkpoints:
+            source_branch.append(
+                _phase(
+                    extract_deep_dive_sources_task.si(
+                        checkpoints["deep_dive"], gdrive_folder_id, user_id, job_id
+                    ),
+                    job_id,
+                    "content_extraction",
+                )
+            )
         else:
-            logger.info(f"Extracting content from {len(source_urls_from_deep_dive)} URLs: {source_urls_from_deep_dive}")
-            # The extract_url_content_task expects a list of URLs and processes them internally.
-            # We call it once with all URLs.
-            extracted_content_results = extract_url_content_task.delay(
-                source_urls=source_urls_from_deep_dive,
-                # Pass drive_folder_id and user_id if the task is to save directly.
-                # Current design: orchestrator saves after this task.
-                # drive_folder_id=gdrive_folder_id,
-                # user_id=user_id
-            ).get(timeout=300 * len(source_urls_from_deep_dive)) # Adjust timeout based on number of URLs
+            source_branch.append(
+                _phase(
+                    prospect_deep_dive_task.si(
+                        company_name,
+                        gdrive_folder_id,
+                        user_id,
+                        force_refresh=force_refresh,
+                        job_id=job_id,
+                    ),
+                    job_id,
+                    "deep_dive",
+                )
+            )
+            source_branch.append(
+                _phase(
+                    extract_deep_dive_sources_task.s(gdrive_folder_id, user_id, job_id),
+                    job_id,
+                    "content_extraction",
+                )
+            )
 
-        logger.info(
-            f"URL Content Extraction completed. Results: {extracted_content_results}"
-        )
+    def on_extracted_pages(task, *args, **kwargs):
+        # Takes the extracted pages from the step before, or from the checkpoint
+        if source_branch:
+            return task.s(*args, **kwargs)
+        return task.si(checkpoints["content_extraction"], *args, **kwargs)
 
-        # Phase 5: Save Extracted Content to Google Drive
-        self.update_state(
-            state="PROGRESS",
-            meta={"current_phase": "Phase 5: Saving Content to Google Drive"},
+    if context_phases:
+        source_branch.append(on_extracted_pages(build_job_context_task, company_name, job_id))
+    followers = list(context_phases)
+    if "synthesis" not in checkpoints:
+        followers.insert(
+            0,
+            _phase(
+                on_extracted_pages(
+                    synthesize_sources_task,
+                    company_name,
+                    gdrive_folder_id,
+                    user_id,
+                    force_refresh=force_refresh,
+                    job_id=job_id,
+                ),
+                job_id,
+                "synthesis",
+            ),
         )
-        logger.info("Initiating Save Extracted Content to Google Drive task...")
-        # Assuming extracted_content_results is a list of dicts with 'url' and 'content'
-        for item in extracted_content_results:
-            file_name = f"{company_name}_{item['url'].replace('https://', '').replace('/', '_')}.txt"
-            # Ensure item['content'] is not None before saving
-            if item.get("content"):
-                save_extracted_content_to_gdrive_task.delay(
-                    item["content"], file_name, gdrive_folder_id, user_id # Corrected argument order
-                ).get(timeout=300)
-            else:
-                logger.warning(f"Skipping save for {file_name} as content is missing.")
-        logger.info("Saving Extracted Content to Google Drive completed.")
-
-        result_link = f"https://drive.google.com/drive/folders/{gdrive_folder_id}"
+    if len(followers) > 1:
+        source_branch.append(group(followers))
+    elif followers:
+        source_branch.append(followers[0])
+    if source_branch:
+        header.append(chain(*source_branch))
+
+    body = research_workflow_completed_task.s(job_id).on_error(
+        research_workflow_failed_task.s(job_id)
+    )
+    if not header:
+        # Every phase is checkpointed; only the completion step is left.
+        return body.clone(args=([],))
+    return chord(header, body)
+
+
+def _wait_for_job(task, job_id: str) -> dict:
+    """
+    Blocking mode: polls the job state until it finishes, mirroring progress
+    into the orchestrator's own task state.
+    """
+    deadline = time.monotonic() + WORKFLOW_TIMEOUT_SECONDS
+    last_phase = None
+    while True:
+        job = get_job(job_id)
+        if job is None:
+            raise RuntimeError(f"Research job {job_id} state disappeared.")
+        if job["status"] in (SUCCESS, FAILURE):
+            return job
+        if time.monotonic() > deadline:
+            raise TimeoutError(
+                f"Research workflow did not finish within {WORKFLOW_TIMEOUT_SECONDS} seconds."
+            )
+        current_phase = describe_progress(job)
+        if current_phase != last_phase:
+            task.update_state(state="PROGRESS", meta={"current_phase": current_phase})
+            last_phase = current_phase
+        time.sleep(WORKFLOW_POLL_INTERVAL_SECONDS)
+
+
+@celery_app.task(bind=True, name="research_orchestrator_task")
+def research_orchestrator_task(
+    self,
+    user_id: str,
+    company_name: str,
+    gdrive_folder_id: str,
+    job_id: Optional[str] = None,
+):
+    """
+    Orchestrates the entire research workflow. The research job ID defaults to
+    the orchestrator's task ID; resuming a job passes it explicitly. Progress is
+    tracked in the job state store, and phases that already have a checkpoint
+    are not run again.
+    """
+    job_id = job_id or self.request.id
+    logger.info(
+        f"Starting research orchestration for company: {company_name}, user: {user_id}"
+    )
+
+    try:
+        job = get_job(job_id)
+        if job is None:
+            create_job(job_id, user_id, company_name, gdrive_folder_id)
+            job = get_job(job_id)
+
+        checkpoints = get_checkpoints(job_id)
+        if checkpoints:
+            logger.info(
+                f"Research job {job_id}: resuming, skipping checkpointed phases {sorted(checkpoints)}"
+            )
+        for phase in checkpoints:
+            set_phase_state(job_id, phase, SUCCESS)
+        for phase in RESEARCH_PHASES:
+            prerequisites = [
+                prerequisite
+                for prerequisite, dependents in PHASE_DEPENDENTS.items()
+                if phase in dependents
+            ]
+            if phase not in checkpoints and all(p in checkpoints for p in prerequisites):
+                set_phase_state(job_id, phase, PROGRESS)
+
+        build_research_workflow(
+            job_id,
+            user_id,
+            company_name,
+            gdrive_folder_id,
+            checkpoints,
+            force_refresh=job.get("force_refresh") == "1",
+        ).apply_async()
+
+        if ORCHESTRATION_MODE != "blocking":
+            logger.info(f"Research job {job_id} dispatched in event-driven mode.")
+            return {
+                "status": "DISPATCHED",
+                "message": "Research workflow dispatched.",
+                "job_id": job_id,
+            }
+
+        job = _wait_for_job(self, job_id)
+        if job["status"] == FAILURE:
+            raise RuntimeError(job.get("error", "Research workflow failed"))
+
+        result_link = job.get("result_link") or _result_link(gdrive_folder_id)
         self.update_state(
             state="SUCCESS",
             meta={
@@ -122,9 +433,6 @@ def research_orchestrator_task(
                 "result_link": result_link,
             },
         )
-        logger.info(
-            f"Research orchestration completed successfully for company: {company_name}. Google Drive link: {result_link}"
-        )
         return {
             "status": "SUCCESS",
             "message": "Research workflow completed successfully.",
@@ -136,6 +444,7 @@ def research_orchestrator_task(
             f"Research orchestration failed for company: {company_name}, error: {e}",
             exc_info=True,
         )
+        _finish_job(job_id, FAILURE, error=str(e))
         self.update_state(
             state="FAILURE",
             meta={"current_phase": "Research workflow failed", "error": str(e)},
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import fakeredis
+import httpx
+import pytest
+
+# The backend modules import each other from the backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import redis_client  # noqa: E402
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    """An in-memory Redis (with Lua scripting) behind get_redis()."""
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis_client, "_redis_client", client)
+    return client
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """
+    Answers every page download (see download_capped) with the response
+    given to serve(), which returns the list of requests received.
+    """
+    from services import content_extraction_service
+
+    requests: list[httpx.Request] = []
+
+    def serve(status_code: int, content=b"", content_type: str = "text/html", headers=None):
+        def respond(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            response_headers = {"content-type": content_type, **(headers or {})}
+            return httpx.Response(status_code, content=content, headers=response_headers)
+
+        client = httpx.Client(transport=httpx.MockTransport(respond))
+        monkeypatch.setattr(content_extraction_service, "get_http_client", lambda: client)
+        return requests
+
+    return serve
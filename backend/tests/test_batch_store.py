@@ -0,0 +1,30 @@
+from db.batch_store import (
+    claim_batch_slots,
+    create_batch,
+    release_batch_slot,
+    requeue_batch_job,
+)
+
+
+def test_claim_batch_slots_respects_concurrency_cap(redis):
+    create_batch("batch-1", "user-1", "folder-1", ["job-1", "job-2", "job-3"], 2)
+
+    assert claim_batch_slots("batch-1") == ["job-1", "job-2"]
+    assert claim_batch_slots("batch-1") == []
+
+    release_batch_slot("batch-1")
+    assert claim_batch_slots("batch-1") == ["job-3"]
+
+
+def test_requeued_job_waits_for_a_free_slot(redis):
+    create_batch("batch-1", "user-1", "folder-1", ["job-1", "job-2", "job-3"], 2)
+    assert claim_batch_slots("batch-1") == ["job-1", "job-2"]
+
+    # job-1 fails and is resumed while both slots are taken
+    release_batch_slot("batch-1")
+    assert claim_batch_slots("batch-1") == ["job-3"]
+    requeue_batch_job("batch-1", "job-1")
+    assert claim_batch_slots("batch-1") == []
+
+    release_batch_slot("batch-1")
+    assert claim_batch_slots("batch-1") == ["job-1"]
@@ -0,0 +1,103 @@
+import pytest
+
+from services import content_cache, content_extraction_service
+from services.content_cache import ContentCache, cache_key, freshness_lifetime
+from services.content_extraction_service import DownloadedPage, download_page
+
+
+@pytest.mark.parametrize(
+    "cache_control, lifetime",
+    [
+        (None, 3600),
+        ("public", 3600),
+        ("max-age=600", 600),
+        ('private, max-age="600"', 600),
+        ("max-age=86400", 3600),  # Never longer than the default
+        ("max-age=soon", 3600),
+        ("no-cache, max-age=600", 0),
+        ("No-Store", None),
+    ],
+)
+def test_freshness_lifetime(cache_control, lifetime):
+    assert freshness_lifetime(cache_control, 3600) == lifetime
+
+
+@pytest.mark.parametrize(
+    "url, key",
+    [
+        ("HTTPS://Acme.Example/About", "https://acme.example/About"),
+        ("https://acme.example:443/about#team", "https://acme.example/about"),
+        ("http://acme.example:80", "http://acme.example/"),
+        ("https://acme.example:8443/about?page=2", "https://acme.example:8443/about?page=2"),
+        ("  https://acme.example/about  ", "https://acme.example/about"),
+    ],
+)
+def test_cache_key(url, key):
+    assert cache_key(url) == key
+
+
+def test_page_variants_share_a_cache_entry(redis, tmp_path):
+    cache = ContentCache(path=str(tmp_path / "cache.sqlite3"))
+
+    cache.put("https://Acme.Example:443/about#team", "<p>About</p>", "About", etag='"v1"')
+
+    page = cache.get("https://acme.example/about")
+    assert (page.html, page.text, page.is_fresh) == ("<p>About</p>", "About", True)
+    assert page.conditional_headers() == {"If-None-Match": '"v1"'}
+
+
+def test_no_store_pages_are_not_cached(redis, tmp_path):
+    cache = ContentCache(path=str(tmp_path / "cache.sqlite3"))
+
+    cache.put("https://acme.example/about", "<p>About</p>", "About", cache_control="no-store")
+
+    assert cache.get("https://acme.example/about") is None
+
+
+def test_least_recently_accessed_page_is_evicted(redis, tmp_path, monkeypatch):
+    clock = iter(range(1_000_000, 2_000_000))
+    monkeypatch.setattr(content_cache.time, "time", lambda: next(clock))
+    cache = ContentCache(path=str(tmp_path / "cache.sqlite3"))
+    cache.put("https://acme.example/a", "a" * 1000, "a" * 1000)
+    (page_size,) = cache._connection().execute("SELECT size FROM pages").fetchone()
+    cache.max_bytes = int(page_size * 2.5)  # Room for two pages
+
+    cache.put("https://acme.example/b", "b" * 1000, "b" * 1000)
+    cache.get("https://acme.example/a")
+    cache.put("https://acme.example/c", "c" * 1000, "c" * 1000)
+
+    assert cache.get("https://acme.example/b") is None
+    assert cache.get("https://acme.example/a") is not None
+    assert cache.get("https://acme.example/c") is not None
+    assert redis.hget("metrics:counters", "content_cache.evictions") == "1"
+
+
+def test_stale_page_is_revalidated_and_reused_on_304(redis, tmp_path, serve, monkeypatch):
+    cache = ContentCache(path=str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(content_extraction_service, "get_content_cache", lambda: cache)
+    cache.put(
+        "https://acme.example/about",
+        "<p>About</p>",
+        "About",
+        etag='"v1"',
+        last_modified="Mon, 12 Oct 2026 08:00:00 GMT",
+        cache_control="no-cache",  # Stale at once
+    )
+    requests = serve(304, headers={"cache-control": "max-age=600"})
+
+    page = download_page("https://acme.example/about")
+
+    assert page == DownloadedPage(cached_text="About")
+    assert requests[0].headers["If-None-Match"] == '"v1"'
+    assert requests[0].headers["If-Modified-Since"] == "Mon, 12 Oct 2026 08:00:00 GMT"
+    assert redis.hget("metrics:counters", "content_cache.revalidated") == "1"
+    assert cache.get("https://acme.example/about").is_fresh
+
+
+def test_304_without_a_cached_page_is_a_failed_download(redis, tmp_path, serve, monkeypatch):
+    cache = ContentCache(path=str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(content_extraction_service, "get_content_cache", lambda: cache)
+    serve(304)
+
+    assert download_page("https://acme.example/about") is None
+    assert redis.hget("metrics:counters", "content_cache.misses") is None
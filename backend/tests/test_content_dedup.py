@@ -0,0 +1,69 @@
+import pytest
+
+from services.content_dedup import (
+    find_near_duplicates,
+    find_url_duplicates,
+    hamming_distance,
+    normalize_url,
+    simhash,
+)
+
+ARTICLE = " ".join(
+    f"Acme announced its quarterly results on day {index}, with revenue from rocket "
+    "launches growing across every region it serves."
+    for index in range(10)
+)
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://acme.example/news/",
+        "http://www.acme.example/news",
+        "https://ACME.example:443/news#latest",
+        "https://acme.example//news?utm_source=newsletter&gclid=abc",
+    ],
+)
+def test_normalize_url_ignores_page_variants(url):
+    assert normalize_url(url) == "acme.example/news"
+
+
+def test_normalize_url_keeps_content_parameters_in_order():
+    assert normalize_url("https://acme.example/search?q=rockets&page=2&ref=home") == (
+        "acme.example/search?page=2&q=rockets"
+    )
+
+
+def test_normalize_url_keeps_non_default_ports():
+    assert normalize_url("https://acme.example:8443/news") == "acme.example:8443/news"
+
+
+def test_find_url_duplicates_points_at_the_first_variant():
+    urls = [
+        "https://acme.example/news",
+        "https://acme.example/about",
+        "http://www.acme.example/news/",
+    ]
+
+    assert find_url_duplicates(urls) == [None, None, 0]
+
+
+def test_simhash_of_short_text_is_none():
+    assert simhash("Too short to fingerprint.") is None
+
+
+def test_simhash_of_near_identical_texts_is_close():
+    syndicated = ARTICLE.replace("day 3,", "day three,")
+
+    assert hamming_distance(simhash(ARTICLE), simhash(syndicated)) <= 3
+    assert hamming_distance(simhash(ARTICLE), simhash(ARTICLE.upper())) == 0
+
+
+def test_find_near_duplicates_skips_missing_and_unrelated_texts():
+    unrelated = " ".join(
+        f"Globex hires {index} engineers to build a new factory for solar panels in Spain."
+        for index in range(10)
+    )
+    texts = [ARTICLE, None, unrelated, ARTICLE.replace("day 3,", "day three,"), "Short."]
+
+    assert find_near_duplicates(texts) == [None, None, None, 0, None]
@@ -0,0 +1,79 @@
+import pytest
+
+from services import content_extraction_service
+from services.content_extraction_service import DownloadSkipped, download_capped, sniff_content_type
+
+
+@pytest.mark.parametrize(
+    "head, content_type",
+    [
+        (b"%PDF-1.7\n", "application/pdf"),
+        (b"\x89PNG\r\n\x1a\n", "image/png"),
+        (b"  <!DOCTYPE html><html>", "text/html"),
+        (b"<div>text</div><body>", "text/html"),
+        (b"\x00\x01\x02binary", "application/octet-stream"),
+        (b"User-agent: *\nDisallow:\n", "text/plain"),
+    ],
+)
+def test_sniff_content_type(head, content_type):
+    assert sniff_content_type(head) == content_type
+
+
+def test_download_returns_the_decoded_page(redis, serve):
+    serve(200, b"<p>Acme</p>")
+
+    response, html = download_capped("https://acme.example", timeout=5)
+
+    assert (response.status_code, html) == (200, "<p>Acme</p>")
+
+
+def test_download_of_error_status_has_no_body(redis, serve):
+    serve(404, b"<p>Not found</p>")
+
+    response, html = download_capped("https://acme.example", timeout=5)
+
+    assert (response.status_code, html) == (404, "")
+
+
+def test_download_rejects_declared_content_type(redis, serve):
+    serve(200, b"%PDF-", "application/pdf")
+
+    with pytest.raises(DownloadSkipped) as skipped:
+        download_capped("https://acme.example/report.pdf", timeout=5)
+    assert skipped.value.reason == "content_type"
+
+
+def test_download_sniffs_generic_content_type(redis, serve):
+    serve(200, b"%PDF-1.7 ...", "application/octet-stream")
+
+    with pytest.raises(DownloadSkipped) as skipped:
+        download_capped("https://acme.example/download", timeout=5)
+    assert skipped.value.reason == "content_type"
+
+
+def test_download_rejects_declared_length_over_the_cap(redis, serve, monkeypatch):
+    monkeypatch.setattr(content_extraction_service, "EXTRACTION_MAX_BYTES", 100)
+    serve(200, b"x" * 101, "text/plain")
+
+    with pytest.raises(DownloadSkipped) as skipped:
+        download_capped("https://acme.example", timeout=5)
+    assert skipped.value.reason == "too_large"
+
+
+def test_download_is_aborted_once_the_body_exceeds_the_cap(redis, serve, monkeypatch):
+    monkeypatch.setattr(content_extraction_service, "EXTRACTION_MAX_BYTES", 100)
+    sent = []
+
+    def body():
+        for _ in range(1000):
+            sent.append(1)
+            yield b"x" * 40
+
+    # No Content-Length: the cap is only noticed while streaming
+    serve(200, body(), "text/plain")
+
+    with pytest.raises(DownloadSkipped) as skipped:
+        download_capped("https://acme.example", timeout=5)
+    assert skipped.value.reason == "too_large"
+    assert len(sent) < 10
+    assert redis.hget("metrics:counters", "content_fetch.skipped.too_large") == "1"
@@ -0,0 +1,54 @@
+import pytest
+
+from core import metrics
+from services import content_extraction_service
+from services.crawl_scheduler import CrawlScheduler
+
+
+def test_robots_txt_rules_and_crawl_delay_apply(redis, serve):
+    serve(200, b"User-agent: *\nDisallow: /private\nCrawl-delay: 2\n", "text/plain")
+
+    policy = CrawlScheduler().policy("https://acme.example")
+
+    assert policy.delay == 2
+    assert policy.allows("https://acme.example/about")
+    assert not policy.allows("https://acme.example/private/page")
+
+
+def test_missing_robots_txt_allows_everything(redis, serve):
+    serve(404, b"<html>Not found</html>", "text/html")
+
+    assert CrawlScheduler().policy("https://acme.example").allows("https://acme.example/private")
+
+
+def test_failing_robots_txt_disallows_everything_for_a_while(redis, serve):
+    serve(503)
+
+    policy = CrawlScheduler().policy("https://acme.example")
+
+    assert not policy.allows("https://acme.example/about")
+    assert redis.ttl("crawl:robots:https://acme.example") <= 300
+
+
+def test_oversized_robots_txt_is_not_downloaded(redis, serve, monkeypatch):
+    monkeypatch.setattr(content_extraction_service, "EXTRACTION_MAX_BYTES", 100)
+    serve(200, b"User-agent: *\nDisallow: /\n" + b"#" * 1000, "text/plain")
+
+    assert CrawlScheduler().policy("https://acme.example").allows("https://acme.example/about")
+    assert redis.hget("metrics:counters", "content_fetch.skipped.too_large") == "1"
+
+
+def test_waits_are_ranked_for_the_slowest_hosts_only(redis, monkeypatch):
+    monkeypatch.setattr("services.crawl_scheduler.CRAWL_METRICS_TOP_HOSTS", 2)
+    scheduler = CrawlScheduler()
+
+    for host in ("a.example", "b.example", "c.example"):
+        for _ in range(3):
+            scheduler.reserve(f"https://{host}", 1.0)
+
+    assert metrics.get_counters("crawl_scheduler.") == {
+        "crawl_scheduler.requests": 9.0,
+        "crawl_scheduler.wait_seconds": pytest.approx(9.0, abs=0.1),
+        "crawl_scheduler.waited_requests": 6.0,
+    }
+    assert len(metrics.get_ranking("crawl_wait_seconds")) == 2
@@ -0,0 +1,26 @@
+from services.gemini_hedging import GeminiHedger
+
+
+class FakeRateLimiter:
+    """Refuses the first `refusals` reservations, then grants them."""
+
+    enabled = True
+
+    def __init__(self, refusals: int):
+        self.refusals = refusals
+
+    def try_acquire(self, model_name: str, tokens: int) -> float:
+        if self.refusals:
+            self.refusals -= 1
+            return 1.0
+        return 0.0
+
+
+def test_hedges_refused_by_the_rate_limiter_do_not_use_up_the_job_cap(redis):
+    hedger = GeminiHedger(FakeRateLimiter(refusals=5), enabled=True, max_per_job=2)
+
+    claims = [hedger._claim_hedge("model", 100, "job-1", "deep_dive") for _ in range(8)]
+
+    assert claims == [False] * 5 + [True, True, False]
+    assert redis.hget("metrics:counters", "gemini_hedging.rate_limited.model") == "5"
+    assert redis.hget("metrics:counters", "gemini_hedging.hedged.model") == "2"
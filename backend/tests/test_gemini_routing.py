@@ -0,0 +1,33 @@
+from services import gemini_service
+from services.gemini_backends import StubGenerativeModel
+from services.gemini_routing import model_candidates
+from services.gemini_service import GeminiService
+
+ROUTE = {"model": "slow-model", "fallback_model": "fast-model", "latency_budget_seconds": 0.05}
+
+
+def test_model_candidates_without_fallback_run_unbounded():
+    assert model_candidates({"model": "slow-model"}) == [("slow-model", None)]
+
+
+def test_model_candidates_bound_the_model_with_a_fallback():
+    assert model_candidates(ROUTE) == [("slow-model", 0.05), ("fast-model", None)]
+
+
+def test_fallback_response_is_cached_under_the_routed_model(redis, monkeypatch):
+    monkeypatch.setattr(gemini_service, "get_model_route", lambda task_name: ROUTE)
+    service = GeminiService(backend="stub")
+    service._models["slow-model"] = StubGenerativeModel("slow-model", latency="fixed:1")
+    service._models["fast-model"] = StubGenerativeModel("fast-model", latency="fixed:0")
+    reconciled = []
+    monkeypatch.setattr(
+        service.rate_limiter, "reconcile", lambda *args: reconciled.append(args)
+    )
+
+    response = service.generate_content("Write a report", task_name="report_task")
+
+    assert service.cache.get("slow-model", "Write a report") == response
+    assert service.generate_content("Write a report", task_name="report_task") == response
+    # The abandoned call on the routed model gives its whole reservation back
+    assert reconciled[0][0] == "slow-model"
+    assert reconciled[0][2] == 0
@@ -0,0 +1,100 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from db.job_store import append_artifact, artifact_key, get_artifact
+from services import gemini_service
+from services.gemini_backends import StubGenerativeModel
+from services.gemini_routing import GEMINI_DEFAULT_MODEL
+from services.gemini_service import GeminiService
+
+
+class CountingModel:
+    """Streams `chunk_count` chunks, recording how many were produced and whether it was closed."""
+
+    def __init__(self, chunk_count: int):
+        self.chunk_count = chunk_count
+        self.produced = 0
+        self.closed = False
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        model = self
+
+        class Response:
+            usage_metadata = None
+
+            async def __aiter__(self):
+                try:
+                    for index in range(model.chunk_count):
+                        model.produced += 1
+                        yield SimpleNamespace(text=f"chunk {index} ")
+                        await asyncio.sleep(0)
+                finally:
+                    model.closed = True
+
+        return Response()
+
+
+@pytest.fixture
+def service(redis):
+    service = GeminiService(backend="stub")
+    service._models[GEMINI_DEFAULT_MODEL] = StubGenerativeModel(
+        GEMINI_DEFAULT_MODEL, latency="fixed:0.05"
+    )
+    return service
+
+
+def _wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_streamed_report_is_cached_from_its_artifact(service):
+    key = artifact_key("job-1", "competitor_analysis")
+
+    for chunk in service.stream_content(
+        "Write a report", job_id="job-1", phase="competitor_analysis", cache_source_key=key
+    ):
+        append_artifact("job-1", "competitor_analysis", chunk)
+
+    report = get_artifact("job-1", "competitor_analysis")
+    assert report.startswith("Stub report for load testing.")
+    assert service.cache.get(GEMINI_DEFAULT_MODEL, "Write a report") == report
+
+
+def test_streamed_response_without_source_key_is_not_cached(service):
+    chunks = list(service.stream_content("Write a report"))
+
+    assert len(chunks) > 1
+    assert service.cache.get(GEMINI_DEFAULT_MODEL, "Write a report") is None
+
+
+def test_slow_consumer_pauses_the_stream(service, monkeypatch):
+    monkeypatch.setattr(gemini_service, "GEMINI_STREAM_BUFFER_CHUNKS", 2)
+    model = CountingModel(chunk_count=50)
+    service._models[GEMINI_DEFAULT_MODEL] = model
+
+    stream = service.stream_content("Write a report")
+    assert next(stream) == "chunk 0 "
+    time.sleep(0.2)
+
+    # The buffer, plus a chunk being handed over, plus the one consumed
+    assert model.produced <= 2 + 3
+    assert [chunk for chunk in stream] == [f"chunk {index} " for index in range(1, 50)]
+
+
+def test_consumer_stopping_early_cancels_the_stream(service, monkeypatch):
+    monkeypatch.setattr(gemini_service, "GEMINI_STREAM_BUFFER_CHUNKS", 2)
+    model = CountingModel(chunk_count=50)
+    service._models[GEMINI_DEFAULT_MODEL] = model
+
+    stream = service.stream_content("Write a report")
+    next(stream)
+    stream.close()
+
+    assert _wait_for(lambda: model.closed)
+    assert model.produced < 50
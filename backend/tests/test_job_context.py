@@ -0,0 +1,98 @@
+from db.job_store import append_artifact, get_artifact, set_job_context_cache
+from services.gemini_service import GeminiService
+from tasks import gemini_tasks, orchestrator
+from tasks.gemini_tasks import JOB_CONTEXT_ARTIFACT, _with_job_context, build_job_context_task
+
+PAGES = [
+    {
+        "url": "https://acme.example",
+        "title": "Acme",
+        "content": "Acme sells rockets.",
+        "status": "success",
+    }
+]
+
+
+def _task_names(signature) -> list:
+    """Flattens a canvas into the task names it runs; a group becomes a nested list."""
+    if signature.task == "celery.group":
+        return [[_task_names(task) for task in signature.tasks]]
+    if signature.task == "celery.chain":
+        return [name for task in signature.tasks for name in _task_names(task)]
+    return [signature.task]
+
+
+def test_small_context_is_stored_for_the_phases_to_inline(redis, monkeypatch):
+    monkeypatch.setattr(gemini_tasks, "get_gemini_service", lambda: GeminiService(backend="stub"))
+    append_artifact("job-1", "deep_dive", "Acme builds rockets.")
+
+    assert build_job_context_task.run(PAGES, "Acme", "job-1") == PAGES
+
+    context = get_artifact("job-1", JOB_CONTEXT_ARTIFACT)
+    assert "## Company Background\n\nAcme builds rockets." in context
+    assert "## Source [S1]: Acme (https://acme.example)\n\nAcme sells rockets." in context
+
+    prompt, cached_context = _with_job_context("Analyse competitors.", "job-1")
+    assert cached_context is None
+    assert context in prompt
+    assert prompt.endswith("Analyse competitors.")
+
+
+def test_cached_context_is_referenced_instead_of_inlined(redis):
+    append_artifact("job-1", JOB_CONTEXT_ARTIFACT, "Acme sells rockets.")
+    set_job_context_cache("job-1", "cachedContents/abc")
+
+    prompt, cached_context = _with_job_context("Analyse competitors.", "job-1")
+
+    assert cached_context == "cachedContents/abc"
+    assert "Acme sells rockets." not in prompt
+
+
+def test_job_without_context_keeps_its_prompt(redis):
+    assert _with_job_context("Analyse competitors.", "job-1") == ("Analyse competitors.", None)
+    assert _with_job_context("Analyse competitors.", None) == ("Analyse competitors.", None)
+
+
+def test_report_phases_run_on_the_shared_context(monkeypatch):
+    monkeypatch.setattr(orchestrator, "RESEARCH_SHARED_CONTEXT", True)
+
+    workflow = orchestrator.build_research_workflow("job-1", "user-1", "Acme", "folder-1")
+
+    assert [_task_names(task) for task in workflow.tasks] == [
+        [
+            "prospect_deep_dive_task",
+            "extract_deep_dive_sources_task",
+            "build_job_context_task",
+            [
+                ["synthesize_sources_task"],
+                ["prospect_competitor_analysis_task"],
+                ["own_competitor_marketing_analysis_task"],
+            ],
+        ]
+    ]
+
+
+def test_resumed_report_phases_build_the_context_from_the_checkpoint(monkeypatch):
+    monkeypatch.setattr(orchestrator, "RESEARCH_SHARED_CONTEXT", True)
+    checkpoints = {"deep_dive": {}, "content_extraction": PAGES, "synthesis": {}}
+
+    workflow = orchestrator.build_research_workflow(
+        "job-1", "user-1", "Acme", "folder-1", checkpoints=checkpoints
+    )
+
+    (branch,) = workflow.tasks
+    assert branch.tasks[0].task == "build_job_context_task"
+    assert branch.tasks[0].args[0] == PAGES
+    assert branch.tasks[0].immutable
+
+
+def test_report_phases_without_shared_context_run_alongside_the_deep_dive(monkeypatch):
+    monkeypatch.setattr(orchestrator, "RESEARCH_SHARED_CONTEXT", False)
+
+    workflow = orchestrator.build_research_workflow("job-1", "user-1", "Acme", "folder-1")
+
+    assert [_task_names(task) for task in workflow.tasks] == [
+        ["prospect_competitor_analysis_task"],
+        ["own_competitor_marketing_analysis_task"],
+        ["prospect_deep_dive_task", "extract_deep_dive_sources_task", "synthesize_sources_task"],
+    ]
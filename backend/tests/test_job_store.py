@@ -0,0 +1,59 @@
+from db.job_store import (
+    FAILURE,
+    JOB_STATE_TTL_SECONDS,
+    PENDING,
+    PROGRESS,
+    SUCCESS,
+    create_job,
+    finish_job,
+    get_job,
+    set_phase_state,
+)
+
+
+def test_set_phase_state_moves_job_to_progress(redis):
+    create_job("job-1", "user-1", "Acme", "folder-1")
+
+    set_phase_state("job-1", "deep_dive", PROGRESS)
+
+    job = get_job("job-1")
+    assert job["status"] == PROGRESS
+    assert job["phases"]["deep_dive"] == PROGRESS
+    assert job["phases"]["competitor_analysis"] == PENDING
+    assert "started_at" in job
+
+
+def test_late_phase_callback_does_not_reopen_finished_job(redis):
+    create_job("job-1", "user-1", "Acme", "folder-1")
+    assert finish_job("job-1", FAILURE, error="deep_dive failed")
+
+    set_phase_state("job-1", "competitor_analysis", SUCCESS)
+
+    job = get_job("job-1")
+    assert job["status"] == FAILURE
+    assert job["phases"]["competitor_analysis"] == SUCCESS
+
+
+def test_set_phase_state_does_not_recreate_expired_job(redis):
+    set_phase_state("job-1", "deep_dive", SUCCESS)
+
+    assert get_job("job-1") is None
+
+
+def test_only_first_finish_wins(redis):
+    create_job("job-1", "user-1", "Acme", "folder-1")
+
+    assert finish_job("job-1", SUCCESS, result_link="https://drive.example/folder-1")
+    assert not finish_job("job-1", FAILURE, error="too late")
+
+    job = get_job("job-1")
+    assert job["status"] == SUCCESS
+    assert job["result_link"] == "https://drive.example/folder-1"
+    assert "error" not in job
+
+
+def test_finish_job_sets_ttl_on_expired_job(redis):
+    assert finish_job("job-1", FAILURE, error="boom")
+
+    ttl = redis.ttl("research:job:job-1")
+    assert 0 < ttl <= JOB_STATE_TTL_SECONDS
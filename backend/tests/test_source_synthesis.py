@@ -0,0 +1,99 @@
+import pytest
+
+from services import source_synthesis
+from services.gemini_rate_limiter import estimate_tokens
+from services.source_synthesis import _group_for_reduce, chunk_markdown, synthesize_sources
+
+
+class FakeGeminiService:
+    """Answers map prompts with a summary and merge prompts with `merge_response`."""
+
+    def __init__(self, merge_response: str = "Merged notes [S1]."):
+        self.merge_response = merge_response
+        self.merge_calls = 0
+
+    def generate_many_sync(self, prompts, **kwargs):
+        if kwargs.get("task_name", "").endswith(source_synthesis.MAP_TASK_SUFFIX):
+            return ["Acme sells rockets [S1]. " * 50 for _ in prompts]
+        self.merge_calls += 1
+        return [self.merge_response for _ in prompts]
+
+    def generate_content(self, prompt, **kwargs):
+        return "Brief [S1]."
+
+
+def _pages(count: int) -> list[dict]:
+    return [
+        {
+            "url": f"https://acme.example/{index}",
+            "title": f"Page {index}",
+            "content": f"Acme page {index}.",
+            "status": "success",
+        }
+        for index in range(count)
+    ]
+
+
+def test_chunk_markdown_packs_paragraphs_within_budget():
+    text = "\n\n".join(f"Paragraph {index} " + "word " * 30 for index in range(20))
+
+    chunks = chunk_markdown(text, max_tokens=100)
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+    paragraphs = [paragraph for chunk in chunks for paragraph in chunk.split("\n\n")]
+    assert paragraphs == [paragraph.strip() for paragraph in text.split("\n\n")]
+
+
+def test_chunk_markdown_cuts_oversized_lines():
+    chunks = chunk_markdown("x" * 1000, max_tokens=50)
+
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert "".join(chunks) == "x" * 1000
+
+
+def test_chunk_markdown_skips_blank_paragraphs():
+    assert chunk_markdown("\n\n  \n\n") == []
+
+
+def test_group_for_reduce_packs_consecutive_summaries():
+    summaries = ["a" * 400, "b" * 400, "c" * 400]  # 101 tokens each
+
+    groups = _group_for_reduce(summaries, max_tokens=250)
+
+    assert groups == [["a" * 400, "b" * 400], ["c" * 400]]
+
+
+def test_group_for_reduce_of_nothing_is_empty():
+    assert _group_for_reduce([], max_tokens=100) == []
+
+
+def test_synthesize_sources_merges_in_levels(monkeypatch):
+    service = FakeGeminiService()
+    monkeypatch.setattr(source_synthesis, "get_gemini_service", lambda: service)
+    monkeypatch.setattr(source_synthesis, "SYNTHESIS_REDUCE_INPUT_TOKENS", 600)
+
+    brief, sources = synthesize_sources("Acme", _pages(6), task_name="synthesize_sources_task")
+
+    assert service.merge_calls >= 1
+    assert brief.startswith("Brief [S1].")
+    assert "[S6] Page 5: https://acme.example/5" in brief
+    assert [source["id"] for source in sources] == [f"S{index}" for index in range(1, 7)]
+
+
+def test_synthesize_sources_stops_when_merges_come_back_empty(monkeypatch):
+    service = FakeGeminiService(merge_response="")
+    monkeypatch.setattr(source_synthesis, "get_gemini_service", lambda: service)
+    monkeypatch.setattr(source_synthesis, "SYNTHESIS_REDUCE_INPUT_TOKENS", 600)
+
+    with pytest.raises(ValueError, match="came back empty"):
+        synthesize_sources("Acme", _pages(6), task_name="synthesize_sources_task")
+    assert service.merge_calls == 1
+
+
+def test_synthesize_sources_without_usable_pages(monkeypatch):
+    monkeypatch.setattr(source_synthesis, "get_gemini_service", FakeGeminiService)
+
+    failed_page = {"url": "https://acme.example", "status": "failed"}
+
+    assert synthesize_sources("Acme", [failed_page]) == ("", [])
@@ -0,0 +1,43 @@
+import pytest
+from pydantic import BaseModel
+
+from services.gemini_service import GeminiSchemaError, parse_json_response, response_schema
+from tasks.gemini_tasks import DeepDiveResult
+
+
+class Report(BaseModel):
+    overview: str
+    source_urls: list[str] = []
+
+
+def test_parse_json_response_accepts_valid_json(redis):
+    text = '{"overview": "Acme", "source_urls": ["https://acme.example"]}'
+
+    result = parse_json_response(text, Report)
+
+    assert result == Report(overview="Acme", source_urls=["https://acme.example"])
+
+
+def test_parse_json_response_repairs_fenced_json(redis):
+    text = 'Here you go:\n```json\n{"overview": "Acme"}\n```\nAnything else?'
+
+    assert parse_json_response(text, Report) == Report(overview="Acme")
+    assert redis.hget("metrics:counters", "gemini_structured_output.repaired") == "1"
+
+
+def test_parse_json_response_rejects_schema_mismatch(redis):
+    with pytest.raises(GeminiSchemaError, match="Report"):
+        parse_json_response('{"summary": "Acme"}', Report)
+    assert redis.hget("metrics:counters", "gemini_structured_output.invalid") == "1"
+
+
+def test_response_schema_keeps_only_gemini_keywords():
+    assert response_schema(DeepDiveResult) == {
+        "type": "OBJECT",
+        "description": "Response schema of the prospect deep dive.",
+        "properties": {
+            "overview": {"type": "STRING"},
+            "source_urls": {"type": "ARRAY", "items": {"type": "STRING"}},
+        },
+        "required": ["overview"],
+    }